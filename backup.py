@@ -0,0 +1,350 @@
+"""Инкрементальные резервные копии данных бота.
+
+Каждый файл режется на куски, кусок хранится один раз под своим SHA-256
+(сжатый zlib) в backups/chunks, а снимок - это JSON-манифест со списком
+кусков каждого файла. Неизменившиеся части файлов между снимками не
+дублируются. Старые манифесты удаляются по числу хранимых копий, а куски,
+на которые больше никто не ссылается, вычищаются. Создание снимка и очистка
+идут под блокировкой backups/backup.lock, поэтому очистка из командной строки
+не удалит куски манифеста, который бот в это время записывает.
+
+Использование:
+    python backup.py create
+    python backup.py list
+    python backup.py verify [ID]
+    python backup.py restore [ID] [каталог]
+    python backup.py prune
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import zlib
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from file_lock import InterProcessLock
+from ledger import SEGMENT_SUFFIX
+
+# JSON-файлы режутся по строкам: граница куска зависит от содержимого, поэтому
+# вставка записи в середину файла не сдвигает все следующие куски
+LINE_CHUNK_MASK = 0x3F           # в среднем граница раз в 64 строки
+MAX_LINE_CHUNK = 256 * 1024
+# SQLite меняет страницы на месте, поэтому куски выровнены по страницам
+DB_CHUNK_SIZE = 64 * 1024
+
+SNAPSHOT_ATTEMPTS = 5
+
+
+class BackupError(Exception):
+    """Ошибка создания, проверки или восстановления копии"""
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _line_chunks(data: bytes) -> List[bytes]:
+    chunks, current, size = [], [], 0
+    for line in data.splitlines(keepends=True):
+        current.append(line)
+        size += len(line)
+        if (zlib.crc32(line) & LINE_CHUNK_MASK) == 0 or size >= MAX_LINE_CHUNK:
+            chunks.append(b''.join(current))
+            current, size = [], 0
+    if current:
+        chunks.append(b''.join(current))
+    return chunks
+
+
+def _fixed_chunks(data: bytes) -> List[bytes]:
+    return [data[i:i + DB_CHUNK_SIZE] for i in range(0, len(data), DB_CHUNK_SIZE)]
+
+
+def _atomic_write(path: str, data: bytes):
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+class BackupStore:
+    """Хранилище копий: куски по содержимому и манифесты снимков"""
+
+    def __init__(self, backup_dir: str = 'backups', keep: int = 28):
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.chunks_dir = os.path.join(backup_dir, 'chunks')
+        self.manifests_dir = os.path.join(backup_dir, 'manifests')
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        self._lock = InterProcessLock(os.path.join(backup_dir, 'backup.lock'))
+
+    # --- Снимок ---
+
+    def create(self, json_files: List[str] = (), sqlite_files: List[str] = (),
+               segment_files=(), storage_lock=None) -> Optional[str]:
+        """Снимок файлов; возвращает ID манифеста (None, если ничего не изменилось).
+
+        Сегменты истории (ledger.py) не меняются после записи и хранятся под
+        относительным путем, чтобы восстановиться в свой каталог.
+
+        storage_lock - блокировка, под которой пишутся JSON-файлы (bot.storage_lock).
+        Под ней читаются JSON-файлы и сегменты: запись бота может заменить
+        несколько файлов подряд, а перенос истории убирает записи из JSON в
+        новый сегмент. segment_files может быть функцией, возвращающей список:
+        тогда список берется под той же блокировкой.
+        """
+        with self._lock:
+            with storage_lock if storage_lock is not None else nullcontext():
+                contents = self._snapshot_json(json_files, retry=storage_lock is None)
+                if callable(segment_files):
+                    segment_files = segment_files()
+                for path in segment_files:
+                    with open(path, 'rb') as f:
+                        contents[os.path.relpath(path).replace(os.sep, '/')] = (f.read(), _fixed_chunks)
+            for path in sqlite_files:
+                data = self._snapshot_sqlite(path)
+                if data is not None:
+                    contents[os.path.basename(path)] = (data, _fixed_chunks)
+            return self._write_snapshot(contents)
+
+    def _write_snapshot(self, contents: Dict) -> Optional[str]:
+        files = {}
+        for name, (data, splitter) in contents.items():
+            chunks = [self._put_chunk(chunk) for chunk in splitter(data)]
+            files[name] = {'size': len(data), 'sha256': _sha256(data), 'chunks': chunks}
+
+        latest = self.latest()
+        if latest is not None and self.load_manifest(latest)['files'] == files:
+            logging.info("💾 Резервная копия не нужна: данные не изменились с %s", latest)
+            return None
+
+        manifest_id = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+        manifest = {'id': manifest_id, 'created': datetime.now().isoformat(timespec='seconds'),
+                    'files': files}
+        _atomic_write(self._manifest_path(manifest_id),
+                      json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+        logging.info("💾 Резервная копия %s: файлов %s", manifest_id, len(files))
+        return manifest_id
+
+    def _snapshot_json(self, paths, retry: bool = True) -> Dict:
+        """Чтение JSON-файлов одним набором.
+
+        Запись в файлы атомарная (tmp + os.replace), поэтому каждый файл
+        читается целиком в одной версии. Без блокировки хранилища (retry)
+        набор перечитывается, если за время чтения какой-то файл заменили;
+        это не ловит запись, которая заменяет файлы по очереди до и после
+        чтения, поэтому бот читает их под storage_lock.
+        """
+        for _ in range(SNAPSHOT_ATTEMPTS if retry else 1):
+            before = {path: self._stat_key(path) for path in paths}
+            contents = {}
+            for path in paths:
+                if before[path] is None:
+                    continue
+                with open(path, 'rb') as f:
+                    contents[os.path.basename(path)] = (f.read(), _line_chunks)
+            if not retry or all(self._stat_key(path) == before[path] for path in paths):
+                return contents
+        logging.warning("⚠️ Файлы менялись во время резервного копирования, снимок может быть несогласованным")
+        return contents
+
+    @staticmethod
+    def _stat_key(path: str):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    @staticmethod
+    def _snapshot_sqlite(path: str) -> Optional[bytes]:
+        """Копия базы через backup API SQLite (согласованная, писатели не ждут)"""
+        if not os.path.exists(path):
+            return None
+        fd, tmp_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        try:
+            source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            target = sqlite3.connect(tmp_path)
+            try:
+                source.backup(target, pages=256)
+            finally:
+                target.close()
+                source.close()
+            with open(tmp_path, 'rb') as f:
+                return f.read()
+        except sqlite3.DatabaseError as e:
+            logging.warning("⚠️ Пропуск базы %s при резервном копировании: %s", path, e)
+            return None
+        finally:
+            os.remove(tmp_path)
+
+    def _chunk_path(self, digest: str) -> str:
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def _put_chunk(self, chunk: bytes) -> str:
+        digest = _sha256(chunk)
+        path = self._chunk_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _atomic_write(path, zlib.compress(chunk, 6))
+        return digest
+
+    # --- Манифесты ---
+
+    def _manifest_path(self, manifest_id: str) -> str:
+        return os.path.join(self.manifests_dir, f"{manifest_id}.json")
+
+    def list(self) -> List[str]:
+        """ID снимков от старых к новым"""
+        return sorted(name[:-5] for name in os.listdir(self.manifests_dir) if name.endswith('.json'))
+
+    def latest(self) -> Optional[str]:
+        manifests = self.list()
+        return manifests[-1] if manifests else None
+
+    def load_manifest(self, manifest_id: str) -> Dict:
+        try:
+            with open(self._manifest_path(manifest_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            raise BackupError(f"Манифест {manifest_id} недоступен: {e}")
+
+    # --- Проверка и восстановление ---
+
+    def _read_file(self, name: str, entry: Dict) -> bytes:
+        parts = []
+        for digest in entry['chunks']:
+            try:
+                with open(self._chunk_path(digest), 'rb') as f:
+                    chunk = zlib.decompress(f.read())
+            except (OSError, zlib.error) as e:
+                raise BackupError(f"{name}: кусок {digest[:12]} поврежден или отсутствует: {e}")
+            if _sha256(chunk) != digest:
+                raise BackupError(f"{name}: контрольная сумма куска {digest[:12]} не совпадает")
+            parts.append(chunk)
+        data = b''.join(parts)
+        if len(data) != entry['size'] or _sha256(data) != entry['sha256']:
+            raise BackupError(f"{name}: контрольная сумма файла не совпадает")
+        return data
+
+    def verify(self, manifest_id: str = None) -> Dict[str, bytes]:
+        """Сборка и проверка всех файлов снимка; возвращает их содержимое"""
+        manifest_id = manifest_id or self.latest()
+        if manifest_id is None:
+            raise BackupError("Резервных копий нет")
+        manifest = self.load_manifest(manifest_id)
+        return {name: self._read_file(name, entry) for name, entry in manifest['files'].items()}
+
+    def restore(self, manifest_id: str = None, target_dir: str = '.',
+                segment_dir: str = 'ledger') -> List[str]:
+        """Восстановление снимка: файлы заменяются только после проверки всех.
+
+        Сегменты истории в segment_dir (относительно target_dir), которых нет
+        в снимке, запечатаны после него: их записи есть и в восстановленных
+        JSON-файлах, поэтому сегменты переносятся в segment_dir.after-<ID>,
+        чтобы записи не учитывались дважды.
+        """
+        manifest_id = manifest_id or self.latest()
+        files = self.verify(manifest_id)
+        os.makedirs(target_dir, exist_ok=True)
+        for name, data in files.items():
+            path = os.path.join(target_dir, *name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _atomic_write(path, data)
+        self._quarantine_segments(files, target_dir, segment_dir, manifest_id)
+        logging.info("♻️ Восстановлено файлов: %s", len(files))
+        return sorted(files)
+
+    @staticmethod
+    def _quarantine_segments(files: Dict, target_dir: str, segment_dir: str, manifest_id: str):
+        directory = os.path.join(target_dir, segment_dir)
+        try:
+            names = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            return
+        prefix = segment_dir.replace(os.sep, '/').rstrip('/')
+        newer = [name for name in names
+                 if name.endswith(SEGMENT_SUFFIX) and f"{prefix}/{name}" not in files]
+        if not newer:
+            return
+        quarantine = os.path.join(target_dir, f"{segment_dir.rstrip(os.sep)}.after-{manifest_id}")
+        os.makedirs(quarantine, exist_ok=True)
+        for name in newer:
+            os.replace(os.path.join(directory, name), os.path.join(quarantine, name))
+        logging.warning("⚠️ Сегменты истории новее снимка перенесены в %s: %s",
+                        quarantine, len(newer))
+
+    # --- Очистка ---
+
+    def prune(self) -> int:
+        """Удаление лишних снимков и кусков без ссылок; возвращает число удаленных кусков"""
+        with self._lock:
+            return self._prune()
+
+    def _prune(self) -> int:
+        manifests = self.list()
+        for manifest_id in manifests[:-self.keep] if self.keep > 0 else []:
+            os.remove(self._manifest_path(manifest_id))
+
+        referenced = set()
+        for manifest_id in self.list():
+            for entry in self.load_manifest(manifest_id)['files'].values():
+                referenced.update(entry['chunks'])
+
+        removed = 0
+        for prefix in os.listdir(self.chunks_dir):
+            prefix_dir = os.path.join(self.chunks_dir, prefix)
+            for digest in os.listdir(prefix_dir):
+                if digest not in referenced:
+                    os.remove(os.path.join(prefix_dir, digest))
+                    removed += 1
+        if removed:
+            logging.info("🧹 Удалено неиспользуемых кусков: %s", removed)
+        return removed
+
+
+def main(argv):
+    from config import config
+    from ledger import Ledger
+
+    json_files = ['objects.json', 'salaries.json', 'materials.json']
+    store = BackupStore(config.BACKUP_DIR, config.BACKUP_KEEP)
+    command = argv[0] if argv else 'list'
+    try:
+        if command == 'create':
+            print(store.create(json_files, [config.DB_PATH], Ledger().segment_paths,
+                               storage_lock=InterProcessLock('storage.lock'))
+                  or "Данные не изменились")
+        elif command == 'list':
+            for manifest_id in store.list():
+                files = store.load_manifest(manifest_id)['files']
+                print(manifest_id, ', '.join(f"{name} ({entry['size']} Б)" for name, entry in files.items()))
+        elif command == 'verify':
+            files = store.verify(argv[1] if len(argv) > 1 else None)
+            print(f"✅ Проверено файлов: {len(files)}")
+        elif command == 'restore':
+            restored = store.restore(argv[1] if len(argv) > 1 else None, argv[2] if len(argv) > 2 else '.')
+            print(f"✅ Восстановлено: {', '.join(restored)}")
+            print("Пересчитайте агрегаты отчетов: python rollups.py rebuild")
+        elif command == 'prune':
+            print(f"Удалено кусков: {store.prune()}")
+        else:
+            print(__doc__)
+            return 2
+    except BackupError as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,155 @@
+"""Замеры производительности.
+
+Запуск:
+    python benchmark.py startup   # время импорта и память модуля google_sheets
+    python benchmark.py filters   # конвертация 10^5 фильтров для Google Sheets
+"""
+import json
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Код, выполняемый в отдельном процессе: замер времени импорта и прироста RSS
+IMPORT_PROBE = """
+import json, resource, sys, time
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = time.perf_counter()
+error = None
+try:
+    for name in sys.argv[1:]:
+        __import__(name)
+except ImportError as e:
+    error = str(e)
+elapsed = time.perf_counter() - started
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'seconds': elapsed, 'rss_kb': after - before, 'error': error}))
+"""
+
+# Модули, которые google_sheets раньше импортировал при загрузке
+EAGER_MODULES = [
+    'gspread', 'pandas', 'google.oauth2.service_account',
+    'googleapiclient.discovery', 'googleapiclient.errors',
+]
+
+
+def probe_import(modules, repeats=5):
+    """Минимальное время и прирост памяти импорта в чистом процессе"""
+    results = []
+    for _ in range(repeats):
+        output = subprocess.run(
+            [sys.executable, '-c', IMPORT_PROBE, *modules],
+            capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output))
+    return min(results, key=lambda r: r['seconds'])
+
+
+def bench_startup():
+    """Сравнение ленивого импорта google_sheets с прежним набором зависимостей"""
+    cases = [
+        ("import google_sheets (ленивый)", ['google_sheets']),
+        ("прежние зависимости при импорте", EAGER_MODULES),
+        ("import main (без запуска GUI)", ['main']),
+    ]
+    print(f"{'Сценарий':40} {'Время, мс':>10} {'RSS, КБ':>10}")
+    for title, modules in cases:
+        result = probe_import(modules)
+        if result['error']:
+            print(f"{title:40} не установлено: {result['error']}")
+            continue
+        print(f"{title:40} {result['seconds'] * 1000:10.1f} {result['rss_kb']:10d}")
+
+
+def legacy_filters_to_sheets_data(filters, user_info=None):
+    """Построчная конвертация в прежнем виде (эталон для сравнения)"""
+    from google_sheets import get_status_icon_and_text
+
+    today = datetime.now().date()
+    sheet_data = []
+    for f in filters:
+        try:
+            expiry_date = datetime.strptime(str(f['expiry_date']), '%Y-%m-%d').date()
+            last_change = datetime.strptime(str(f['last_change']), '%Y-%m-%d').date()
+            days_until_expiry = (expiry_date - today).days
+            icon, status = get_status_icon_and_text(days_until_expiry)
+            sheet_data.append([
+                f['id'], f['filter_type'], f['location'],
+                last_change.strftime('%d.%m.%Y'), expiry_date.strftime('%d.%m.%Y'),
+                days_until_expiry, status, icon, f['lifetime_days'],
+                f.get('created_at', '')[:10] if f.get('created_at') else '',
+                f.get('updated_at', '')[:10] if f.get('updated_at') else '',
+                f['user_id'],
+                user_info.get('username', '') if user_info else '',
+                user_info.get('phone', '') if user_info else '',
+                user_info.get('email', '') if user_info else ''
+            ])
+        except Exception:
+            continue
+    return sheet_data
+
+
+def make_filters(count, seed=1):
+    """Синтетический парк фильтров"""
+    rnd = random.Random(seed)
+    today = datetime.now().date()
+    filters = []
+    for i in range(count):
+        last_change = today - timedelta(days=rnd.randint(0, 400))
+        lifetime = rnd.choice([90, 180, 365])
+        filters.append({
+            'id': i,
+            'filter_type': rnd.choice(['Угольный', 'Механический', 'Осмос']),
+            'location': rnd.choice(['Кухня', 'Ванная', 'Офис']),
+            'last_change': last_change.isoformat(),
+            'expiry_date': (last_change + timedelta(days=lifetime)).isoformat(),
+            'lifetime_days': lifetime,
+            'created_at': '2024-01-01 10:00:00',
+            'updated_at': None,
+            'user_id': rnd.randint(1, 1000),
+        })
+    return filters
+
+
+def timed(func, *args, repeats=3):
+    best = None
+    result = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_filters(count=100_000):
+    """Пакетная конвертация фильтров против построчной"""
+    from google_sheets import filters_to_sheets_data
+
+    filters = make_filters(count)
+    user_info = {'username': '@user', 'phone': '+70000000000', 'email': 'user@example.com'}
+
+    legacy_time, legacy_rows = timed(legacy_filters_to_sheets_data, filters, user_info)
+    cold_time, rows = timed(lambda: filters_to_sheets_data(filters, user_info, {}))
+    cache = {}
+    filters_to_sheets_data(filters, user_info, cache)
+    warm_time, warm_rows = timed(filters_to_sheets_data, filters, user_info, cache)
+
+    assert rows == legacy_rows == warm_rows, "результаты конвертации различаются"
+    print(f"{'Вариант':40} {'Время, мс':>10}")
+    print(f"{'построчно (strptime)':40} {legacy_time * 1000:10.1f}")
+    print(f"{'пакетно, пустой кэш':40} {cold_time * 1000:10.1f}")
+    print(f"{'пакетно, кэш дат прогрет':40} {warm_time * 1000:10.1f}")
+
+
+BENCHMARKS = {
+    'startup': bench_startup,
+    'filters': bench_filters,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
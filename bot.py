@@ -1,20 +1,36 @@
 import os
+import functools
 import logging
+import io
 import json
+import threading
+import uuid
 from datetime import datetime
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
 from telegram.ext import (Updater, CommandHandler, MessageHandler, Filters, 
-                         ConversationHandler, CallbackContext)
+                         ConversationHandler, CallbackContext, TypeHandler)
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения ДО их использования
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Модули, читающие config, импортируются после загрузки .env
+from config import config
+from reminders import ReminderScheduler
+from google_sheets import GoogleSheetsSync
+from sheets_outbox import SheetsOutbox
+from metrics import STORAGE_SECONDS, start_metrics_server, timed, timed_handler
+from profiler import ProfilerBusy, SamplingProfiler
+from backup import BackupStore
+from update_recorder import RECORD_FILE, UpdateRecorder
+from file_lock import InterProcessLock
+from delivery import DeliveryQueue, split_message
+from rollups import MATERIALS, SALARY, RollupStore
+from ledger import Ledger, seal_json
+import logging_setup
+
+# Настройка логирования: запись идет в очередь, вывод - в отдельном потоке
+logging_setup.setup_logging()
 logger = logging.getLogger(__name__)
 
 # Токен бота из переменных окружения
@@ -38,16 +54,76 @@ if not BOT_TOKEN:
 OBJECTS_FILE = 'objects.json'
 SALARIES_FILE = 'salaries.json'
 MATERIALS_FILE = 'materials.json'
+ROLLUPS_FILE = 'rollups.db'
+# Запечатанная история прошлых месяцев (ledger.py)
+LEDGER_DIR = 'ledger'
+ledger = Ledger(LEDGER_DIR)
+
+# Листы Google Sheets, куда очередь записи переносит данные бота
+OBJECTS_SHEET = 'Объекты'
+SALARIES_SHEET = 'Зарплаты'
+MATERIALS_SHEET = 'Материалы'
+SHEET_HEADERS = {
+    OBJECTS_SHEET: ["Адрес", "Название", "Зарплаты", "Материалы", "Создан"],
+    SALARIES_SHEET: ["ID", "Адрес", "Объект", "Сумма", "Дата"],
+    MATERIALS_SHEET: ["ID", "Адрес", "Объект", "Материал", "Стоимость", "Дата"],
+}
+
+# Очередь записи в Google Sheets (None, если синхронизация не настроена)
+sheets_outbox = None
+# Агрегаты расходов по объектам и периодам (создаются в init_data)
+rollup_store = None
 
 # Инициализация данных
+def write_json(path, data):
+    """Атомарная запись: читатели (и резервное копирование) видят старую или новую версию целиком"""
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, path)
+
 def init_data():
+    global rollup_store
     # Создаем файлы если не существуют
     for file in [OBJECTS_FILE, SALARIES_FILE, MATERIALS_FILE]:
         if not os.path.exists(file):
-            with open(file, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=2)
+            write_json(file, [])
+    
+    # Агрегаты для отчетов; при первом запуске пересчитываются из истории.
+    # Рабочие процессы кластера стартуют одновременно: пересчет идет под
+    # storage_lock, а пустота проверяется повторно, чтобы его выполнил один
+    rollup_store = RollupStore(ROLLUPS_FILE)
+    if rollup_store.is_empty():
+        with storage_lock:
+            if rollup_store.is_empty():
+                salaries = ledger.records(SALARY) + load_salaries()
+                materials = ledger.records(MATERIALS) + load_materials()
+                if salaries or materials:
+                    rollup_store.rebuild(salaries, materials)
+
+def record_rollup(record_id, object_key, category, amount, date_text):
+    # Ошибка агрегатов не должна мешать сохранению записи: их можно пересчитать
+    if rollup_store is None:
+        return
+    try:
+        rollup_store.add(record_id, object_key, category, amount, date_text)
+    except Exception as e:
+        logger.error("Ошибка обновления агрегатов: %s", e)
+
+# Обработчики разных чатов могут выполняться параллельно (DISPATCH_WORKERS) и в
+# разных процессах (cluster.py), поэтому чтение-изменение-запись JSON-файлов
+# идет под общей блокировкой на файле-замке
+storage_lock = InterProcessLock('storage.lock')
+
+def with_storage_lock(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with storage_lock:
+            return func(*args, **kwargs)
+    return wrapper
 
 # Функции для работы с данными
+@timed(STORAGE_SECONDS, operation='load', file='objects')
 def load_objects():
     try:
         with open(OBJECTS_FILE, 'r', encoding='utf-8') as f:
@@ -55,10 +131,11 @@ def load_objects():
     except (FileNotFoundError, json.JSONDecodeError):
         return []
 
+@timed(STORAGE_SECONDS, operation='save', file='objects')
 def save_objects(objects):
-    with open(OBJECTS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(objects, f, ensure_ascii=False, indent=2)
+    write_json(OBJECTS_FILE, objects)
 
+@timed(STORAGE_SECONDS, operation='load', file='salaries')
 def load_salaries():
     try:
         with open(SALARIES_FILE, 'r', encoding='utf-8') as f:
@@ -66,10 +143,11 @@ def load_salaries():
     except (FileNotFoundError, json.JSONDecodeError):
         return []
 
+@timed(STORAGE_SECONDS, operation='save', file='salaries')
 def save_salaries(salaries):
-    with open(SALARIES_FILE, 'w', encoding='utf-8') as f:
-        json.dump(salaries, f, ensure_ascii=False, indent=2)
+    write_json(SALARIES_FILE, salaries)
 
+@timed(STORAGE_SECONDS, operation='load', file='materials')
 def load_materials():
     try:
         with open(MATERIALS_FILE, 'r', encoding='utf-8') as f:
@@ -77,9 +155,64 @@ def load_materials():
     except (FileNotFoundError, json.JSONDecodeError):
         return []
 
+@timed(STORAGE_SECONDS, operation='save', file='materials')
 def save_materials(materials):
-    with open(MATERIALS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(materials, f, ensure_ascii=False, indent=2)
+    write_json(MATERIALS_FILE, materials)
+
+# Синхронизация с Google Sheets через локальную очередь
+def init_sheets_outbox(credentials_file='credentials.json', drain=True):
+    global sheets_outbox
+    spreadsheet_id = os.getenv('GOOGLE_SHEET_ID')
+    if not spreadsheet_id or not os.path.exists(credentials_file):
+        logger.info("Синхронизация с Google Sheets отключена")
+        return
+    
+    sheets_sync = GoogleSheetsSync(credentials_file, spreadsheet_id=spreadsheet_id)
+    sheets_outbox = SheetsOutbox('sheets_outbox.db')
+    if not drain:
+        # В кластере очередь в Google Sheets отправляет только один процесс
+        return
+    sheets_outbox.start(
+        lambda sheet, operations: sheets_sync.apply_operations(sheet, operations, SHEET_HEADERS[sheet])
+    )
+
+def enqueue_sheet_row(sheet, row_key, values):
+    # Запись в очередь локальная: обработчик не ждет Google Sheets
+    if sheets_outbox is None:
+        return
+    try:
+        sheets_outbox.enqueue(sheet, row_key, values)
+    except Exception as e:
+        logger.error("Ошибка постановки в очередь Google Sheets: %s", e)
+
+def object_sheet_row(obj):
+    return [obj['address'], obj['name'], obj.get('salary_total', 0),
+            obj.get('materials_total', 0), obj.get('created_at', '')]
+
+# Исходящие сообщения идут через очередь с ограничением частоты (delivery.py);
+# пока очередь не запущена (replay.py), ответы отправляются напрямую
+delivery_queue = None
+
+def init_delivery(telegram_bot, rate_share=1.0):
+    global delivery_queue
+    delivery_queue = DeliveryQueue(
+        telegram_bot,
+        global_rate=config.DELIVERY_GLOBAL_RATE * rate_share,
+        chat_rate=config.DELIVERY_CHAT_RATE,
+        chat_burst=config.DELIVERY_CHAT_BURST,
+    ).start()
+    return delivery_queue
+
+def reply(update, text, **kwargs):
+    if delivery_queue is not None:
+        delivery_queue.send(update.effective_chat.id, text, **kwargs)
+        return
+    markup = kwargs.pop('reply_markup', None)
+    parts = split_message(text)
+    for index, part in enumerate(parts):
+        if index == len(parts) - 1:
+            kwargs['reply_markup'] = markup
+        update.message.reply_text(part, **kwargs)
 
 # Главная клавиатура
 def main_keyboard():
@@ -87,7 +220,8 @@ def main_keyboard():
         [KeyboardButton("📋 Добавить объект")],
         [KeyboardButton("💰 Добавить зарплату")],
         [KeyboardButton("🏗️ Добавить материалы")],
-        [KeyboardButton("📊 Отчет по объектам")]
+        [KeyboardButton("📊 Отчет по объектам")],
+        [KeyboardButton("📈 Динамика расходов")]
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
@@ -127,10 +261,19 @@ def edit_material_fields_keyboard():
     ]
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
+def keyboard_labels():
+    """Подписи постоянных кнопок (в записи обновлений остаются как есть)"""
+    labels = {"🔙 Назад"}
+    for markup in (main_keyboard(), confirmation_keyboard(), edit_object_fields_keyboard(),
+                   edit_salary_fields_keyboard(), edit_material_fields_keyboard()):
+        labels.update(button.text for row in markup.keyboard for button in row)
+    return labels
+
 # Команда /start
 def start(update: Update, context: CallbackContext):
     user = update.message.from_user
-    update.message.reply_text(
+    reply(
+        update,
         f"Добро пожаловать в систему учета ООО ИКС ГЕОСТРОЙ, {user.first_name}!\n\n"
         "Выберите действие:",
         reply_markup=main_keyboard()
@@ -140,13 +283,13 @@ def start(update: Update, context: CallbackContext):
 # Добавление объекта - шаг 1: адрес
 def add_object_start(update: Update, context: CallbackContext):
     context.user_data.clear()
-    update.message.reply_text("Введите адрес строительного объекта:")
+    reply(update, "Введите адрес строительного объекта:")
     return ENTERING_ADDRESS
 
 # Шаг 2: название объекта
 def enter_address(update: Update, context: CallbackContext):
     context.user_data['address'] = update.message.text
-    update.message.reply_text("Введите название объекта:")
+    reply(update, "Введите название объекта:")
     return ENTERING_NAME
 
 # Подтверждение объекта
@@ -156,7 +299,8 @@ def enter_name(update: Update, context: CallbackContext):
 
 # Показать подтверждение объекта
 def show_object_confirmation(update: Update, context: CallbackContext):
-    update.message.reply_text(
+    reply(
+        update,
         f"📋 ПОДТВЕРЖДЕНИЕ ДОБАВЛЕНИЯ ОБЪЕКТА:\n\n"
         f"🏗️ Адрес: {context.user_data['address']}\n"
         f"📝 Название: {context.user_data['name']}\n\n"
@@ -166,6 +310,7 @@ def show_object_confirmation(update: Update, context: CallbackContext):
     return CONFIRMING_OBJECT
 
 # Сохранение объекта в JSON
+@with_storage_lock
 def save_object_to_json(context):
     try:
         objects = load_objects()
@@ -186,11 +331,12 @@ def save_object_to_json(context):
         
         objects.append(new_object)
         save_objects(objects)
+        enqueue_sheet_row(OBJECTS_SHEET, new_object['address'], object_sheet_row(new_object))
         
         return True, "✅ Объект успешно добавлен!"
         
     except Exception as e:
-        logger.error(f"Ошибка при добавлении объекта: {e}")
+        logger.error("Ошибка при добавлении объекта: %s", e)
         return False, f"❌ Ошибка при добавлении объекта: {str(e)}"
 
 # Обработка подтверждения объекта
@@ -201,14 +347,16 @@ def confirm_object(update: Update, context: CallbackContext):
         success, message = save_object_to_json(context)
         
         if success:
-            update.message.reply_text(
+            reply(
+                update,
                 f"{message}\n"
                 f"🏗️ Адрес: {context.user_data['address']}\n"
                 f"📝 Название: {context.user_data['name']}",
                 reply_markup=main_keyboard()
             )
         else:
-            update.message.reply_text(
+            reply(
+                update,
                 message,
                 reply_markup=main_keyboard()
             )
@@ -217,7 +365,8 @@ def confirm_object(update: Update, context: CallbackContext):
         return SELECTING_ACTION
     
     elif text == "✏️ Редактировать":
-        update.message.reply_text(
+        reply(
+            update,
             "Выберите поле для редактирования:",
             reply_markup=edit_object_fields_keyboard()
         )
@@ -226,7 +375,7 @@ def confirm_object(update: Update, context: CallbackContext):
     elif text == "❌ Отменить":
         return cancel(update, context)
     else:
-        update.message.reply_text("Пожалуйста, используйте кнопки для выбора действия:")
+        reply(update, "Пожалуйста, используйте кнопки для выбора действия:")
         return CONFIRMING_OBJECT
 
 # Редактирование объекта
@@ -234,16 +383,16 @@ def edit_object(update: Update, context: CallbackContext):
     text = update.message.text
     
     if text == "✏️ Редактировать адрес":
-        update.message.reply_text("Введите новый адрес объекта:")
+        reply(update, "Введите новый адрес объекта:")
         return ENTERING_ADDRESS
     elif text == "✏️ Редактировать название":
-        update.message.reply_text("Введите новое название объекта:")
+        reply(update, "Введите новое название объекта:")
         return ENTERING_NAME
     elif text == "🔙 Назад к подтверждению":
         # Возвращаемся к подтверждению с текущими данными
         return show_object_confirmation(update, context)
     else:
-        update.message.reply_text("Пожалуйста, используйте кнопки для выбора действия:")
+        reply(update, "Пожалуйста, используйте кнопки для выбора действия:")
         return EDITING_OBJECT
 
 # Добавление зарплаты - выбор объекта
@@ -253,7 +402,7 @@ def add_salary_start(update: Update, context: CallbackContext):
         objects = load_objects()
         
         if not objects:
-            update.message.reply_text("❌ Нет доступных объектов. Сначала добавьте объект.")
+            reply(update, "❌ Нет доступных объектов. Сначала добавьте объект.")
             return SELECTING_ACTION
         
         keyboard = []
@@ -264,27 +413,28 @@ def add_salary_start(update: Update, context: CallbackContext):
         keyboard.append([KeyboardButton("🔙 Назад")])
         
         context.user_data['objects'] = objects
-        update.message.reply_text(
+        reply(
+            update,
             "Выберите объект для добавления зарплаты:",
             reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
         )
         return ENTERING_SALARY
         
     except Exception as e:
-        logger.error(f"Ошибка при получении объектов: {e}")
-        update.message.reply_text("❌ Ошибка при загрузке объектов")
+        logger.error("Ошибка при получении объектов: %s", e)
+        reply(update, "❌ Ошибка при загрузке объектов")
         return SELECTING_ACTION
 
 # Ввод суммы зарплаты
 def enter_salary(update: Update, context: CallbackContext):
     if update.message.text == "🔙 Назад":
-        update.message.reply_text("Главное меню:", reply_markup=main_keyboard())
+        reply(update, "Главное меню:", reply_markup=main_keyboard())
         return SELECTING_ACTION
     
     selected_object = update.message.text
     context.user_data['selected_object'] = selected_object
     
-    update.message.reply_text("Введите сумму зарплаты:")
+    reply(update, "Введите сумму зарплаты:")
     return ADDING_SALARY
 
 # Подтверждение зарплаты
@@ -296,12 +446,13 @@ def add_salary_amount(update: Update, context: CallbackContext):
         return show_salary_confirmation(update, context)
         
     except ValueError:
-        update.message.reply_text("❌ Пожалуйста, введите корректную сумму:")
+        reply(update, "❌ Пожалуйста, введите корректную сумму:")
         return ADDING_SALARY
 
 # Показать подтверждение зарплаты
 def show_salary_confirmation(update: Update, context: CallbackContext):
-    update.message.reply_text(
+    reply(
+        update,
         f"💰 ПОДТВЕРЖДЕНИЕ ДОБАВЛЕНИЯ ЗАРПЛАТЫ:\n\n"
         f"🏗️ Объект: {context.user_data['selected_object']}\n"
         f"💵 Сумма: {context.user_data['salary_amount']:,.2f} руб.\n\n"
@@ -311,6 +462,7 @@ def show_salary_confirmation(update: Update, context: CallbackContext):
     return CONFIRMING_SALARY
 
 # Сохранение зарплаты в JSON
+@with_storage_lock
 def save_salary_to_json(context):
     try:
         salary_amount = context.user_data['salary_amount']
@@ -328,6 +480,7 @@ def save_salary_to_json(context):
                 
                 # Добавляем запись в историю зарплат
                 new_salary = {
+                    'id': str(uuid.uuid4()),
                     'address': obj['address'],
                     'name': obj['name'],
                     'amount': salary_amount,
@@ -339,12 +492,20 @@ def save_salary_to_json(context):
                 save_objects(objects)
                 save_salaries(salaries)
                 
+                enqueue_sheet_row(OBJECTS_SHEET, obj['address'], object_sheet_row(obj))
+                record_rollup(new_salary['id'], obj['address'], SALARY,
+                              new_salary['amount'], new_salary['date'])
+                enqueue_sheet_row(SALARIES_SHEET, new_salary['id'], [
+                    new_salary['id'], new_salary['address'], new_salary['name'],
+                    new_salary['amount'], new_salary['date']
+                ])
+                
                 return True, f"✅ Зарплата успешно добавлена! Общая сумма: {obj['salary_total']:,.2f} руб."
         
         return False, "❌ Объект не найден"
             
     except Exception as e:
-        logger.error(f"Ошибка при добавлении зарплаты: {e}")
+        logger.error("Ошибка при добавлении зарплаты: %s", e)
         return False, f"❌ Ошибка при добавлении зарплаты: {str(e)}"
 
 # Обработка подтверждения зарплаты
@@ -357,7 +518,8 @@ def confirm_salary(update: Update, context: CallbackContext):
         
         success, message = save_salary_to_json(context)
         
-        update.message.reply_text(
+        reply(
+            update,
             f"{message}\n"
             f"🏗️ Объект: {context.user_data['selected_object']}\n"
             f"💵 Сумма: {context.user_data['salary_amount']:,.2f} руб.",
@@ -368,7 +530,8 @@ def confirm_salary(update: Update, context: CallbackContext):
         return SELECTING_ACTION
     
     elif text == "✏️ Редактировать":
-        update.message.reply_text(
+        reply(
+            update,
             "Выберите поле для редактирования:",
             reply_markup=edit_salary_fields_keyboard()
         )
@@ -377,7 +540,7 @@ def confirm_salary(update: Update, context: CallbackContext):
     elif text == "❌ Отменить":
         return cancel(update, context)
     else:
-        update.message.reply_text("Пожалуйста, используйте кнопки для выбора действия:")
+        reply(update, "Пожалуйста, используйте кнопки для выбора действия:")
         return CONFIRMING_SALARY
 
 # Редактирование зарплаты
@@ -387,13 +550,13 @@ def edit_salary(update: Update, context: CallbackContext):
     if text == "✏️ Редактировать объект":
         return add_salary_start(update, context)
     elif text == "✏️ Редактировать сумму":
-        update.message.reply_text("Введите новую сумму зарплаты:")
+        reply(update, "Введите новую сумму зарплаты:")
         return ADDING_SALARY
     elif text == "🔙 Назад к подтверждению":
         # Возвращаемся к подтверждению
         return show_salary_confirmation(update, context)
     else:
-        update.message.reply_text("Пожалуйста, используйте кнопки для выбора действия:")
+        reply(update, "Пожалуйста, используйте кнопки для выбора действия:")
         return EDITING_SALARY
 
 # Добавление материалов - выбор объекта
@@ -403,7 +566,7 @@ def add_materials_start(update: Update, context: CallbackContext):
         objects = load_objects()
         
         if not objects:
-            update.message.reply_text("❌ Нет доступных объектов. Сначала добавьте объект.")
+            reply(update, "❌ Нет доступных объектов. Сначала добавьте объект.")
             return SELECTING_ACTION
         
         keyboard = []
@@ -414,33 +577,34 @@ def add_materials_start(update: Update, context: CallbackContext):
         keyboard.append([KeyboardButton("🔙 Назад")])
         
         context.user_data['objects'] = objects
-        update.message.reply_text(
+        reply(
+            update,
             "Выберите объект для добавления материалов:",
             reply_markup=ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
         )
         return ENTERING_MATERIAL_NAME
         
     except Exception as e:
-        logger.error(f"Ошибка при получении объектов: {e}")
-        update.message.reply_text("❌ Ошибка при загрузке объектов")
+        logger.error("Ошибка при получении объектов: %s", e)
+        reply(update, "❌ Ошибка при загрузке объектов")
         return SELECTING_ACTION
 
 # Ввод названия материала
 def enter_material_name(update: Update, context: CallbackContext):
     if update.message.text == "🔙 Назад":
-        update.message.reply_text("Главное меню:", reply_markup=main_keyboard())
+        reply(update, "Главное меню:", reply_markup=main_keyboard())
         return SELECTING_ACTION
     
     selected_object = update.message.text
     context.user_data['selected_object'] = selected_object
     
-    update.message.reply_text("Введите название материала:")
+    reply(update, "Введите название материала:")
     return ENTERING_MATERIAL_COST
 
 # Ввод стоимости материала
 def enter_material_cost(update: Update, context: CallbackContext):
     context.user_data['material_name'] = update.message.text
-    update.message.reply_text("Введите стоимость материала:")
+    reply(update, "Введите стоимость материала:")
     return ADDING_MATERIALS
 
 # Подтверждение материала
@@ -452,12 +616,13 @@ def add_material_cost(update: Update, context: CallbackContext):
         return show_material_confirmation(update, context)
         
     except ValueError:
-        update.message.reply_text("❌ Пожалуйста, введите корректную сумму:")
+        reply(update, "❌ Пожалуйста, введите корректную сумму:")
         return ADDING_MATERIALS
 
 # Показать подтверждение материала
 def show_material_confirmation(update: Update, context: CallbackContext):
-    update.message.reply_text(
+    reply(
+        update,
         f"🏗️ ПОДТВЕРЖДЕНИЕ ДОБАВЛЕНИЯ МАТЕРИАЛА:\n\n"
         f"📦 Объект: {context.user_data['selected_object']}\n"
         f"🔧 Материал: {context.user_data['material_name']}\n"
@@ -468,6 +633,7 @@ def show_material_confirmation(update: Update, context: CallbackContext):
     return CONFIRMING_MATERIAL
 
 # Сохранение материала в JSON
+@with_storage_lock
 def save_material_to_json(context):
     try:
         material_cost = context.user_data['material_cost']
@@ -485,6 +651,7 @@ def save_material_to_json(context):
                 
                 # Добавляем запись в историю материалов
                 new_material = {
+                    'id': str(uuid.uuid4()),
                     'address': obj['address'],
                     'name': obj['name'],
                     'material_name': context.user_data['material_name'],
@@ -497,12 +664,20 @@ def save_material_to_json(context):
                 save_objects(objects)
                 save_materials(materials)
                 
+                enqueue_sheet_row(OBJECTS_SHEET, obj['address'], object_sheet_row(obj))
+                record_rollup(new_material['id'], obj['address'], MATERIALS,
+                              new_material['cost'], new_material['date'])
+                enqueue_sheet_row(MATERIALS_SHEET, new_material['id'], [
+                    new_material['id'], new_material['address'], new_material['name'],
+                    new_material['material_name'], new_material['cost'], new_material['date']
+                ])
+                
                 return True, f"✅ Материал успешно добавлен! Общая сумма: {obj['materials_total']:,.2f} руб."
         
         return False, "❌ Объект не найден"
             
     except Exception as e:
-        logger.error(f"Ошибка при добавлении материала: {e}")
+        logger.error("Ошибка при добавлении материала: %s", e)
         return False, f"❌ Ошибка при добавлении материала: {str(e)}"
 
 # Обработка подтверждения материала
@@ -515,7 +690,8 @@ def confirm_material(update: Update, context: CallbackContext):
         
         success, message = save_material_to_json(context)
         
-        update.message.reply_text(
+        reply(
+            update,
             f"{message}\n"
             f"📦 Объект: {context.user_data['selected_object']}\n"
             f"🔧 Материал: {context.user_data['material_name']}\n"
@@ -527,7 +703,8 @@ def confirm_material(update: Update, context: CallbackContext):
         return SELECTING_ACTION
     
     elif text == "✏️ Редактировать":
-        update.message.reply_text(
+        reply(
+            update,
             "Выберите поле для редактирования:",
             reply_markup=edit_material_fields_keyboard()
         )
@@ -536,7 +713,7 @@ def confirm_material(update: Update, context: CallbackContext):
     elif text == "❌ Отменить":
         return cancel(update, context)
     else:
-        update.message.reply_text("Пожалуйста, используйте кнопки для выбора действия:")
+        reply(update, "Пожалуйста, используйте кнопки для выбора действия:")
         return CONFIRMING_MATERIAL
 
 # Редактирование материала
@@ -546,16 +723,16 @@ def edit_material(update: Update, context: CallbackContext):
     if text == "✏️ Редактировать объект":
         return add_materials_start(update, context)
     elif text == "✏️ Редактировать название материала":
-        update.message.reply_text("Введите новое название материала:")
+        reply(update, "Введите новое название материала:")
         return ENTERING_MATERIAL_COST
     elif text == "✏️ Редактировать стоимость":
-        update.message.reply_text("Введите новую стоимость материала:")
+        reply(update, "Введите новую стоимость материала:")
         return ADDING_MATERIALS
     elif text == "🔙 Назад к подтверждению":
         # Возвращаемся к подтверждению
         return show_material_confirmation(update, context)
     else:
-        update.message.reply_text("Пожалуйста, используйте кнопки для выбора действия:")
+        reply(update, "Пожалуйста, используйте кнопки для выбора действия:")
         return EDITING_MATERIAL
 
 # Отчет по объектам
@@ -564,7 +741,7 @@ def show_report(update: Update, context: CallbackContext):
         objects = load_objects()
         
         if not objects:
-            update.message.reply_text("❌ Нет данных об объектах")
+            reply(update, "❌ Нет данных об объектах")
             return SELECTING_ACTION
         
         report = "📊 ОТЧЕТ ПО ОБЪЕКТАМ:\n\n"
@@ -592,29 +769,213 @@ def show_report(update: Update, context: CallbackContext):
         report += f"Материалы: {total_materials:,.2f} руб.\n"
         report += f"ВСЕГО: {total_salary + total_materials:,.2f} руб."
         
-        # Разбиваем сообщение если слишком длинное
-        if len(report) > 4000:
-            parts = [report[i:i+4000] for i in range(0, len(report), 4000)]
-            for part in parts:
-                update.message.reply_text(part)
-        else:
-            update.message.reply_text(report)
+        # Длинный отчет делится на сообщения по границам строк
+        reply(update, report)
+        
+    except Exception as e:
+        logger.error("Ошибка при формировании отчета: %s", e)
+        reply(update, "❌ Ошибка при формировании отчета")
+    
+    return SELECTING_ACTION
+
+# Динамика расходов по месяцам (из агрегатов, без чтения истории)
+TREND_MONTHS = 6
+
+def show_trends(update: Update, context: CallbackContext):
+    try:
+        totals = rollup_store.totals_by_period('month', TREND_MONTHS)
+        if not totals:
+            reply(update, "❌ Нет данных о расходах")
+            return SELECTING_ACTION
+        
+        report = f"📈 ДИНАМИКА РАСХОДОВ (последние {len(totals)} мес.):\n\n"
+        for period, sums in totals.items():
+            salary, materials = sums[SALARY], sums[MATERIALS]
+            total = salary + materials
+            salary_share = salary / total * 100 if total else 0
+            report += f"📅 {period}\n"
+            report += f"   Зарплаты: {salary:,.2f} руб. ({salary_share:.0f}%)\n"
+            report += f"   Материалы: {materials:,.2f} руб.\n"
+            report += f"   ИТОГО: {total:,.2f} руб.\n\n"
+        
+        last_period = list(totals)[-1]
+        report += f"🏗️ РАСХОДЫ ПО ОБЪЕКТАМ ЗА {last_period}:\n"
+        by_object = rollup_store.object_totals(last_period)
+        for address, sums in sorted(by_object.items(), key=lambda item: -sum(item[1].values())):
+            report += (f"{address}: зарплаты {sums[SALARY]:,.2f}, "
+                       f"материалы {sums[MATERIALS]:,.2f} руб.\n")
+        
+        reply(update, report)
         
     except Exception as e:
-        logger.error(f"Ошибка при формировании отчета: {e}")
-        update.message.reply_text("❌ Ошибка при формировании отчета")
+        logger.error("Ошибка при формировании динамики расходов: %s", e)
+        reply(update, "❌ Ошибка при формировании отчета")
     
     return SELECTING_ACTION
 
 # Отмена
 def cancel(update: Update, context: CallbackContext):
     context.user_data.clear()
-    update.message.reply_text(
+    reply(
+        update,
         "❌ Действие отменено.",
         reply_markup=main_keyboard()
     )
     return SELECTING_ACTION
 
+# Профилирование по команде администратора: /profile [секунды]
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 300
+
+def profile_command(update: Update, context: CallbackContext):
+    if update.effective_user.id != config.ADMIN_ID:
+        reply(update, "❌ Команда доступна только администратору")
+        return
+    
+    try:
+        seconds = int(context.args[0]) if context.args else PROFILE_DEFAULT_SECONDS
+    except ValueError:
+        reply(update, "❌ Укажите длительность в секундах, например: /profile 30")
+        return
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    
+    chat_id = update.effective_chat.id
+    reply(update, f"⏱️ Профилирование запущено на {seconds} с...")
+    
+    def run_profile():
+        try:
+            profiler = SamplingProfiler().run(seconds)
+        except ProfilerBusy:
+            context.bot.send_message(chat_id, "❌ Профилирование уже выполняется")
+            return
+        except Exception as e:
+            logger.error("Ошибка профилирования: %s", e)
+            context.bot.send_message(chat_id, f"❌ Ошибка профилирования: {e}")
+            return
+        
+        document = io.BytesIO(profiler.collapsed().encode('utf-8'))
+        filename = f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.collapsed.txt"
+        context.bot.send_document(
+            chat_id, document=document, filename=filename,
+            caption=profiler.summary(top=5)[:1000]
+        )
+    
+    # Сбор сэмплов идет в отдельном потоке, чтобы не блокировать обработку обновлений
+    threading.Thread(target=run_profile, name='profiler', daemon=True).start()
+
+# Резервное копирование данных бота
+def run_backup(context: CallbackContext):
+    store = context.job.context
+    try:
+        store.create([OBJECTS_FILE, SALARIES_FILE, MATERIALS_FILE], [config.DB_PATH],
+                     ledger.segment_paths, storage_lock=storage_lock)
+        store.prune()
+    except Exception as e:
+        logger.error("Ошибка резервного копирования: %s", e)
+
+# Перенос записей прошлых месяцев из JSON в сегменты
+@with_storage_lock
+def run_ledger_seal(context: CallbackContext):
+    try:
+        moved = seal_json(ledger, {SALARY: SALARIES_FILE, MATERIALS: MATERIALS_FILE})
+        if moved:
+            logger.info("📦 Перенесено в сегменты записей: %s", moved)
+    except Exception as e:
+        logger.error("Ошибка запечатывания истории: %s", e)
+
+def add_log_context_handlers(dp, conv_handler: ConversationHandler):
+    """Поля user_id/state в логах обработчиков и итоговая запись с длительностью"""
+    def conversation_state(update: Update):
+        user, chat = update.effective_user, update.effective_chat
+        if user is None or chat is None:
+            return None
+        return conv_handler.conversations.get((chat.id, user.id))
+    
+    def begin_update(update: Update, context: CallbackContext):
+        logging_setup.start_context(
+            user_id=update.effective_user.id if update.effective_user else None,
+            chat_id=update.effective_chat.id if update.effective_chat else None,
+            state=conversation_state(update),
+        )
+    
+    def end_update(update: Update, context: CallbackContext):
+        logger.info("Обновление %s обработано, новое состояние %s",
+                    update.update_id, conversation_state(update),
+                    extra={'duration_ms': logging_setup.elapsed_ms()})
+        logging_setup.clear_context()
+    
+    # Группы -1 и 100 выполняются до и после всех обработчиков
+    dp.add_handler(TypeHandler(Update, begin_update), group=-1)
+    dp.add_handler(TypeHandler(Update, end_update), group=100)
+
+def build_conversation_handler(persistent=False):
+    """ConversationHandler со всеми состояниями бота (используется и при воспроизведении трафика)"""
+    return ConversationHandler(
+        entry_points=[CommandHandler('start', timed_handler(start))],
+        states={
+            SELECTING_ACTION: [
+                MessageHandler(Filters.text("📋 Добавить объект"), timed_handler(add_object_start)),
+                MessageHandler(Filters.text("💰 Добавить зарплату"), timed_handler(add_salary_start)),
+                MessageHandler(Filters.text("🏗️ Добавить материалы"), timed_handler(add_materials_start)),
+                MessageHandler(Filters.text("📊 Отчет по объектам"), timed_handler(show_report)),
+                MessageHandler(Filters.text("📈 Динамика расходов"), timed_handler(show_trends)),
+            ],
+            ENTERING_ADDRESS: [MessageHandler(Filters.text & ~Filters.command, timed_handler(enter_address))],
+            ENTERING_NAME: [MessageHandler(Filters.text & ~Filters.command, timed_handler(enter_name))],
+            CONFIRMING_OBJECT: [MessageHandler(Filters.text & ~Filters.command, timed_handler(confirm_object))],
+            EDITING_OBJECT: [MessageHandler(Filters.text & ~Filters.command, timed_handler(edit_object))],
+            
+            ENTERING_SALARY: [MessageHandler(Filters.text & ~Filters.command, timed_handler(enter_salary))],
+            ADDING_SALARY: [MessageHandler(Filters.text & ~Filters.command, timed_handler(add_salary_amount))],
+            CONFIRMING_SALARY: [MessageHandler(Filters.text & ~Filters.command, timed_handler(confirm_salary))],
+            EDITING_SALARY: [MessageHandler(Filters.text & ~Filters.command, timed_handler(edit_salary))],
+            
+            ENTERING_MATERIAL_NAME: [MessageHandler(Filters.text & ~Filters.command, timed_handler(enter_material_name))],
+            ENTERING_MATERIAL_COST: [MessageHandler(Filters.text & ~Filters.command, timed_handler(enter_material_cost))],
+            ADDING_MATERIALS: [MessageHandler(Filters.text & ~Filters.command, timed_handler(add_material_cost))],
+            CONFIRMING_MATERIAL: [MessageHandler(Filters.text & ~Filters.command, timed_handler(confirm_material))],
+            EDITING_MATERIAL: [MessageHandler(Filters.text & ~Filters.command, timed_handler(edit_material))],
+        },
+        fallbacks=[CommandHandler('cancel', timed_handler(cancel))],
+        name='conversation',
+        persistent=persistent,
+    )
+
+def register_handlers(dp, persistent=False):
+    """Обработчики бота в диспетчере; возвращает ConversationHandler"""
+    conv_handler = build_conversation_handler(persistent)
+    dp.add_handler(conv_handler)
+    dp.add_handler(CommandHandler('profile', profile_command))
+    add_log_context_handlers(dp, conv_handler)
+    return conv_handler
+
+def start_jobs(job_queue, telegram_bot):
+    """Напоминания, резервное копирование и запечатывание истории (в кластере - только в первом рабочем процессе)"""
+    reminders = ReminderScheduler(job_queue, telegram_bot, delivery=delivery_queue)
+    reminders.start()
+    
+    if config.BACKUP_ENABLED:
+        job_queue.run_repeating(run_backup, interval=config.BACKUP_INTERVAL, first=60,
+                                context=BackupStore(config.BACKUP_DIR, config.BACKUP_KEEP),
+                                name='backup')
+    job_queue.run_repeating(run_ledger_seal, interval=config.LEDGER_SEAL_INTERVAL, first=120,
+                            name='ledger_seal')
+    return reminders
+
+def create_updater(token, base_url=None):
+    """Updater: классический или с параллельной обработкой чатов (DISPATCH_WORKERS > 0)"""
+    if config.DISPATCH_WORKERS > 0:
+        from chat_dispatcher import build_serial_updater
+        return build_serial_updater(
+            token, config.DISPATCH_WORKERS,
+            max_pending=config.DISPATCH_MAX_PENDING,
+            max_pending_per_chat=config.DISPATCH_MAX_PENDING_PER_CHAT,
+            base_url=base_url,
+        )
+    if base_url:
+        return Updater(token, base_url=base_url, use_context=True)
+    return Updater(token, use_context=True)
+
 def main():
     # Проверяем токен
     if not BOT_TOKEN:
@@ -623,41 +984,24 @@ def main():
     
     # Инициализируем данные
     init_data()
+    start_metrics_server()
+    init_sheets_outbox()
     
     # Создаем updater и dispatcher
-    updater = Updater(BOT_TOKEN, use_context=True)
+    updater = create_updater(BOT_TOKEN)
     dp = updater.dispatcher
+    init_delivery(updater.bot)
+    if config.DISPATCH_WORKERS > 0:
+        dp.delivery = delivery_queue
+    register_handlers(dp)
     
-    # ConversationHandler для управления состояниями
-    conv_handler = ConversationHandler(
-        entry_points=[CommandHandler('start', start)],
-        states={
-            SELECTING_ACTION: [
-                MessageHandler(Filters.text("📋 Добавить объект"), add_object_start),
-                MessageHandler(Filters.text("💰 Добавить зарплату"), add_salary_start),
-                MessageHandler(Filters.text("🏗️ Добавить материалы"), add_materials_start),
-                MessageHandler(Filters.text("📊 Отчет по объектам"), show_report),
-            ],
-            ENTERING_ADDRESS: [MessageHandler(Filters.text & ~Filters.command, enter_address)],
-            ENTERING_NAME: [MessageHandler(Filters.text & ~Filters.command, enter_name)],
-            CONFIRMING_OBJECT: [MessageHandler(Filters.text & ~Filters.command, confirm_object)],
-            EDITING_OBJECT: [MessageHandler(Filters.text & ~Filters.command, edit_object)],
-            
-            ENTERING_SALARY: [MessageHandler(Filters.text & ~Filters.command, enter_salary)],
-            ADDING_SALARY: [MessageHandler(Filters.text & ~Filters.command, add_salary_amount)],
-            CONFIRMING_SALARY: [MessageHandler(Filters.text & ~Filters.command, confirm_salary)],
-            EDITING_SALARY: [MessageHandler(Filters.text & ~Filters.command, edit_salary)],
-            
-            ENTERING_MATERIAL_NAME: [MessageHandler(Filters.text & ~Filters.command, enter_material_name)],
-            ENTERING_MATERIAL_COST: [MessageHandler(Filters.text & ~Filters.command, enter_material_cost)],
-            ADDING_MATERIALS: [MessageHandler(Filters.text & ~Filters.command, add_material_cost)],
-            CONFIRMING_MATERIAL: [MessageHandler(Filters.text & ~Filters.command, confirm_material)],
-            EDITING_MATERIAL: [MessageHandler(Filters.text & ~Filters.command, edit_material)],
-        },
-        fallbacks=[CommandHandler('cancel', cancel)]
-    )
+    # Запись входящих обновлений для replay.py (RECORD_UPDATES=путь)
+    if RECORD_FILE:
+        recorder = UpdateRecorder(RECORD_FILE, keep=keyboard_labels())
+        dp.add_handler(TypeHandler(Update, recorder.record), group=-2)
     
-    dp.add_handler(conv_handler)
+    # Напоминания об истечении срока фильтров и резервные копии
+    start_jobs(updater.job_queue, updater.bot)
     
     # Запуск бота
     print("Бот запущен...")
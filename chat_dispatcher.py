@@ -0,0 +1,170 @@
+"""Диспетчер с параллельной обработкой разных чатов.
+
+Стандартный Dispatcher обрабатывает обновления по одному, и медленный
+обработчик (отчет, запись файла) задерживает всех пользователей. Здесь
+обновления раскладываются по очередям чатов и выполняются в пуле потоков:
+разные чаты обрабатываются параллельно, а обновления одного чата - строго по
+очереди, поэтому состояния ConversationHandler остаются согласованными.
+
+Ограничения нагрузки:
+    max_pending          - всего принятых, но не обработанных обновлений; при
+                           превышении поток приема ждет (опрос Telegram
+                           замедляется, обновления не теряются)
+    max_pending_per_chat - очередь одного чата; лишние обновления чата
+                           отбрасываются, чтобы один чат не занял весь лимит.
+                           Чат получает одно уведомление BUSY_TEXT до того,
+                           как его очередь разберется, а нажатие кнопки -
+                           ответ с тем же текстом
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+
+from telegram import Bot, Update
+from telegram.ext import Dispatcher, JobQueue, Updater
+from telegram.utils.request import Request
+
+import metrics
+
+DISPATCH_QUEUE_DEPTH = metrics.gauge('bot_dispatch_queue_depth', 'Обновления, ожидающие обработки')
+DISPATCH_ACTIVE_CHATS = metrics.gauge('bot_dispatch_active_chats', 'Чаты с необработанными обновлениями')
+DISPATCH_DROPPED = metrics.counter('bot_dispatch_dropped_total',
+                                   'Обновления, отброшенные из-за переполнения очереди чата')
+DISPATCH_WAIT_SECONDS = metrics.histogram('bot_dispatch_wait_seconds',
+                                          'Время обновления в очереди до начала обработки')
+
+BUSY_TEXT = "⏳ Бот еще обрабатывает предыдущие сообщения. Повторите действие чуть позже."
+
+
+class ChatSerialDispatcher(Dispatcher):
+    """Dispatcher: пул потоков, последовательная обработка внутри чата"""
+
+    def __init__(self, *args, pool_size: int = 8, max_pending: int = 1000,
+                 max_pending_per_chat: int = 20, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_size = pool_size
+        self.max_pending_per_chat = max_pending_per_chat
+        self._pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='chat-worker')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._chat_lock = threading.Lock()
+        self._chat_queues = {}  # ключ чата -> deque[(время постановки, обновление)]
+        self._pending = 0
+        self._busy_notified = set()  # чаты, уже получившие BUSY_TEXT
+        # Очередь доставки (delivery.DeliveryQueue) для уведомлений; без нее -
+        # отдельный поток, чтобы поток приема не ждал Telegram
+        self.delivery = None
+        self._notify_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chat-busy')
+
+    @staticmethod
+    def _chat_key(update: Update):
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return ('user', update.effective_user.id)
+        return None
+
+    def process_update(self, update):
+        # Ошибки опроса и служебные объекты обрабатываются как обычно
+        if not isinstance(update, Update):
+            super().process_update(update)
+            return
+
+        key = self._chat_key(update)
+        with self._chat_lock:
+            queue = self._chat_queues.get(key)
+            overflow = queue is not None and len(queue) >= self.max_pending_per_chat
+            if overflow:
+                notify_chat = key not in self._busy_notified
+                self._busy_notified.add(key)
+        if overflow:
+            DISPATCH_DROPPED.inc()
+            logging.warning("⚠️ Очередь чата %s переполнена, обновление %s отброшено",
+                            key, update.update_id)
+            self._notify_busy(update, notify_chat)
+            return
+
+        # Общий лимит: поток приема ждет, пока не освободится место
+        self._slots.acquire()
+        with self._chat_lock:
+            queue = self._chat_queues.get(key)
+            start_worker = queue is None
+            if start_worker:
+                queue = self._chat_queues[key] = deque()
+            queue.append((time.perf_counter(), update))
+            self._pending += 1
+            self._update_gauges()
+        if start_worker:
+            self._pool.submit(self._process_next, key)
+
+    def _process_next(self, key):
+        """Обработка одного обновления чата; следующее ставится в конец пула"""
+        with self._chat_lock:
+            queued_at, update = self._chat_queues[key][0]
+        DISPATCH_WAIT_SECONDS.observe(time.perf_counter() - queued_at)
+        try:
+            super().process_update(update)
+        except Exception:
+            logging.exception("Ошибка обработки обновления %s", update.update_id)
+        finally:
+            with self._chat_lock:
+                queue = self._chat_queues[key]
+                queue.popleft()
+                has_more = bool(queue)
+                if not has_more:
+                    del self._chat_queues[key]
+                    self._busy_notified.discard(key)
+                self._pending -= 1
+                self._update_gauges()
+            self._slots.release()
+        # Очередь чата продолжает другой задачей, чтобы активные чаты не занимали поток надолго
+        if has_more:
+            self._pool.submit(self._process_next, key)
+
+    def _notify_busy(self, update: Update, notify_chat: bool):
+        """Ответ на отброшенное обновление, чтобы пользователь не ждал впустую"""
+        query = update.callback_query
+        if query is not None:
+            self._notify_pool.submit(self._call_safely, query.answer, text=BUSY_TEXT)
+        elif notify_chat and update.effective_chat is not None:
+            chat_id = update.effective_chat.id
+            if self.delivery is not None:
+                self.delivery.send(chat_id, BUSY_TEXT)
+            else:
+                self._notify_pool.submit(self._call_safely, self.bot.send_message, chat_id, BUSY_TEXT)
+
+    @staticmethod
+    def _call_safely(func, *args, **kwargs):
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            logging.exception("Не удалось отправить уведомление о переполнении очереди")
+
+    def _update_gauges(self):
+        DISPATCH_QUEUE_DEPTH.set(self._pending)
+        DISPATCH_ACTIVE_CHATS.set(len(self._chat_queues))
+
+    def pending_count(self) -> int:
+        with self._chat_lock:
+            return self._pending
+
+    def stop(self):
+        super().stop()
+        self._pool.shutdown(wait=True)
+        self._notify_pool.shutdown(wait=True)
+
+
+def build_serial_updater(token: str, pool_size: int, max_pending: int = 1000,
+                         max_pending_per_chat: int = 20, base_url: str = None) -> Updater:
+    """Updater с ChatSerialDispatcher и пулом HTTP-соединений под число потоков"""
+    request = Request(con_pool_size=pool_size + 4)
+    bot = Bot(token, base_url=base_url, request=request) if base_url else Bot(token, request=request)
+    job_queue = JobQueue()
+    dispatcher = ChatSerialDispatcher(
+        bot, Queue(), job_queue=job_queue, use_context=True,
+        pool_size=pool_size, max_pending=max_pending, max_pending_per_chat=max_pending_per_chat,
+    )
+    job_queue.set_dispatcher(dispatcher)
+    return Updater(dispatcher=dispatcher)
@@ -0,0 +1,282 @@
+"""Многопроцессный режим бота: один прием обновлений, N рабочих процессов.
+
+Процесс приема (long polling или вебхук) раскладывает обновления по рабочим
+процессам по хешу chat_id, поэтому все обновления одного чата обрабатывает
+один процесс и в исходном порядке. Рабочие процессы работают с общими
+JSON-файлами под файловой блокировкой (bot.storage_lock), а состояния
+диалогов и user_data хранят в общей базе SQLite (SqlitePersistence), поэтому
+упавший процесс перезапускается независимо от остальных и продолжает диалоги
+своих чатов. Напоминания, резервные копии и отправка очереди Google Sheets
+работают только в первом рабочем процессе. Эндпоинт метрик поднимает каждый
+рабочий процесс на своем порту: METRICS_PORT + номер процесса.
+
+    python cluster.py --workers 4
+    python cluster.py --workers 4 --webhook-url https://example.com/bot --listen 0.0.0.0:8443
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import urllib.request
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+TELEGRAM_API_URL = 'https://api.telegram.org/bot'
+PERSISTENCE_FILE = 'conversations.db'
+# Ограничение очереди рабочего процесса: при заполнении прием обновлений ждет
+WORKER_QUEUE_SIZE = 1000
+POLL_TIMEOUT = 30
+# Потоков обработки у обычного Dispatcher PTB (workers=4 по умолчанию)
+DISPATCHER_WORKERS = 4
+
+_UPDATE_KINDS = ('message', 'edited_message', 'channel_post', 'edited_channel_post',
+                 'callback_query', 'my_chat_member', 'chat_member', 'chat_join_request',
+                 'inline_query', 'chosen_inline_result', 'shipping_query',
+                 'pre_checkout_query', 'poll_answer')
+
+
+def update_chat_id(data: Dict) -> int:
+    """chat_id обновления (или id пользователя, если чата нет)"""
+    for kind in _UPDATE_KINDS:
+        payload = data.get(kind)
+        if not payload:
+            continue
+        chat = payload.get('chat') or (payload.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        user = payload.get('from') or payload.get('user')
+        if user:
+            return user['id']
+    return 0
+
+
+def shard_for(chat_id: int, workers: int) -> int:
+    return zlib.crc32(str(chat_id).encode('ascii')) % workers
+
+
+def worker_main(index: int, workers: int, token: str, update_queue, base_url: Optional[str],
+                persistence_file: str):
+    """Рабочий процесс: Dispatcher бота с общим хранилищем состояний"""
+    os.environ.setdefault('BOT_TOKEN', token)
+    import bot as bot_module
+    import metrics
+    from delivery import DELIVERY_WORKERS
+    from telegram import Bot, Update
+    from telegram.ext import Dispatcher, JobQueue
+    from telegram.utils.request import Request
+    from sqlite_persistence import SqlitePersistence
+
+    primary = index == 0
+    config = bot_module.config
+    bot_module.init_data()
+    bot_module.init_sheets_outbox(drain=primary)
+    if metrics.ENABLED:
+        # Счетчики у каждого процесса свои: без отдельного порта метрики
+        # остальных рабочих процессов не видны
+        bot_module.start_metrics_server(metrics.METRICS_PORT + index)
+
+    # Пул соединений на все потоки, вызывающие Bot API: обработчики,
+    # отправители очереди доставки и JobQueue
+    handler_threads = config.DISPATCH_WORKERS if config.DISPATCH_WORKERS > 0 else DISPATCHER_WORKERS
+    request = Request(con_pool_size=handler_threads + DELIVERY_WORKERS + 1)
+    telegram_bot = (Bot(token, base_url=base_url, request=request) if base_url
+                    else Bot(token, request=request))
+    job_queue = JobQueue()
+    dispatcher_class = Dispatcher
+    options = {'workers': DISPATCHER_WORKERS}
+    if config.DISPATCH_WORKERS > 0:
+        from chat_dispatcher import ChatSerialDispatcher
+        dispatcher_class = ChatSerialDispatcher
+        options = {'pool_size': config.DISPATCH_WORKERS,
+                   'max_pending': config.DISPATCH_MAX_PENDING,
+                   'max_pending_per_chat': config.DISPATCH_MAX_PENDING_PER_CHAT}
+    dispatcher = dispatcher_class(telegram_bot, None, job_queue=job_queue, use_context=True,
+                                  persistence=SqlitePersistence(persistence_file), **options)
+    job_queue.set_dispatcher(dispatcher)
+    # Лимит Telegram общий для бота: каждому процессу - своя доля
+    bot_module.init_delivery(telegram_bot, rate_share=1 / workers)
+    if config.DISPATCH_WORKERS > 0:
+        dispatcher.delivery = bot_module.delivery_queue
+    bot_module.register_handlers(dispatcher, persistent=True)
+    if primary:
+        bot_module.start_jobs(job_queue, telegram_bot)
+        job_queue.start()
+
+    logging.info("🧩 Рабочий процесс %s запущен (pid %s)", index, os.getpid())
+    while True:
+        data = update_queue.get()
+        if data is None:
+            break
+        try:
+            dispatcher.process_update(Update.de_json(data, telegram_bot))
+        except Exception:
+            logging.exception("Ошибка обработки обновления %s", data.get('update_id'))
+
+    dispatcher.stop()
+    job_queue.stop()
+    bot_module.delivery_queue.stop()
+
+
+class Cluster:
+    """Прием обновлений и распределение по рабочим процессам"""
+
+    def __init__(self, token: str, workers: int = 2, base_url: str = None,
+                 persistence_file: str = PERSISTENCE_FILE, restart_delay: float = 1.0):
+        self.token = token
+        self.workers = workers
+        self.base_url = base_url
+        self.persistence_file = persistence_file
+        self.restart_delay = restart_delay
+        self._context = multiprocessing.get_context('spawn')
+        self._queues = [self._context.Queue(WORKER_QUEUE_SIZE) for _ in range(workers)]
+        self._processes: List = [None] * workers
+        self._stopped = threading.Event()
+        self._threads = []
+        self._webhook_server = None
+
+    # --- Рабочие процессы ---
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=worker_main, name=f"bot-worker-{index}", daemon=True,
+            args=(index, self.workers, self.token, self._queues[index], self.base_url,
+                  self.persistence_file),
+        )
+        process.start()
+        self._processes[index] = process
+
+    def _supervise(self):
+        """Перезапуск упавших рабочих процессов; их очереди сохраняются"""
+        while not self._stopped.wait(self.restart_delay):
+            for index, process in enumerate(self._processes):
+                if process is not None and not process.is_alive():
+                    logging.warning("⚠️ Рабочий процесс %s завершился (код %s), перезапуск",
+                                    index, process.exitcode)
+                    self._spawn(index)
+
+    def dispatch(self, data: Dict):
+        """Передача обновления процессу, отвечающему за его чат"""
+        self._queues[shard_for(update_chat_id(data), self.workers)].put(data)
+
+    # --- Прием обновлений ---
+
+    def _api(self, method: str, params: Dict = None, timeout: float = 10):
+        url = f"{self.base_url or TELEGRAM_API_URL}{self.token}/{method}"
+        request = urllib.request.Request(url, data=json.dumps(params or {}).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            payload = json.load(response)
+        if not payload.get('ok'):
+            raise RuntimeError(payload.get('description', 'Bot API error'))
+        return payload['result']
+
+    def _poll(self, poll_timeout: float):
+        offset = 0
+        while not self._stopped.is_set():
+            try:
+                updates = self._api('getUpdates', {'offset': offset, 'timeout': poll_timeout},
+                                    timeout=poll_timeout + 10)
+            except Exception as e:
+                logging.error("❌ Ошибка получения обновлений: %s", e)
+                self._stopped.wait(self.restart_delay)
+                continue
+            for data in updates:
+                self.dispatch(data)
+                offset = data['update_id'] + 1
+
+    def _make_webhook_handler(self):
+        cluster = self
+        path = f"/{self.token}"
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != path:
+                    self.send_error(404)
+                    return
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                try:
+                    cluster.dispatch(json.loads(body))
+                except ValueError:
+                    self.send_error(400)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self, webhook_url: str = None, listen: str = '0.0.0.0:8443',
+              poll_timeout: float = POLL_TIMEOUT) -> 'Cluster':
+        for index in range(self.workers):
+            self._spawn(index)
+        self._start_thread(self._supervise, 'cluster-supervisor')
+
+        if webhook_url:
+            host, port = listen.rsplit(':', 1)
+            self._webhook_server = ThreadingHTTPServer((host, int(port)), self._make_webhook_handler())
+            self._start_thread(self._webhook_server.serve_forever, 'cluster-webhook')
+            self._api('setWebhook', {'url': f"{webhook_url.rstrip('/')}/{self.token}"})
+            logging.info("🌐 Вебхук принимает обновления на %s", listen)
+        else:
+            self._api('deleteWebhook')
+            self._start_thread(lambda: self._poll(poll_timeout), 'cluster-polling')
+        logging.info("🧩 Кластер запущен: рабочих процессов %s", self.workers)
+        return self
+
+    def _start_thread(self, target, name: str):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0):
+        self._stopped.set()
+        if self._webhook_server is not None:
+            self._webhook_server.shutdown()
+        for update_queue in self._queues:
+            update_queue.put(None)
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            if process is not None:
+                process.join(max(0.0, deadline - time.monotonic()))
+                if process.is_alive():
+                    process.terminate()
+
+
+def main(argv):
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    import logging_setup
+    logging_setup.setup_logging()
+
+    parser = argparse.ArgumentParser(description="Запуск бота в нескольких процессах")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--webhook-url', help="внешний адрес вебхука (без него - long polling)")
+    parser.add_argument('--listen', default='0.0.0.0:8443', help="адрес сервера вебхука")
+    parser.add_argument('--base-url', help="адрес Bot API (например, fake_telegram)")
+    args = parser.parse_args(argv)
+
+    token = os.getenv('BOT_TOKEN')
+    if not token:
+        print("Ошибка: BOT_TOKEN не найден!")
+        return 1
+
+    cluster = Cluster(token, args.workers, base_url=args.base_url).start(args.webhook_url, args.listen)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        cluster.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -14,14 +14,30 @@ class Config:
         # Настройки базы данных
         self.DB_PATH = 'filters.db'
         self.BACKUP_ENABLED = True
+        self.BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+        self.BACKUP_INTERVAL = 6 * 60 * 60  # 6 часов
+        self.BACKUP_KEEP = 28  # число хранимых снимков
+        self.LEDGER_SEAL_INTERVAL = 24 * 60 * 60  # проверка раз в сутки, переносятся прошлые месяцы
         
         # Настройки rate limiting
         self.RATE_LIMIT_MAX_REQUESTS = 10
         self.RATE_LIMIT_WINDOW = 30
         
+        # Параллельная обработка чатов (0 - обновления обрабатываются по одному)
+        self.DISPATCH_WORKERS = int(os.getenv('DISPATCH_WORKERS', '0'))
+        self.DISPATCH_MAX_PENDING = 1000
+        self.DISPATCH_MAX_PENDING_PER_CHAT = 20
+        
+        # Исходящие сообщения: лимиты Telegram (около 30 в секунду на бота, 1 в секунду в чат)
+        self.DELIVERY_GLOBAL_RATE = 30
+        self.DELIVERY_CHAT_RATE = 1
+        self.DELIVERY_CHAT_BURST = 3
+        
         # Настройки уведомлений
         self.REMINDER_CHECK_INTERVAL = 24 * 60 * 60  # 24 часа
         self.EARLY_REMINDER_DAYS = 7
+        self.REMINDER_SEND_HOUR = 10  # час отправки напоминаний (локальное время)
+        self.REMINDER_STATE_PATH = 'reminders_state.db'  # последние отправленные пороги
         
     def validate(self) -> bool:
         """Проверка корректности конфигурации"""
@@ -0,0 +1,323 @@
+"""Исходящие сообщения бота: приоритеты, ограничение частоты и повторы.
+
+Telegram допускает около 30 сообщений в секунду на бота и около одного в
+секунду в один чат; при превышении приходит RetryAfter. Все сообщения идут
+через DeliveryQueue:
+
+- у каждого чата своя очередь, и сообщения одного чата уходят по порядку;
+- ответы пользователям (INTERACTIVE) всегда берутся раньше рассылок (BULK),
+  а рассылкам достается только часть общей частоты, поэтому ответ никогда не
+  ждет за рассылкой;
+- общая и початовая частоты ограничены корзинами токенов;
+- после RetryAfter чат (или весь бот) ставится на паузу, а сообщение
+  повторяется; сетевые ошибки повторяются с экспоненциальной паузой;
+- длинный текст режется по границам строк.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from telegram.error import BadRequest, ChatMigrated, NetworkError, RetryAfter, TimedOut
+
+import metrics
+from rate_limit import TokenBucket
+
+INTERACTIVE = 0
+BULK = 1
+
+# Лимит Telegram - 4096 символов, оставляем запас
+MESSAGE_LIMIT = 4000
+
+DELIVERY_QUEUE_DEPTH = metrics.gauge('bot_delivery_queue_depth', 'Сообщения в очереди отправки',
+                                     ['priority'])
+DELIVERY_SENT = metrics.counter('bot_delivery_sent_total', 'Отправленные сообщения', ['priority'])
+DELIVERY_RETRIES = metrics.counter('bot_delivery_retries_total', 'Повторы отправки', ['reason'])
+DELIVERY_FAILED = metrics.counter('bot_delivery_failed_total', 'Сообщения, которые не удалось отправить')
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Разбиение текста на части не длиннее limit по границам строк"""
+    if len(text) <= limit:
+        return [text]
+    parts, current = [], ''
+    for line in text.split('\n'):
+        # Строка длиннее лимита режется по пробелам (или жестко)
+        while len(line) > limit:
+            cut = line.rfind(' ', 0, limit)
+            cut = cut if cut > 0 else limit
+            if current:
+                parts.append(current)
+                current = ''
+            parts.append(line[:cut])
+            line = line[cut:].lstrip(' ')
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            parts.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+
+class Delivery:
+    """Сообщение в очереди; wait() возвращает отправленное сообщение"""
+
+    def __init__(self, chat_id, text: str, priority: int, kwargs: Dict):
+        self.chat_id = chat_id
+        self.text = text
+        self.priority = priority
+        self.kwargs = kwargs
+        self.attempts = 0
+        self.result = None
+        self.error: Optional[Exception] = None
+        self._done = threading.Event()
+
+    def finish(self, result=None, error: Exception = None):
+        self.result = result
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout: float = None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("Сообщение еще не отправлено")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+# Потоков отправки по умолчанию (каждому нужно свое соединение с Bot API)
+DELIVERY_WORKERS = 4
+
+
+class DeliveryQueue:
+    """Очередь исходящих сообщений с пулом отправителей"""
+
+    def __init__(self, bot, global_rate: float = 30.0, chat_rate: float = 1.0,
+                 chat_burst: float = 3.0, bulk_share: float = 0.8, workers: int = DELIVERY_WORKERS,
+                 max_attempts: int = 5, base_delay: float = 1.0):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate)
+        # Рассылки дополнительно ограничены долей общей частоты: остаток - запас для ответов
+        self.bulk_bucket = TokenBucket(global_rate * bulk_share)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+
+        self._condition = threading.Condition()
+        self._chats: Dict = {}       # chat_id -> (deque ответов, deque рассылок)
+        self._chat_buckets: Dict = {}
+        self._ready = []             # (приоритет, порядок, chat_id)
+        self._delayed = []           # (время готовности, chat_id)
+        self._paused_until: Dict = {}
+        self._inflight = set()
+        self._global_pause = 0.0
+        self._counter = itertools.count()
+        self._depth = [0, 0]
+        self._threads = []
+        self._stopped = False
+
+    # --- Постановка ---
+
+    def send(self, chat_id, text: str, priority: int = INTERACTIVE, **kwargs) -> List[Delivery]:
+        """Постановка сообщения; длинный текст делится по строкам.
+
+        Клавиатура (reply_markup) прикрепляется к последней части.
+        """
+        parts = split_message(text)
+        markup = kwargs.pop('reply_markup', None)
+        deliveries = []
+        for index, part in enumerate(parts):
+            part_kwargs = dict(kwargs)
+            if markup is not None and index == len(parts) - 1:
+                part_kwargs['reply_markup'] = markup
+            deliveries.append(Delivery(chat_id, part, priority, part_kwargs))
+
+        with self._condition:
+            queues = self._chats.get(chat_id)
+            if queues is None:
+                queues = self._chats[chat_id] = (deque(), deque())
+            queues[priority].extend(deliveries)
+            self._depth[priority] += len(deliveries)
+            self._update_depth()
+            self._schedule(chat_id, priority)
+            self._condition.notify()
+        return deliveries
+
+    def broadcast(self, chat_ids, text: str, **kwargs) -> List[Delivery]:
+        """Рассылка с низким приоритетом"""
+        deliveries = []
+        for chat_id in chat_ids:
+            deliveries.extend(self.send(chat_id, text, BULK, **kwargs))
+        return deliveries
+
+    def _schedule(self, chat_id, priority: int):
+        """Постановка чата в очередь готовых (под блокировкой)"""
+        if chat_id in self._inflight or chat_id in self._paused_until:
+            return
+        heapq.heappush(self._ready, (priority, next(self._counter), chat_id))
+
+    def _update_depth(self):
+        DELIVERY_QUEUE_DEPTH.set(self._depth[INTERACTIVE], priority='interactive')
+        DELIVERY_QUEUE_DEPTH.set(self._depth[BULK], priority='bulk')
+
+    def pending_count(self) -> int:
+        with self._condition:
+            return sum(self._depth)
+
+    # --- Отправка ---
+
+    def start(self) -> 'DeliveryQueue':
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"delivery-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        """Остановка после отправки очереди (не дольше timeout секунд)"""
+        deadline = time.monotonic() + timeout
+        while self.pending_count() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _promote_delayed(self, now: float):
+        while self._delayed and self._delayed[0][0] <= now:
+            _, chat_id = heapq.heappop(self._delayed)
+            # Более поздняя пауза того же чата (например, после RetryAfter) остается в силе
+            if self._paused_until.get(chat_id, 0) > now:
+                continue
+            self._paused_until.pop(chat_id, None)
+            queues = self._chats.get(chat_id)
+            if queues is not None:
+                self._schedule(chat_id, INTERACTIVE if queues[INTERACTIVE] else BULK)
+
+    def _pause_chat(self, chat_id, delay: float):
+        ready_at = time.monotonic() + delay
+        self._paused_until[chat_id] = ready_at
+        heapq.heappush(self._delayed, (ready_at, chat_id))
+
+    def _take(self) -> Optional[Delivery]:
+        """Следующее сообщение: лучший по приоритету чат, не занятый и не на паузе"""
+        with self._condition:
+            while not self._stopped:
+                now = time.monotonic()
+                self._promote_delayed(now)
+                if now < self._global_pause:
+                    self._condition.wait(self._global_pause - now)
+                    continue
+                bulk_wait = None
+                while self._ready:
+                    _, _, chat_id = self._ready[0]
+                    queues = self._chats.get(chat_id)
+                    if chat_id in self._inflight or chat_id in self._paused_until or queues is None:
+                        heapq.heappop(self._ready)
+                        continue
+                    priority = INTERACTIVE if queues[INTERACTIVE] else BULK
+                    if priority == BULK:
+                        # Квота рассылок проверяется здесь, а не в потоке отправки:
+                        # отправитель, ждущий квоты рассылки, не взял бы готовый
+                        # ответ. Ответы в куче идут раньше, дальше только рассылки
+                        bulk_wait = self.bulk_bucket.wait_time()
+                        if bulk_wait > 0:
+                            break
+                    heapq.heappop(self._ready)
+                    bucket = self._chat_bucket(chat_id)
+                    if not bucket.try_acquire():
+                        self._pause_chat(chat_id, bucket.wait_time())
+                        continue
+                    if priority == BULK:
+                        self.bulk_bucket.try_acquire()
+                    delivery = queues[priority].popleft()
+                    self._inflight.add(chat_id)
+                    return delivery
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                if bulk_wait:
+                    timeout = bulk_wait if timeout is None else min(timeout, bulk_wait)
+                self._condition.wait(timeout)
+            return None
+
+    def _release(self, delivery: Delivery, requeue: bool = False, delay: float = 0.0):
+        chat_id = delivery.chat_id
+        with self._condition:
+            self._inflight.discard(chat_id)
+            queues = self._chats[chat_id]
+            if requeue:
+                queues[delivery.priority].appendleft(delivery)
+            else:
+                self._depth[delivery.priority] -= 1
+                self._update_depth()
+            if delay > 0:
+                self._pause_chat(chat_id, delay)
+            if queues[INTERACTIVE] or queues[BULK]:
+                self._schedule(chat_id, INTERACTIVE if queues[INTERACTIVE] else BULK)
+            else:
+                del self._chats[chat_id]
+                # Корзина чата больше не нужна, если она полная
+                bucket = self._chat_buckets.get(chat_id)
+                if bucket is not None and bucket.wait_time(self.chat_burst) == 0:
+                    del self._chat_buckets[chat_id]
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            delivery = self._take()
+            if delivery is None:
+                return
+            self.global_bucket.acquire()
+            self._deliver(delivery)
+
+    def _deliver(self, delivery: Delivery):
+        delivery.attempts += 1
+        try:
+            message = self.bot.send_message(chat_id=delivery.chat_id, text=delivery.text,
+                                            **delivery.kwargs)
+        except RetryAfter as e:
+            DELIVERY_RETRIES.inc(reason='retry_after')
+            logging.warning("⏳ Telegram просит подождать %s с (чат %s)", e.retry_after, delivery.chat_id)
+            with self._condition:
+                # RetryAfter относится к боту целиком: пауза для всех отправителей
+                self._global_pause = max(self._global_pause, time.monotonic() + e.retry_after)
+            self._release(delivery, requeue=True, delay=e.retry_after)
+        except ChatMigrated as e:
+            delivery.finish(error=e)
+            self._release(delivery)
+            self.send(e.new_chat_id, delivery.text, delivery.priority, **delivery.kwargs)
+        except BadRequest as e:
+            self._fail(delivery, e)
+        except (TimedOut, NetworkError) as e:
+            if delivery.attempts >= self.max_attempts:
+                self._fail(delivery, e)
+                return
+            DELIVERY_RETRIES.inc(reason='network')
+            self._release(delivery, requeue=True,
+                          delay=self.base_delay * 2 ** (delivery.attempts - 1))
+        except Exception as e:
+            self._fail(delivery, e)
+        else:
+            DELIVERY_SENT.inc(priority='interactive' if delivery.priority == INTERACTIVE else 'bulk')
+            delivery.finish(message)
+            self._release(delivery)
+
+    def _fail(self, delivery: Delivery, error: Exception):
+        DELIVERY_FAILED.inc()
+        logging.error("❌ Не удалось отправить сообщение в чат %s: %s", delivery.chat_id, error)
+        delivery.finish(error=error)
+        self._release(delivery)
@@ -0,0 +1,455 @@
+"""Локальная замена Google Sheets API для тестов синхронизации.
+
+Сервер хранит таблицы в памяти и понимает запросы, которые делает gspread:
+метаданные таблицы, values get/update/append/batchUpdate, spreadsheets
+batchUpdate (addSheet, updateSheetProperties, deleteDimension) и создание
+файла через Drive. Ошибки можно подмешивать к ответам (inject_error), чтобы
+проверять повторы и возобновление по контрольной точке.
+
+Клиент gspread подключается через транспорт, подменяющий адреса Google:
+
+    server = FakeSheetsServer().start()
+    client = gspread.Client(None, session=SheetsTransport(server.base_url))
+"""
+import itertools
+import json
+import re
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit
+
+GOOGLE_PREFIXES = ('https://sheets.googleapis.com', 'https://www.googleapis.com')
+
+_CELL = re.compile(r'^([A-Z]*)(\d*)$')
+
+
+def _column_index(letters: str) -> int:
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index
+
+
+def _parse_range(range_name: str):
+    """Название листа и границы диапазона A1 (None - до края листа)"""
+    title, _, cells = range_name.rpartition('!')
+    if not title:
+        title, cells = cells, ''
+    if title.startswith("'") and title.endswith("'"):
+        title = title[1:-1].replace("''", "'")
+    if not cells:
+        return title, (1, 1, None, None)
+
+    first, _, last = cells.partition(':')
+    last = last or first
+    col1, row1 = _CELL.match(first).groups()
+    col2, row2 = _CELL.match(last).groups()
+    return title, (
+        int(row1) if row1 else 1,
+        _column_index(col1) if col1 else 1,
+        int(row2) if row2 else None,
+        _column_index(col2) if col2 else None,
+    )
+
+
+class SheetsAPIError(Exception):
+    """Ответ сервера с кодом ошибки"""
+
+    def __init__(self, status: int, message: str, reason: str = 'INVALID_ARGUMENT'):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+
+
+class FakeSheet:
+    """Лист таблицы: сетка значений фиксированного размера"""
+
+    def __init__(self, sheet_id: int, title: str, index: int, rows: int = 1000, cols: int = 26):
+        self.sheet_id = sheet_id
+        self.title = title
+        self.index = index
+        self.row_count = rows
+        self.col_count = cols
+        self.cells: List[List] = []
+
+    def properties(self) -> Dict:
+        return {
+            'sheetId': self.sheet_id,
+            'title': self.title,
+            'index': self.index,
+            'sheetType': 'GRID',
+            'gridProperties': {'rowCount': self.row_count, 'columnCount': self.col_count},
+        }
+
+    def read(self, bounds, major_dimension: str = 'ROWS') -> List[List]:
+        row1, col1, row2, col2 = bounds
+        row2 = min(row2 or self.row_count, self.row_count)
+        col2 = min(col2 or self.col_count, self.col_count)
+        values = []
+        for row in range(row1, row2 + 1):
+            source = self.cells[row - 1] if row <= len(self.cells) else []
+            values.append([source[col - 1] if col <= len(source) else None
+                           for col in range(col1, col2 + 1)])
+        if major_dimension == 'COLUMNS':
+            values = [list(column) for column in zip(*values)]
+        # Как и настоящий API, пустые ячейки и строки в конце не возвращаются
+        trimmed = []
+        for line in values:
+            while line and line[-1] in (None, ''):
+                line.pop()
+            trimmed.append(['' if value is None else value for value in line])
+        while trimmed and not trimmed[-1]:
+            trimmed.pop()
+        return trimmed
+
+    def write(self, bounds, values: List[List]):
+        row1, col1 = bounds[0], bounds[1]
+        height = len(values)
+        width = max((len(line) for line in values), default=0)
+        if row1 + height - 1 > self.row_count or col1 + width - 1 > self.col_count:
+            raise SheetsAPIError(400, f"Range exceeds grid limits of sheet '{self.title}'")
+        for offset, line in enumerate(values):
+            row = row1 + offset
+            while len(self.cells) < row:
+                self.cells.append([])
+            target = self.cells[row - 1]
+            if len(target) < col1 - 1 + len(line):
+                target.extend([None] * (col1 - 1 + len(line) - len(target)))
+            target[col1 - 1:col1 - 1 + len(line)] = line
+        return height, width
+
+    def last_filled_row(self) -> int:
+        for row in range(len(self.cells), 0, -1):
+            if any(value not in (None, '') for value in self.cells[row - 1]):
+                return row
+        return 0
+
+    def delete_rows(self, start: int, end: int):
+        del self.cells[start:end]
+        self.row_count -= end - start
+
+
+class FakeSpreadsheet:
+    def __init__(self, spreadsheet_id: str, title: str):
+        self.id = spreadsheet_id
+        self.title = title
+        self.sheets: List[FakeSheet] = []
+        self.version = 1
+        self.permissions: List[Dict] = []
+
+    def sheet(self, title: str) -> FakeSheet:
+        for sheet in self.sheets:
+            if sheet.title == title:
+                return sheet
+        raise SheetsAPIError(400, f"Unable to parse range: {title}")
+
+    def metadata(self) -> Dict:
+        return {
+            'spreadsheetId': self.id,
+            'properties': {'title': self.title, 'locale': 'ru_RU', 'timeZone': 'Europe/Moscow'},
+            'sheets': [{'properties': sheet.properties()} for sheet in self.sheets],
+        }
+
+
+class FakeSheetsServer:
+    """HTTP-сервер с подмножеством Sheets API v4 и Drive API v3 в памяти"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.spreadsheets: Dict[str, FakeSpreadsheet] = {}
+        self.requests: List[tuple] = []
+        self._errors: List[Dict] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeSheetsServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-sheets', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # --- Данные ---
+
+    def create_spreadsheet(self, title: str, sheet_title: str = 'Лист1',
+                           rows: int = 1000, cols: int = 26) -> FakeSpreadsheet:
+        with self._lock:
+            spreadsheet = FakeSpreadsheet(f"fake-{next(self._ids)}", title)
+            spreadsheet.sheets.append(FakeSheet(0, sheet_title, 0, rows, cols))
+            self.spreadsheets[spreadsheet.id] = spreadsheet
+            return spreadsheet
+
+    def inject_error(self, status: int, times: int = 1, method: str = None,
+                     path: str = None, retry_after: str = None):
+        """Ответ с ошибкой на следующие times подходящих запросов.
+
+        status=0 - обрыв соединения без ответа. method и path (подстрока
+        пути) ограничивают, к каким запросам применяется ошибка.
+        """
+        with self._lock:
+            self._errors.append({'status': status, 'times': times, 'method': method,
+                                 'path': path, 'retry_after': retry_after})
+
+    def count_requests(self, method: str = None, path: str = None) -> int:
+        with self._lock:
+            return sum(1 for m, p in self.requests
+                       if (method is None or m == method) and (path is None or path in p))
+
+    def _take_error(self, method: str, path: str) -> Optional[Dict]:
+        with self._lock:
+            self.requests.append((method, path))
+            for error in self._errors:
+                if error['method'] and error['method'] != method:
+                    continue
+                if error['path'] and error['path'] not in path:
+                    continue
+                error['times'] -= 1
+                if error['times'] <= 0:
+                    self._errors.remove(error)
+                return error
+        return None
+
+    # --- Обработка запросов ---
+
+    def handle(self, method: str, path: str, query: Dict, body: Dict):
+        with self._lock:
+            if path.startswith('/drive/v3/files'):
+                return self._drive(method, path[len('/drive/v3/files'):].strip('/'), body)
+            if not path.startswith('/v4/spreadsheets/'):
+                raise SheetsAPIError(404, f"Unknown path {path}", 'NOT_FOUND')
+
+            rest = path[len('/v4/spreadsheets/'):]
+            spreadsheet_id, _, rest = rest.partition('/')
+            spreadsheet_id, _, action = spreadsheet_id.partition(':')
+            spreadsheet = self.spreadsheets.get(spreadsheet_id)
+            if spreadsheet is None:
+                raise SheetsAPIError(404, "Requested entity was not found.", 'NOT_FOUND')
+
+            if not rest:
+                if action == 'batchUpdate':
+                    return self._batch_update(spreadsheet, body)
+                return spreadsheet.metadata()
+
+            rest = rest[len('values'):].lstrip('/')
+            if rest == ':batchUpdate':
+                updated = 0
+                for item in body.get('data', []):
+                    updated += self._write(spreadsheet, item['range'], item.get('values', []))
+                return {'spreadsheetId': spreadsheet.id, 'totalUpdatedRows': updated}
+            if rest.endswith(':append'):
+                return self._append(spreadsheet, rest[:-len(':append')], body.get('values', []))
+            if method == 'GET':
+                title, bounds = _parse_range(rest)
+                values = spreadsheet.sheet(title).read(bounds, query.get('majorDimension', 'ROWS'))
+                response = {'range': rest, 'majorDimension': query.get('majorDimension', 'ROWS')}
+                if values:
+                    response['values'] = values
+                return response
+            if method == 'PUT':
+                rows = self._write(spreadsheet, rest, body.get('values', []))
+                return {'spreadsheetId': spreadsheet.id, 'updatedRange': rest, 'updatedRows': rows}
+        raise SheetsAPIError(404, f"Unknown path {path}", 'NOT_FOUND')
+
+    def _write(self, spreadsheet: FakeSpreadsheet, range_name: str, values: List[List]) -> int:
+        title, bounds = _parse_range(range_name)
+        rows, _ = spreadsheet.sheet(title).write(bounds, values)
+        spreadsheet.version += 1
+        return rows
+
+    def _append(self, spreadsheet: FakeSpreadsheet, range_name: str, values: List[List]) -> Dict:
+        title, bounds = _parse_range(range_name)
+        sheet = spreadsheet.sheet(title)
+        first_row = max(sheet.last_filled_row(), bounds[0] - 1) + 1
+        # append добавляет строки в сетку, если места не хватает
+        sheet.row_count = max(sheet.row_count, first_row + len(values) - 1)
+        sheet.write((first_row, bounds[1], None, None), values)
+        spreadsheet.version += 1
+        return {'spreadsheetId': spreadsheet.id,
+                'updates': {'updatedRange': f"'{title}'!A{first_row}", 'updatedRows': len(values)}}
+
+    def _batch_update(self, spreadsheet: FakeSpreadsheet, body: Dict) -> Dict:
+        replies = []
+        for request in body.get('requests', []):
+            if 'addSheet' in request:
+                properties = request['addSheet']['properties']
+                grid = properties.get('gridProperties', {})
+                sheet = FakeSheet(max(s.sheet_id for s in spreadsheet.sheets) + 1, properties['title'],
+                                  len(spreadsheet.sheets), grid.get('rowCount', 1000),
+                                  grid.get('columnCount', 26))
+                spreadsheet.sheets.append(sheet)
+                replies.append({'addSheet': {'properties': sheet.properties()}})
+                continue
+            if 'updateSheetProperties' in request:
+                properties = request['updateSheetProperties']['properties']
+                sheet = self._sheet_by_id(spreadsheet, properties['sheetId'])
+                grid = properties.get('gridProperties', {})
+                sheet.row_count = grid.get('rowCount', sheet.row_count)
+                sheet.col_count = grid.get('columnCount', sheet.col_count)
+                del sheet.cells[sheet.row_count:]
+            elif 'deleteDimension' in request:
+                target = request['deleteDimension']['range']
+                sheet = self._sheet_by_id(spreadsheet, target['sheetId'])
+                if target['dimension'] != 'ROWS':
+                    raise SheetsAPIError(400, "Only ROWS dimension is supported")
+                sheet.delete_rows(target['startIndex'], target['endIndex'])
+            # Оформление (форматы, фильтры, правила) на данные не влияет
+            replies.append({})
+        spreadsheet.version += 1
+        return {'spreadsheetId': spreadsheet.id, 'replies': replies}
+
+    @staticmethod
+    def _sheet_by_id(spreadsheet: FakeSpreadsheet, sheet_id: int) -> FakeSheet:
+        for sheet in spreadsheet.sheets:
+            if sheet.sheet_id == sheet_id:
+                return sheet
+        raise SheetsAPIError(400, f"No grid with id: {sheet_id}")
+
+    def _drive(self, method: str, rest: str, body: Dict) -> Dict:
+        file_id, _, sub = rest.partition('/')
+        if not file_id and method == 'POST':
+            spreadsheet = FakeSpreadsheet(f"fake-{next(self._ids)}", body.get('name', ''))
+            spreadsheet.sheets.append(FakeSheet(0, 'Лист1', 0))
+            self.spreadsheets[spreadsheet.id] = spreadsheet
+            return {'id': spreadsheet.id, 'name': spreadsheet.title}
+
+        spreadsheet = self.spreadsheets.get(file_id)
+        if spreadsheet is None:
+            raise SheetsAPIError(404, "File not found", 'NOT_FOUND')
+        if sub == 'permissions' and method == 'POST':
+            spreadsheet.permissions.append(dict(body))
+            return {'id': str(len(spreadsheet.permissions)), **body}
+        return {'id': spreadsheet.id, 'name': spreadsheet.title, 'version': str(spreadsheet.version)}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _dispatch(self, method: str):
+                parts = urlsplit(self.path)
+                path = unquote(parts.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+
+                error = server._take_error(method, path)
+                if error and error['status'] == 0:
+                    # Обрыв соединения без ответа
+                    self.close_connection = True
+                    self.connection.close()
+                    return
+                if error:
+                    headers = {'Retry-After': error['retry_after']} if error['retry_after'] else {}
+                    return self._reply(error['status'], {'error': {
+                        'code': error['status'], 'message': 'Injected error', 'status': 'UNAVAILABLE'
+                    }}, headers)
+
+                try:
+                    body = json.loads(raw) if raw else {}
+                    self._reply(200, server.handle(method, path, dict(parse_qsl(parts.query)), body))
+                except SheetsAPIError as e:
+                    self._reply(e.status, {'error': {'code': e.status, 'message': str(e), 'status': e.reason}})
+
+            def _reply(self, status: int, payload: Dict, headers: Dict = None):
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._dispatch('GET')
+
+            def do_POST(self):
+                self._dispatch('POST')
+
+            def do_PUT(self):
+                self._dispatch('PUT')
+
+            def do_DELETE(self):
+                self._dispatch('DELETE')
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _encode(payload) -> bytes:
+    return json.dumps(payload, ensure_ascii=False).encode('utf-8')
+
+
+class FakeResponse:
+    """Ответ в объеме, который использует gspread (как у requests.Response)"""
+
+    def __init__(self, status_code: int, headers, content: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.ok = status_code < 400
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8')
+
+    def json(self):
+        return json.loads(self.content or b'null')
+
+
+class SheetsTransport:
+    """Сессия для gspread.Client: запросы к адресам Google уходят на base_url.
+
+    Сетевые ошибки (обрыв, отказ в соединении) пробрасываются как OSError,
+    так же как у requests.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+        self.headers = {}
+
+    def request(self, method: str, url: str, params=None, json=None, data=None,
+                files=None, headers=None, timeout=None) -> FakeResponse:
+        for prefix in GOOGLE_PREFIXES:
+            if url.startswith(prefix):
+                url = self.base_url + url[len(prefix):]
+                break
+        if params:
+            url += '?' + urlencode(params, doseq=True)
+        payload = _encode(json) if json is not None else data
+        request = urllib.request.Request(url, data=payload, method=method.upper(),
+                                         headers={'Content-Type': 'application/json', **self.headers,
+                                                  **(headers or {})})
+        try:
+            with urllib.request.urlopen(request, timeout=timeout or 30) as response:
+                return FakeResponse(response.status, response.headers, response.read())
+        except urllib.error.HTTPError as e:
+            return FakeResponse(e.code, e.headers, e.read())
+        except urllib.error.URLError as e:
+            raise ConnectionError(str(e.reason)) from e
+
+    def get(self, url, **kwargs):
+        return self.request('get', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('post', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('put', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('delete', url, **kwargs)
@@ -0,0 +1,217 @@
+"""Локальная замена api.telegram.org для нагрузочных тестов и воспроизведения.
+
+Сервер понимает методы Bot API, которыми пользуется бот: getMe, getUpdates
+(с длинным опросом), deleteWebhook и любые send*/edit*. Отправленные ботом
+сообщения сохраняются, чтобы тест мог дождаться ответа и измерить задержку.
+Бот подключается через base_url:
+
+    server = FakeTelegramServer().start()
+    updater = Updater(token, base_url=server.base_url)
+"""
+import email.parser
+import email.policy
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qsl
+
+FAKE_TOKEN = '123456:FAKE-TOKEN'
+
+
+class SentMessage:
+    """Сообщение, отправленное ботом"""
+
+    __slots__ = ('chat_id', 'method', 'text', 'sent_at', 'params')
+
+    def __init__(self, chat_id, method, text, params):
+        self.chat_id = chat_id
+        self.method = method
+        self.text = text
+        self.sent_at = time.perf_counter()
+        self.params = params
+
+
+class FakeTelegramServer:
+    """HTTP-сервер с подмножеством Bot API в памяти процесса"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0):
+        self.latency = latency
+        self._updates: List[Dict] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._replies: Dict[int, List[SentMessage]] = {}
+        self.sent_count = 0
+        self.requests = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self) -> 'FakeTelegramServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-telegram', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # --- Входящие обновления ---
+
+    def push_update(self, update: Dict) -> int:
+        """Постановка обновления в очередь getUpdates"""
+        with self._condition:
+            update = dict(update)
+            update['update_id'] = next(self._update_ids)
+            self._updates.append(update)
+            self._condition.notify_all()
+        return update['update_id']
+
+    def message_update(self, user_id: int, text: str, chat_id: int = None) -> Dict:
+        """Обновление с текстовым сообщением пользователя"""
+        chat_id = chat_id if chat_id is not None else user_id
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"},
+            'text': text,
+        }
+        if text.startswith('/'):
+            command = text.split()[0]
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+        return {'message': message}
+
+    def send_text(self, user_id: int, text: str, chat_id: int = None) -> int:
+        return self.push_update(self.message_update(user_id, text, chat_id))
+
+    # --- Ответы бота ---
+
+    def reply_count(self, chat_id: int) -> int:
+        with self._condition:
+            return len(self._replies.get(chat_id, ()))
+
+    def replies(self, chat_id: int) -> List[SentMessage]:
+        with self._condition:
+            return list(self._replies.get(chat_id, ()))
+
+    def wait_for_replies(self, chat_id: int, count: int, timeout: float = 10.0) -> bool:
+        """Ожидание, пока в чат придет count сообщений от бота"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while len(self._replies.get(chat_id, ())) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    # --- Bot API ---
+
+    def _call(self, method: str, params: Dict):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'}
+        if method in ('deleteWebhook', 'setWebhook', 'answerCallbackQuery', 'sendChatAction'):
+            return True
+        if method == 'getUpdates':
+            return self._get_updates(params)
+        if method.startswith(('send', 'edit')):
+            return self._record_message(method, params)
+        return None
+
+    def _get_updates(self, params: Dict):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        deadline = time.monotonic() + float(params.get('timeout') or 0)
+        with self._condition:
+            if offset:
+                self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return self._updates[:limit]
+
+    def _record_message(self, method: str, params: Dict):
+        if self.latency:
+            time.sleep(self.latency)
+        chat_id = int(params.get('chat_id', 0))
+        text = params.get('text') or params.get('caption') or ''
+        with self._condition:
+            self._replies.setdefault(chat_id, []).append(SentMessage(chat_id, method, text, params))
+            self.sent_count += 1
+            self._condition.notify_all()
+            message_id = next(self._message_ids)
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': 1, 'is_bot': True, 'first_name': 'FakeBot'},
+            'text': text,
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                self._dispatch(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+
+            def do_GET(self):
+                self._dispatch(b'')
+
+            def _dispatch(self, body: bytes):
+                path, _, query = self.path.partition('?')
+                method = path.rsplit('/', 1)[-1]
+                params = dict(parse_qsl(query))
+                params.update(_parse_body(self.headers.get('Content-Type', ''), body))
+                with server._condition:
+                    server.requests += 1
+
+                result = server._call(method, params)
+                if result is None:
+                    status, payload = 404, {'ok': False, 'error_code': 404,
+                                            'description': 'Not Found: method not found'}
+                else:
+                    status, payload = 200, {'ok': True, 'result': result}
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _parse_body(content_type: str, body: bytes) -> Dict:
+    """Параметры запроса: JSON, form-urlencoded или multipart (sendDocument)"""
+    if not body:
+        return {}
+    if content_type.startswith('application/json'):
+        return json.loads(body)
+    if content_type.startswith('multipart/form-data'):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body
+        )
+        params = {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            payload = part.get_payload(decode=True) or b''
+            params[name] = len(payload) if part.get_filename() else payload.decode('utf-8')
+        return params
+    return dict(parse_qsl(body.decode('utf-8')))
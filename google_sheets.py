@@ -1,12 +1,231 @@
-import gspread
-import pandas as pd
+import functools
 import logging
-import asyncio
-from datetime import datetime, timedelta
+import hashlib
+import json
+import os
+import threading
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
 from typing import List, Dict, Optional, Tuple
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+
+from sheets_retry import install_retry
+
+# gspread и клиенты Google API импортируются внутри методов: они тяжелые
+# (время запуска и десятки МБ памяти), а нужны только при первой синхронизации.
+
+GOOGLE_SCOPES = [
+    "https://spreadsheets.google.com/feeds",
+    "https://www.googleapis.com/auth/drive",
+    "https://www.googleapis.com/auth/spreadsheets"
+]
+
+# Пороги статуса фильтра: (осталось дней не больше, иконка, статус)
+STATUS_THRESHOLDS = [
+    (0, "🔴", "ПРОСРОЧЕН"),
+    (7, "🟡", "СКОРО ИСТЕЧЕТ"),
+    (30, "🟠", "ВНИМАНИЕ"),
+]
+NORMAL_STATUS = ("🟢", "НОРМА")
+
+
+def get_status_icon_and_text(days_until_expiry: int) -> Tuple[str, str]:
+    """Получение иконки и текста статуса"""
+    for max_days, icon, status in STATUS_THRESHOLDS:
+        if days_until_expiry <= max_days:
+            return icon, status
+    return NORMAL_STATUS
+
+
+# Поля фильтра, без которых строку таблицы не построить
+REQUIRED_FILTER_FIELDS = ('id', 'filter_type', 'location', 'lifetime_days', 'user_id',
+                          'expiry_date', 'last_change')
+
+# Таблицы для пакетного расчета статуса: индекс статуса = bisect_left(пороги, дни)
+_STATUS_LIMITS = [max_days for max_days, _, _ in STATUS_THRESHOLDS]
+_STATUS_TABLE = [(icon, status) for _, icon, status in STATUS_THRESHOLDS] + [NORMAL_STATUS]
+
+
+def _parse_iso_date(value: str) -> date:
+    """Разбор даты ГГГГ-ММ-ДД; для строгого формата без медленного strptime"""
+    if len(value) == 10 and value[4] == '-' and value[7] == '-' and value[:4].isdigit():
+        return date.fromisoformat(value)
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _parse_filter_dates(expiry_value: str, last_change_value: str) -> Tuple[int, str, str]:
+    """Порядковый номер даты истечения и отформатированные даты фильтра"""
+    expiry_date = _parse_iso_date(expiry_value)
+    last_change = _parse_iso_date(last_change_value)
+    return (expiry_date.toordinal(),
+            f"{last_change.day:02d}.{last_change.month:02d}.{last_change.year}",
+            f"{expiry_date.day:02d}.{expiry_date.month:02d}.{expiry_date.year}")
+
+
+def _days_and_statuses(expiry_ordinals: List[int], today_ordinal: int) -> Tuple[List[int], List[int]]:
+    """Остаток дней и индексы статусов сразу для всех фильтров"""
+    try:
+        import numpy as np
+    except ImportError:
+        days = [ordinal - today_ordinal for ordinal in expiry_ordinals]
+        return days, [bisect_left(_STATUS_LIMITS, d) for d in days]
+
+    days = np.fromiter(expiry_ordinals, dtype=np.int64, count=len(expiry_ordinals)) - today_ordinal
+    statuses = np.searchsorted(_STATUS_LIMITS, days, side='left')
+    return days.tolist(), statuses.tolist()
+
+
+def filters_to_sheets_data(filters: List[Dict], user_info: Dict = None,
+                           date_cache: Dict = None) -> List[List]:
+    """Конвертация фильтров в данные для таблицы.
+
+    Даты каждой версии фильтра разбираются один раз: результат хранится в
+    date_cache по id и значениям дат. Остаток дней и статусы считаются одной
+    операцией над массивом, а данные пользователя - один раз на вызов.
+    """
+    today_ordinal = datetime.now().date().toordinal()
+    user_columns = [
+        user_info.get('username', '') if user_info else '',
+        user_info.get('phone', '') if user_info else '',
+        user_info.get('email', '') if user_info else ''
+    ]
+
+    cache = date_cache if date_cache is not None else {}
+    used_keys = set()
+    valid_filters = []
+    parsed_dates = []
+    for f in filters:
+        try:
+            # Проверяем поля заранее, чтобы пропустить фильтр целиком
+            missing = [field for field in REQUIRED_FILTER_FIELDS if field not in f]
+            if missing:
+                raise ValueError(f"нет обязательных полей: {', '.join(missing)}")
+            for field in ('created_at', 'updated_at'):
+                if f.get(field) and not isinstance(f[field], str):
+                    raise ValueError(f"поле {field} должно быть строкой")
+
+            key = (f['id'], str(f['expiry_date']), str(f['last_change']))
+            parsed = cache.get(key)
+            if parsed is None:
+                parsed = _parse_filter_dates(key[1], key[2])
+                cache[key] = parsed
+            used_keys.add(key)
+        except Exception as e:
+            logging.error("❌ Ошибка конвертации фильтра %s: %s", f.get('id', 'N/A'), e)
+            continue
+        valid_filters.append(f)
+        parsed_dates.append(parsed)
+
+    # В кэше остаются только актуальные версии фильтров
+    if date_cache is not None and len(date_cache) > len(used_keys):
+        for key in [k for k in date_cache if k not in used_keys]:
+            del date_cache[key]
+
+    days, statuses = _days_and_statuses([p[0] for p in parsed_dates], today_ordinal)
+    username, phone, email = user_columns
+
+    sheet_data = []
+    for f, parsed, days_until_expiry, status_index in zip(valid_filters, parsed_dates, days, statuses):
+        icon, status = _STATUS_TABLE[status_index]
+        created_at = f.get('created_at')
+        updated_at = f.get('updated_at')
+        sheet_data.append([
+            f['id'],
+            f['filter_type'],
+            f['location'],
+            parsed[1],
+            parsed[2],
+            days_until_expiry,
+            status,
+            icon,
+            f['lifetime_days'],
+            created_at[:10] if created_at else '',
+            updated_at[:10] if updated_at else '',
+            f['user_id'],
+            username,
+            phone,
+            email
+        ])
+    return sheet_data
+
+
+class GoogleClients:
+    """Авторизованные клиенты Google для одного сервисного аккаунта.
+
+    Экземпляры живут в общем пуле процесса: токен обновляется один раз под
+    блокировкой, gspread работает через одну keep-alive сессию, а документ
+    discovery для Drive берется из пакета и разбирается один раз. Все запросы
+    gspread проходят через общую политику повторов и квоту (sheets_retry).
+    """
+
+    def __init__(self, credentials_file: str):
+        import gspread
+        from google.oauth2.service_account import Credentials
+        from google.auth.transport.requests import AuthorizedSession, Request
+
+        self.credentials = Credentials.from_service_account_file(
+            credentials_file, scopes=GOOGLE_SCOPES
+        )
+        self._auth_request = Request()
+        self._refresh_lock = threading.Lock()
+        self._drive_local = threading.local()
+        self.refresh_token()
+
+        self.session = AuthorizedSession(self.credentials)
+        self.gspread_client = install_retry(
+            gspread.Client(auth=self.credentials, session=self.session)
+        )
+
+    def refresh_token(self):
+        """Обновление токена, если он истек (один раз для всех потоков)"""
+        if self.credentials.valid:
+            return
+        with self._refresh_lock:
+            if not self.credentials.valid:
+                self.credentials.refresh(self._auth_request)
+
+    def drive_service(self):
+        """Клиент Drive API; httplib2 не потокобезопасен, поэтому свой на поток"""
+        service = getattr(self._drive_local, 'service', None)
+        if service is None:
+            from googleapiclient.discovery import build_from_document
+            service = build_from_document(_drive_discovery_document(), credentials=self.credentials)
+            self._drive_local.service = service
+        return service
+
+
+_client_pool = {}
+_client_pool_lock = threading.Lock()
+_drive_discovery = None
+
+
+def _drive_discovery_document() -> str:
+    """Документ discovery Drive v3 из пакета googleapiclient (без сетевого запроса)"""
+    global _drive_discovery
+    if _drive_discovery is None:
+        from googleapiclient.discovery_cache import get_static_doc
+        _drive_discovery = get_static_doc('drive', 'v3')
+    return _drive_discovery
+
+
+def get_google_clients(credentials_file: str = 'credentials.json') -> GoogleClients:
+    """Клиенты из общего пула процесса (создаются при первом обращении)"""
+    path = os.path.abspath(credentials_file)
+    key = (path, os.path.getmtime(path))
+    with _client_pool_lock:
+        clients = _client_pool.get(key)
+        if clients is None:
+            clients = GoogleClients(path)
+            _client_pool[key] = clients
+            logging.info("✅ Google Sheets клиент успешно настроен")
+    clients.refresh_token()
+    return clients
+
+
+def reset_google_clients():
+    """Очистка пула клиентов (например, после замены ключа)"""
+    with _client_pool_lock:
+        _client_pool.clear()
+
 
 class GoogleSheetsManager:
     def __init__(self, credentials_file: str = 'credentials.json'):
@@ -14,60 +233,63 @@ class GoogleSheetsManager:
         self.client = None
         self.spreadsheet = None
         self.worksheet = None
-        self.drive_service = None
+        self._clients = None
+        self._date_cache = {}
         self._setup_client()
     
     def _setup_client(self):
         """Настройка клиента Google Sheets и Drive"""
         try:
-            # Определяем scope
-            scope = [
-                "https://spreadsheets.google.com/feeds",
-                "https://www.googleapis.com/auth/drive",
-                "https://www.googleapis.com/auth/spreadsheets"
-            ]
-            
-            # Создаем credentials
-            creds = Credentials.from_service_account_file(
-                self.credentials_file, scopes=scope
-            )
-            
-            # Создаем клиенты
-            self.client = gspread.authorize(creds)
-            self.drive_service = build('drive', 'v3', credentials=creds)
-            
-            logging.info("✅ Google Sheets клиент успешно настроен")
+            # Клиенты берутся из общего пула, поэтому повторная
+            # инициализация переиспользует токен и открытые соединения
+            self._clients = get_google_clients(self.credentials_file)
+            self.client = self._clients.gspread_client
             
         except Exception as e:
-            logging.error(f"❌ Ошибка настройки Google Sheets: {e}")
+            logging.error("❌ Ошибка настройки Google Sheets: %s", e)
             raise
     
-    def create_spreadsheet(self, title: str) -> str:
-        """Создание новой таблицы"""
+    @property
+    def drive_service(self):
+        """Клиент Google Drive API"""
+        return self._clients.drive_service() if self._clients else None
+    
+    def create_spreadsheet(self, title: str, share_with: List[str] = None) -> str:
+        """Создание новой таблицы.
+        
+        share_with - адреса, которым дается доступ на запись; без него (None)
+        таблица доступна на запись всем, у кого есть ссылка.
+        """
         try:
             self.spreadsheet = self.client.create(title)
             
-            # Даем доступ для чтения/записи
-            self.spreadsheet.share(None, perm_type='anyone', role='writer')
+            if share_with is None:
+                # Даем доступ для чтения/записи
+                self.spreadsheet.share(None, perm_type='anyone', role='writer')
+            else:
+                for email in share_with:
+                    self.spreadsheet.share(email, perm_type='user', role='writer', notify=False)
             
-            logging.info(f"📊 Создана таблица: {title}")
+            logging.info("📊 Создана таблица: %s", title)
             return self.spreadsheet.url
             
         except Exception as e:
-            logging.error(f"❌ Ошибка создания таблицы: {e}")
+            logging.error("❌ Ошибка создания таблицы: %s", e)
             raise
     
     def open_spreadsheet(self, spreadsheet_id: str):
         """Открытие существующей таблицы"""
         try:
             self.spreadsheet = self.client.open_by_key(spreadsheet_id)
-            logging.info(f"📊 Таблица открыта: {self.spreadsheet.title}")
+            logging.info("📊 Таблица открыта: %s", self.spreadsheet.title)
         except Exception as e:
-            logging.error(f"❌ Ошибка открытия таблицы: {e}")
+            logging.error("❌ Ошибка открытия таблицы: %s", e)
             raise
     
     def setup_worksheet(self, sheet_name: str = "Фильтры"):
         """Настройка листа с заголовками и форматированием"""
+        import gspread
+        
         try:
             # Пытаемся получить лист, если нет - создаем
             try:
@@ -97,10 +319,10 @@ class GoogleSheetsManager:
             # Настраиваем ширину колонок
             self._auto_resize_columns()
             
-            logging.info(f"📝 Лист '{sheet_name}' настроен")
+            logging.info("📝 Лист '%s' настроен", sheet_name)
             
         except Exception as e:
-            logging.error(f"❌ Ошибка настройки листа: {e}")
+            logging.error("❌ Ошибка настройки листа: %s", e)
             raise
     
     def _apply_header_formatting(self):
@@ -138,7 +360,7 @@ class GoogleSheetsManager:
             self.spreadsheet.batch_update({"requests": requests})
             
         except Exception as e:
-            logging.error(f"❌ Ошибка форматирования заголовков: {e}")
+            logging.error("❌ Ошибка форматирования заголовков: %s", e)
     
     def _auto_resize_columns(self):
         """Автоматическая настройка ширины колонок"""
@@ -184,61 +406,25 @@ class GoogleSheetsManager:
                 self.spreadsheet.batch_update({"requests": requests})
                 
         except Exception as e:
-            logging.error(f"❌ Ошибка настройки ширины колонок: {e}")
+            logging.error("❌ Ошибка настройки ширины колонок: %s", e)
     
     def filters_to_sheets_data(self, filters: List[Dict], user_info: Dict = None) -> List[List]:
         """Конвертация фильтров в данные для таблицы"""
-        today = datetime.now().date()
-        sheet_data = []
-        
-        for f in filters:
-            try:
-                expiry_date = datetime.strptime(str(f['expiry_date']), '%Y-%m-%d').date()
-                last_change = datetime.strptime(str(f['last_change']), '%Y-%m-%d').date()
-                days_until_expiry = (expiry_date - today).days
-                
-                icon, status = self.get_status_icon_and_text(days_until_expiry)
-                
-                row = [
-                    f['id'],
-                    f['filter_type'],
-                    f['location'],
-                    last_change.strftime('%d.%m.%Y'),
-                    expiry_date.strftime('%d.%m.%Y'),
-                    days_until_expiry,
-                    status,
-                    icon,
-                    f['lifetime_days'],
-                    f.get('created_at', '')[:10] if f.get('created_at') else '',
-                    f.get('updated_at', '')[:10] if f.get('updated_at') else '',
-                    f['user_id'],
-                    user_info.get('username', '') if user_info else '',
-                    user_info.get('phone', '') if user_info else '',
-                    user_info.get('email', '') if user_info else ''
-                ]
-                sheet_data.append(row)
-            except Exception as e:
-                logging.error(f"❌ Ошибка конвертации фильтра {f.get('id', 'N/A')}: {e}")
-                continue
-        
-        return sheet_data
+        return filters_to_sheets_data(filters, user_info, self._date_cache)
     
     def get_status_icon_and_text(self, days_until_expiry: int) -> Tuple[str, str]:
         """Получение иконки и текста статуса"""
-        if days_until_expiry <= 0:
-            return "🔴", "ПРОСРОЧЕН"
-        elif days_until_expiry <= 7:
-            return "🟡", "СКОРО ИСТЕЧЕТ"
-        elif days_until_expiry <= 30:
-            return "🟠", "ВНИМАНИЕ"
-        else:
-            return "🟢", "НОРМА"
+        return get_status_icon_and_text(days_until_expiry)
     
     async def sync_filters_to_sheets(self, filters: List[Dict], user_info: Dict = None):
         """Синхронизация фильтров с Google Sheets"""
+        return self.sync_filters(filters, user_info)
+    
+    def sync_filters(self, filters: List[Dict], user_info: Dict = None):
+        """Синхронизация фильтров с Google Sheets (блокирующий вызов)"""
         try:
             if not self.worksheet:
-                await self.setup_worksheet()
+                self.setup_worksheet()
             
             # Конвертируем данные
             sheet_data = self.filters_to_sheets_data(filters, user_info)
@@ -261,12 +447,12 @@ class GoogleSheetsManager:
             # Добавляем фильтры
             self._add_filters()
             
-            logging.info(f"✅ Синхронизировано {len(sheet_data)} фильтров с Google Sheets")
+            logging.info("✅ Синхронизировано %s фильтров с Google Sheets", len(sheet_data))
             
             return len(sheet_data)
             
         except Exception as e:
-            logging.error(f"❌ Ошибка синхронизации с Google Sheets: {e}")
+            logging.error("❌ Ошибка синхронизации с Google Sheets: %s", e)
             raise
     
     def _apply_conditional_formatting(self, data_rows_count: int):
@@ -361,7 +547,7 @@ class GoogleSheetsManager:
             self.spreadsheet.batch_update({'requests': requests})
             
         except Exception as e:
-            logging.error(f"❌ Ошибка применения условного форматирования: {e}")
+            logging.error("❌ Ошибка применения условного форматирования: %s", e)
     
     def _add_filters(self):
         """Добавление фильтров к данным"""
@@ -385,7 +571,7 @@ class GoogleSheetsManager:
             self.spreadsheet.batch_update({"requests": requests})
             
         except Exception as e:
-            logging.error(f"❌ Ошибка добавления фильтров: {e}")
+            logging.error("❌ Ошибка добавления фильтров: %s", e)
     
     def get_spreadsheet_url(self) -> str:
         """Получение URL таблицы"""
@@ -397,6 +583,8 @@ class GoogleSheetsManager:
     
     async def create_summary_sheet(self):
         """Создание листа с суммарной статистикой"""
+        import gspread
+        
         try:
             # Пытаемся создать или получить лист "Статистика"
             try:
@@ -458,7 +646,548 @@ class GoogleSheetsManager:
             logging.info("✅ Лист статистики создан/обновлен")
             
         except Exception as e:
-            logging.error(f"❌ Ошибка создания листа статистики: {e}")
+            logging.error("❌ Ошибка создания листа статистики: %s", e)
+
+# Колонки листа транзакций финансового трекера
+TRANSACTION_FIELDS = ['id', 'date', 'category', 'amount', 'type', 'description']
+TRANSACTION_HEADERS = ["ID", "Дата", "Категория", "Сумма", "Тип", "Описание"]
+
+def _column_letter(count: int) -> str:
+    """Буква последней колонки для заданного числа колонок (до 26)"""
+    return chr(ord('A') + count - 1)
+
+
+def transaction_to_row(transaction: Dict) -> List:
+    """Строка листа транзакций"""
+    return [
+        transaction.get('id', ''),
+        transaction.get('date', ''),
+        transaction.get('category', ''),
+        float(transaction.get('amount', 0)),
+        transaction.get('type', ''),
+        transaction.get('description', '')
+    ]
+
+
+def _row_hash(row: List) -> str:
+    """Хэш содержимого строки листа"""
+    payload = json.dumps(row, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def is_quota_error(error: Exception) -> bool:
+    """Является ли ошибка API превышением квоты"""
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status == 429:
+        return True
+    return status == 403 and 'rateLimitExceeded' in str(error)
+
+
+def _serialized(method):
+    """Вызов метода GoogleSheetsSync под общей блокировкой экземпляра"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class GoogleSheetsSync:
+    """Синхронизация транзакций финансового трекера с Google Sheets.
+
+    Выгрузка и загрузка выполняются порциями по chunk_size строк. После каждой
+    порции прогресс записывается в файл контрольной точки, поэтому перенос
+    большого журнала после ошибки квоты продолжается с места остановки.
+    Клиент gspread можно передать явно (например, настроенный на локальный
+    тестовый сервер fake_sheets).
+
+    Экземпляр используют одновременно поток очереди записи (sheets_outbox) и
+    фоновые операции синхронизации. apply_operations адресует строки по
+    номерам, прочитанным перед записью, поэтому все обращения к листу идут
+    под одной блокировкой: пока идет выгрузка или двусторонняя синхронизация,
+    очередь записи ждет, а не меняет лист между чтением номеров и записью.
+    """
+
+    def __init__(self, credentials_file: str = 'credentials.json',
+                 spreadsheet_id: str = None,
+                 spreadsheet_title: str = 'Финансовый трекер',
+                 sheet_name: str = 'Транзакции',
+                 chunk_size: int = 500,
+                 checkpoint_file: str = 'sync_checkpoint.json',
+                 state_file: str = 'sync_state.json',
+                 client=None):
+        self.credentials_file = credentials_file
+        self.spreadsheet_id = spreadsheet_id or os.getenv('GOOGLE_SHEET_ID')
+        self.spreadsheet_title = spreadsheet_title
+        self.sheet_name = sheet_name
+        self.chunk_size = chunk_size
+        self.checkpoint_file = checkpoint_file
+        self.state_file = state_file
+        self.client = client
+        self.spreadsheet = None
+        self.worksheet = None
+        self._worksheets = {}
+        self._lock = threading.RLock()
+
+    def set_credentials_file(self, credentials_file: str):
+        """Смена файла сервисного аккаунта"""
+        self.credentials_file = credentials_file
+        self.client = None
+        self.spreadsheet = None
+        self.worksheet = None
+        self._worksheets = {}
+
+    @_serialized
+    def authenticate(self) -> Tuple[bool, str]:
+        """Подключение к Google Sheets и открытие листа транзакций"""
+        try:
+            self._connect()
+            return True, f"Таблица: {self.spreadsheet.title}\n{self.spreadsheet.url}"
+        except FileNotFoundError:
+            return False, f"Файл {self.credentials_file} не найден"
+        except Exception as e:
+            logging.error("❌ Ошибка подключения к Google Sheets: %s", e)
+            return False, str(e)
+
+    def _connect(self):
+        import gspread
+
+        if self.client is None:
+            self.client = get_google_clients(self.credentials_file).gspread_client
+
+        if self.spreadsheet is None:
+            if self.spreadsheet_id:
+                self.spreadsheet = self.client.open_by_key(self.spreadsheet_id)
+            else:
+                try:
+                    self.spreadsheet = self.client.open(self.spreadsheet_title)
+                except gspread.SpreadsheetNotFound:
+                    self.spreadsheet = self.client.create(self.spreadsheet_title)
+                    logging.info("📊 Создана таблица: %s", self.spreadsheet_title)
+            self.spreadsheet_id = self.spreadsheet.id
+
+        if self.worksheet is None:
+            self.worksheet = self._get_worksheet(self.sheet_name, TRANSACTION_HEADERS,
+                                                 write_headers=False)
+
+    def _row_count(self) -> int:
+        """Текущее число строк листа (row_count объекта листа не обновляется
+        после дописывания строк другими клиентами)"""
+        metadata = self.spreadsheet.fetch_sheet_metadata(
+            {'fields': 'sheets.properties(sheetId,gridProperties.rowCount)'}
+        )
+        for sheet in metadata.get('sheets', []):
+            properties = sheet.get('properties', {})
+            if properties.get('sheetId') == self.worksheet.id:
+                return properties.get('gridProperties', {}).get('rowCount', self.worksheet.row_count)
+        return self.worksheet.row_count
+
+    def _get_worksheet(self, title: str, headers: List[str], write_headers: bool = True):
+        """Лист таблицы по названию (создается при отсутствии)"""
+        import gspread
+
+        worksheet = self._worksheets.get(title)
+        if worksheet is None:
+            try:
+                worksheet = self.spreadsheet.worksheet(title)
+            except gspread.WorksheetNotFound:
+                worksheet = self.spreadsheet.add_worksheet(
+                    title=title, rows=self.chunk_size + 1, cols=len(headers)
+                )
+                if write_headers:
+                    worksheet.update(f'A1:{_column_letter(len(headers))}1', [headers])
+            self._worksheets[title] = worksheet
+        return worksheet
+
+    @_serialized
+    def apply_operations(self, sheet_name: str, operations: List[Tuple[str, str, List]],
+                         headers: List[str] = None):
+        """Применение операций upsert/delete к строкам листа по ключу в колонке A.
+
+        Используется очередью записи (sheets_outbox): ключи читаются одним
+        запросом, изменения и добавления уходят пакетами. Ошибки не
+        перехватываются, чтобы операции остались в очереди до следующей попытки.
+        """
+        self._connect()
+        headers = headers or TRANSACTION_HEADERS
+        worksheet = self._get_worksheet(sheet_name, headers)
+        last_column = _column_letter(len(headers))
+
+        row_by_key = {str(key): index + 1 for index, key in enumerate(worksheet.col_values(1))}
+        updates, appends, deletes = [], [], []
+        for row_key, op, values in operations:
+            row = row_by_key.get(row_key)
+            if row == 1:
+                continue  # строка заголовков
+            if op == 'delete':
+                if row:
+                    deletes.append(row)
+            elif row:
+                updates.append({'range': f'A{row}:{last_column}{row}', 'values': [values]})
+            else:
+                appends.append(values)
+
+        if updates:
+            worksheet.batch_update(updates)
+        if appends:
+            worksheet.append_rows(appends)
+        if deletes:
+            # Удаляем снизу вверх, чтобы номера остальных строк не сдвигались
+            self.spreadsheet.batch_update({"requests": [
+                {
+                    "deleteDimension": {
+                        "range": {
+                            "sheetId": worksheet.id,
+                            "dimension": "ROWS",
+                            "startIndex": row - 1,
+                            "endIndex": row
+                        }
+                    }
+                }
+                for row in sorted(deletes, reverse=True)
+            ]})
+        logging.info("📤 Лист '%s': изменено %s, добавлено %s, удалено %s строк",
+                     sheet_name, len(updates), len(appends), len(deletes))
+
+    @_serialized
+    def upload_data(self, transactions: List[Dict], progress=None,
+                    should_cancel=None) -> Tuple[bool, str]:
+        """Порционная выгрузка транзакций с возобновлением после сбоя"""
+        import gspread
+
+        try:
+            self._connect()
+        except Exception as e:
+            logging.error("❌ Ошибка подключения к Google Sheets: %s", e)
+            return False, str(e)
+
+        rows = [transaction_to_row(t) for t in transactions]
+        total = len(rows)
+        data_hash = self._rows_hash(rows)
+        last_column = _column_letter(len(TRANSACTION_HEADERS))
+
+        checkpoint = self._load_checkpoint('upload')
+        if checkpoint and checkpoint.get('data_hash') == data_hash:
+            start = checkpoint['next_index']
+            logging.info("🔁 Продолжаем выгрузку с записи %s из %s", start + 1, total)
+        else:
+            start = 0
+            self.worksheet.resize(rows=total + 1, cols=len(TRANSACTION_HEADERS))
+            self.worksheet.update(f'A1:{last_column}1', [TRANSACTION_HEADERS])
+
+        index = start
+        try:
+            while index < total:
+                if should_cancel and should_cancel():
+                    self._save_checkpoint('upload', data_hash=data_hash, next_index=index)
+                    return False, f"Выгрузка остановлена на записи {index + 1} из {total}"
+
+                chunk = rows[index:index + self.chunk_size]
+                first_row = index + 2
+                self.worksheet.update(
+                    f'A{first_row}:{last_column}{first_row + len(chunk) - 1}', chunk
+                )
+                index += len(chunk)
+                self._save_checkpoint('upload', data_hash=data_hash, next_index=index)
+
+                if progress:
+                    progress(index, total, f"Выгружено {index} из {total} записей")
+        except gspread.exceptions.APIError as e:
+            logging.error("❌ Ошибка выгрузки на записи %s: %s", index + 1, e)
+            if is_quota_error(e):
+                return False, (f"Превышена квота Google API. Выгружено {index} из {total} записей, "
+                               f"повторная выгрузка продолжится с этого места.")
+            return False, str(e)
+
+        self._clear_checkpoint()
+        logging.info("✅ Выгружено %s транзакций в Google Sheets", total)
+        return True, f"Выгружено {total} записей\n{self.spreadsheet.url}"
+
+    @_serialized
+    def read_remote_transactions(self, progress=None, should_cancel=None,
+                                 version: str = None, resume: bool = True) -> Optional[List[Dict]]:
+        """Порционное чтение транзакций листа с возобновлением после сбоя.
+
+        Прочитанные строки дописываются в файл рядом с контрольной точкой
+        (checkpoint_file + '.rows', строка JSON на строку листа), а в самой
+        контрольной точке хранятся только номер следующей строки листа и
+        длина файла, поэтому запись после каждой порции не растет с объемом.
+
+        version - версия файла в Drive на момент чтения: контрольная точка
+        другой версии отбрасывается, так как лист с тех пор менялся. При
+        resume=False чтение всегда начинается с начала листа.
+        """
+        import gspread
+
+        try:
+            self._connect()
+        except Exception as e:
+            logging.error("❌ Ошибка подключения к Google Sheets: %s", e)
+            return None
+
+        last_column = _column_letter(len(TRANSACTION_HEADERS))
+        rows_file = self._rows_file()
+        checkpoint = self._load_checkpoint('download') if resume else None
+        if checkpoint and checkpoint.get('version') != version:
+            logging.info("🔁 Лист изменился после прерванной загрузки, читаем заново")
+            checkpoint = None
+        rows = self._load_rows(rows_file, checkpoint['rows_offset']) if checkpoint else None
+        if rows is not None:
+            next_row = checkpoint['next_row']
+            logging.info("🔁 Продолжаем загрузку со строки %s", next_row)
+        else:
+            next_row = 2
+            rows = []
+            open(rows_file, 'w', encoding='utf-8').close()
+
+        try:
+            # Граница чтения - размер листа, а не короткая порция: API не
+            # возвращает пустые строки в конце диапазона, и очищенная строка
+            # на стыке порций иначе обрывала бы чтение, а непрочитанные
+            # строки sync_two_way считал бы удаленными
+            row_count = self._row_count()
+            total = max(row_count - 1, 0)
+            with open(rows_file, 'a', encoding='utf-8') as f:
+                while next_row <= row_count:
+                    if should_cancel and should_cancel():
+                        return None
+
+                    last_row = min(next_row + self.chunk_size - 1, row_count)
+                    chunk = self.worksheet.get(f'A{next_row}:{last_column}{last_row}',
+                                               value_render_option='UNFORMATTED_VALUE')
+                    chunk = [row for row in chunk if row]
+                    for row in chunk:
+                        f.write(json.dumps(row, ensure_ascii=False) + '\n')
+                    f.flush()
+                    rows.extend(chunk)
+                    next_row = last_row + 1
+                    self._save_checkpoint('download', next_row=next_row, rows_offset=f.tell(),
+                                          version=version)
+
+                    if progress:
+                        done = min(next_row - 2, total)
+                        progress(done, total, f"Загружено {len(rows)} записей")
+        except gspread.exceptions.APIError as e:
+            logging.error("❌ Ошибка загрузки со строки %s: %s", next_row, e)
+            return None
+
+        self._clear_checkpoint()
+        transactions = []
+        for row in rows:
+            transaction = self._row_to_transaction(row)
+            if transaction:
+                transactions.append(transaction)
+        logging.info("✅ Прочитано %s транзакций из Google Sheets", len(transactions))
+        return transactions
+
+    @_serialized
+    def sync_two_way(self, transactions: List[Dict], progress=None, should_cancel=None,
+                     conflict_policy: str = 'local') -> Optional[Dict]:
+        """Двусторонняя инкрементальная синхронизация транзакций.
+
+        Для каждой строки в state_file хранится хэш содержимого на момент
+        прошлой синхронизации, а для файла - версия Drive. Если версия не
+        изменилась, лист не читается вовсе; иначе изменения определяются
+        сравнением хэшей строк. Слияние идет по id: изменения одной стороны
+        переносятся на другую, а при изменении строки с обеих сторон
+        побеждает conflict_policy ('local' или 'remote').
+
+        Возвращает изменения для локальных данных (upserts, deletes) и
+        статистику; None, если синхронизация не удалась или отменена.
+        """
+        try:
+            self._connect()
+        except Exception as e:
+            logging.error("❌ Ошибка подключения к Google Sheets: %s", e)
+            return None
+
+        state = self._load_sync_state()
+        base = state.get('rows', {})
+        local = {str(t['id']): t for t in transactions}
+        local_hash = {key: _row_hash(transaction_to_row(t)) for key, t in local.items()}
+
+        remote_version = self._remote_version()
+        remote_changed = remote_version is None or remote_version != state.get('remote_version')
+        if remote_changed:
+            # Прерванное чтение продолжается, только если версия листа та же:
+            # строки старой версии дали бы ложные удаления при слиянии
+            remote_transactions = self.read_remote_transactions(
+                progress, should_cancel, version=remote_version, resume=remote_version is not None
+            )
+            if remote_transactions is None:
+                return None
+            remote = {str(t['id']): t for t in remote_transactions}
+            remote_hash = {key: _row_hash(transaction_to_row(t)) for key, t in remote.items()}
+        else:
+            # Лист не менялся с прошлой синхронизации: он совпадает с базой
+            remote, remote_hash = {}, base
+
+        upserts, deletes, operations = [], [], []
+        conflicts = 0
+        new_base = {}
+        for key in set(base) | set(local_hash) | set(remote_hash):
+            base_value = base.get(key)
+            local_value = local_hash.get(key)
+            remote_value = remote_hash.get(key)
+            local_dirty = local_value != base_value
+            remote_dirty = remote_value != base_value
+
+            if local_dirty and remote_dirty and local_value != remote_value:
+                conflicts += 1
+                take_remote = conflict_policy == 'remote'
+            else:
+                take_remote = remote_dirty and not local_dirty
+
+            if take_remote:
+                if remote_value is None:
+                    deletes.append(local[key]['id'])
+                else:
+                    upserts.append(remote[key])
+                final = remote_value
+            else:
+                if local_value != remote_value:
+                    if local_value is None:
+                        operations.append((key, 'delete', None))
+                    else:
+                        operations.append((key, 'upsert', transaction_to_row(local[key])))
+                final = local_value
+
+            if final is not None:
+                new_base[key] = final
+
+        if should_cancel and should_cancel():
+            return None
+        if operations:
+            self.apply_operations(self.sheet_name, operations, TRANSACTION_HEADERS)
+
+        self._save_sync_state({
+            'spreadsheet_id': self.spreadsheet_id,
+            'sheet_name': self.sheet_name,
+            # После собственной записи версия устареет, и следующий запуск
+            # перечитает лист: это дешевле, чем пропустить чужую правку
+            'remote_version': remote_version,
+            'rows': new_base,
+            'updated_at': datetime.now().isoformat(),
+        })
+
+        logging.info("🔄 Двусторонняя синхронизация: получено %s, удалено локально %s, "
+                     "отправлено %s, конфликтов %s",
+                     len(upserts), len(deletes), len(operations), conflicts)
+        return {
+            'upserts': upserts,
+            'deletes': deletes,
+            'pushed': len(operations),
+            'conflicts': conflicts,
+            'remote_changed': remote_changed,
+        }
+
+    def _remote_version(self) -> Optional[str]:
+        """Версия файла таблицы в Drive (None, если узнать не удалось)"""
+        from sheets_retry import execute_with_retry
+
+        try:
+            drive = get_google_clients(self.credentials_file).drive_service()
+            metadata = execute_with_retry(
+                drive.files().get(fileId=self.spreadsheet_id, fields='version')
+            )
+            return str(metadata.get('version'))
+        except Exception as e:
+            logging.warning("⚠️ Не удалось получить версию таблицы из Drive: %s", e)
+            return None
+
+    def _load_sync_state(self) -> Dict:
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        if (state.get('spreadsheet_id') != self.spreadsheet_id
+                or state.get('sheet_name') != self.sheet_name):
+            return {}
+        return state
+
+    def _save_sync_state(self, state: Dict):
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_file, self.state_file)
+
+    def get_spreadsheet_url(self) -> str:
+        """Получение URL таблицы"""
+        return self.spreadsheet.url if self.spreadsheet else ""
+
+    @staticmethod
+    def _row_to_transaction(row: List) -> Optional[Dict]:
+        row = list(row) + [''] * (len(TRANSACTION_FIELDS) - len(row))
+        if not row[0]:
+            return None
+        transaction = dict(zip(TRANSACTION_FIELDS, row))
+        try:
+            transaction['amount'] = float(str(transaction['amount']).replace(',', '.').replace('\xa0', ''))
+        except ValueError:
+            logging.error("❌ Неверная сумма в строке %s: %s",
+                          transaction['id'], transaction['amount'])
+            return None
+        return transaction
+
+    @staticmethod
+    def _rows_hash(rows: List[List]) -> str:
+        payload = json.dumps(rows, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _load_checkpoint(self, operation: str) -> Optional[Dict]:
+        try:
+            with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if (checkpoint.get('operation') != operation
+                or checkpoint.get('spreadsheet_id') != self.spreadsheet_id
+                or checkpoint.get('sheet_name') != self.sheet_name):
+            return None
+        return checkpoint
+
+    def _save_checkpoint(self, operation: str, **state):
+        checkpoint = {
+            'operation': operation,
+            'spreadsheet_id': self.spreadsheet_id,
+            'sheet_name': self.sheet_name,
+            'updated_at': datetime.now().isoformat(),
+            **state
+        }
+        tmp_file = self.checkpoint_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f, ensure_ascii=False)
+        os.replace(tmp_file, self.checkpoint_file)
+
+    def _clear_checkpoint(self):
+        for path in (self.checkpoint_file, self._rows_file()):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _rows_file(self) -> str:
+        return self.checkpoint_file + '.rows'
+
+    @staticmethod
+    def _load_rows(rows_file: str, offset: int) -> Optional[List[List]]:
+        """Строки, прочитанные до контрольной точки (None, если файл неполный).
+
+        Хвост после offset - порция, записанная до сбоя, но не отмеченная в
+        контрольной точке; он отрезается и будет прочитан заново.
+        """
+        try:
+            with open(rows_file, 'r+', encoding='utf-8') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() < offset:
+                    return None
+                f.truncate(offset)
+                f.seek(0)
+                return [json.loads(line) for line in f]
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
 
 # Глобальный экземпляр менеджера
 google_sheets_manager = None
@@ -475,7 +1204,7 @@ async def init_google_sheets(credentials_file: str = 'credentials.json',
         if create_new:
             title = f"Фильтр-Трекер {datetime.now().strftime('%Y-%m-%d %H:%M')}"
             url = google_sheets_manager.create_spreadsheet(title)
-            logging.info(f"📊 Создана новая таблица: {url}")
+            logging.info("📊 Создана новая таблица: %s", url)
         elif spreadsheet_id:
             google_sheets_manager.open_spreadsheet(spreadsheet_id)
         
@@ -487,5 +1216,5 @@ async def init_google_sheets(credentials_file: str = 'credentials.json',
         return google_sheets_manager
         
     except Exception as e:
-        logging.error(f"❌ Ошибка инициализации Google Sheets: {e}")
+        logging.error("❌ Ошибка инициализации Google Sheets: %s", e)
         return None
@@ -0,0 +1,376 @@
+"""Запечатанная история зарплат и материалов в двоичных сегментах.
+
+Старые записи не меняются, но при каждой загрузке заново разбирались из
+JSON с отступами. Записи прошлых месяцев переносятся (seal) из
+salaries.json/materials.json в сегменты ledger/<категория>-<месяц>.seg:
+
+- заголовок (32 байта), затем записи фиксированной ширины по 32 байта:
+  сумма в копейках (int64), день (порядковый номер даты, int32), секунда
+  дня (int32) и индексы строк (uint32) - id, адрес объекта, название и
+  наименование материала;
+- в конце - таблица строк (JSON-массив), каждая строка хранится один раз.
+
+Сегмент открывается через mmap, записи не превращаются в объекты Python:
+с numpy столбцы - это массивы поверх отображенной памяти, и суммы считаются
+векторно; без numpy записи читаются struct.iter_unpack прямо из mmap.
+
+    python ledger.py seal [ГГГГ-ММ]     # перенести записи до этого месяца
+    python ledger.py totals [object|month|day]
+    python ledger.py verify
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import uuid
+import zlib
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional
+
+from rollups import MATERIALS, SALARY, to_kopecks
+
+CATEGORIES = (SALARY, MATERIALS)
+AMOUNT_FIELDS = {SALARY: 'amount', MATERIALS: 'cost'}
+
+MAGIC = b'LDG1'
+VERSION = 1
+# magic, версия, категория, размер записи, число записей, смещение таблицы строк, crc32 записей
+HEADER = struct.Struct('<4sHHIQQI')
+RECORD = struct.Struct('<qiiIIII')
+SEGMENT_SUFFIX = '.seg'
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if np is not None:
+    RECORD_DTYPE = np.dtype([
+        ('kopecks', '<i8'), ('day', '<i4'), ('second', '<i4'),
+        ('id', '<u4'), ('object', '<u4'), ('name', '<u4'), ('item', '<u4'),
+    ])
+    assert RECORD_DTYPE.itemsize == RECORD.size
+
+
+class LedgerError(Exception):
+    """Поврежденный или несовместимый сегмент"""
+
+
+def _parse_moment(date_text: str):
+    """(порядковый номер дня, секунда дня) для 'ГГГГ-ММ-ДД[ ЧЧ:ММ:СС]'"""
+    moment = datetime.fromisoformat(str(date_text)[:19])
+    return moment.toordinal(), moment.hour * 3600 + moment.minute * 60 + moment.second
+
+
+def _format_moment(day: int, second: int) -> str:
+    moment = datetime.fromordinal(day).replace(hour=second // 3600, minute=second // 60 % 60,
+                                                second=second % 60)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _month(date_text: str) -> str:
+    return str(date_text)[:7]
+
+
+def write_segment(path: str, category: str, records: List[Dict]):
+    """Запись сегмента (атомарно: tmp + os.replace)"""
+    amount_field = AMOUNT_FIELDS[category]
+    strings: List[str] = ['']
+    index: Dict[str, int] = {'': 0}
+
+    def intern(value) -> int:
+        value = '' if value is None else str(value)
+        position = index.get(value)
+        if position is None:
+            position = index[value] = len(strings)
+            strings.append(value)
+        return position
+
+    body = bytearray()
+    for record in records:
+        day, second = _parse_moment(record['date'])
+        body += RECORD.pack(
+            to_kopecks(record.get(amount_field, 0)), day, second,
+            intern(record.get('id')), intern(record.get('address')),
+            intern(record.get('name')), intern(record.get('material_name')),
+        )
+    table = json.dumps(strings, ensure_ascii=False).encode('utf-8')
+    header = HEADER.pack(MAGIC, VERSION, CATEGORIES.index(category), RECORD.size,
+                         len(records), HEADER.size + len(body), zlib.crc32(body))
+
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(header)
+        f.write(body)
+        f.write(table)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+class LedgerSegment:
+    """Открытый через mmap сегмент; закрывается close() или в with"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, category, record_size, self.count,
+             strings_offset, self.checksum) = HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+                raise LedgerError(f"{path}: неизвестный формат сегмента")
+            if strings_offset != HEADER.size + self.count * RECORD.size or strings_offset > len(self._mmap):
+                raise LedgerError(f"{path}: сегмент обрезан")
+            self.category = CATEGORIES[category]
+            self.strings: List[str] = json.loads(self._mmap[strings_offset:].decode('utf-8'))
+        except (struct.error, IndexError, ValueError) as e:
+            self._mmap.close()
+            raise LedgerError(f"{path}: сегмент поврежден: {e}")
+        except LedgerError:
+            self._mmap.close()
+            raise
+        self._strings_offset = strings_offset
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def records_view(self) -> memoryview:
+        """Записи без копирования (срез отображенной памяти)"""
+        return memoryview(self._mmap)[HEADER.size:self._strings_offset]
+
+    def columns(self):
+        """Структурированный массив numpy поверх mmap (без копирования)"""
+        return np.frombuffer(self._mmap, dtype=RECORD_DTYPE, count=self.count, offset=HEADER.size)
+
+    def verify(self):
+        with self.records_view() as view:
+            if zlib.crc32(view) != self.checksum:
+                raise LedgerError(f"{self.path}: контрольная сумма записей не совпадает")
+
+    def iter_records(self) -> Iterator[Dict]:
+        """Записи в виде словарей JSON-файла (для пересчета и восстановления)"""
+        amount_field = AMOUNT_FIELDS[self.category]
+        strings = self.strings
+        with self.records_view() as view:
+            for kopecks, day, second, record_id, address, name, item in RECORD.iter_unpack(view):
+                record = {'id': strings[record_id], 'address': strings[address], 'name': strings[name]}
+                if self.category == MATERIALS:
+                    record['material_name'] = strings[item]
+                record[amount_field] = kopecks / 100
+                record['date'] = _format_moment(day, second)
+                yield record
+
+
+def _label(segment: LedgerSegment, by: str, key: int) -> str:
+    if by == 'object':
+        return segment.strings[key]
+    day = date.fromordinal(key).isoformat()
+    return day[:7] if by == 'month' else day
+
+
+class Ledger:
+    """Каталог запечатанных сегментов"""
+
+    def __init__(self, directory: str = 'ledger'):
+        self.directory = directory
+
+    def segment_paths(self, category: str = None) -> List[str]:
+        try:
+            names = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            return []
+        prefix = f"{category}-" if category else ''
+        return [os.path.join(self.directory, name) for name in names
+                if name.endswith(SEGMENT_SUFFIX) and name.startswith(prefix)]
+
+    def records(self, category: str) -> List[Dict]:
+        records = []
+        for path in self.segment_paths(category):
+            with LedgerSegment(path) as segment:
+                records.extend(segment.iter_records())
+        return records
+
+    def sealed_ids(self, category: str) -> set:
+        ids = set()
+        for path in self.segment_paths(category):
+            with LedgerSegment(path) as segment:
+                with segment.records_view() as view:
+                    ids.update(segment.strings[fields[3]] for fields in RECORD.iter_unpack(view))
+        ids.discard('')
+        return ids
+
+    # --- Агрегаты ---
+
+    def totals(self, category: str, by: str = 'object', since: str = None,
+               until: str = None) -> Dict[str, float]:
+        """Суммы по объекту, месяцу или дню за период [since, until] (даты ГГГГ-ММ-ДД)"""
+        if by not in ('object', 'month', 'day'):
+            raise ValueError(f"Неизвестная группировка: {by}")
+        first = date.fromisoformat(since).toordinal() if since else None
+        last = date.fromisoformat(until).toordinal() if until else None
+        result: Dict[str, int] = defaultdict(int)
+        for path in self.segment_paths(category):
+            with LedgerSegment(path) as segment:
+                if np is not None:
+                    self._add_totals_numpy(segment, by, first, last, result)
+                else:
+                    self._add_totals_struct(segment, by, first, last, result)
+        return {key: kopecks / 100 for key, kopecks in sorted(result.items())}
+
+    @staticmethod
+    def _add_totals_numpy(segment: LedgerSegment, by: str, first: Optional[int],
+                          last: Optional[int], result: Dict[str, int]):
+        columns = segment.columns()
+        mask = None
+        if first is not None:
+            mask = columns['day'] >= first
+        if last is not None:
+            mask = columns['day'] <= last if mask is None else mask & (columns['day'] <= last)
+        kopecks = columns['kopecks'] if mask is None else columns['kopecks'][mask]
+        key_field = 'object' if by == 'object' else 'day'
+        keys = columns[key_field] if mask is None else columns[key_field][mask]
+        if len(keys):
+            unique, inverse = np.unique(keys, return_inverse=True)
+            sums = np.zeros(len(unique), dtype=np.int64)
+            np.add.at(sums, inverse, kopecks)
+            for key, total in zip(unique.tolist(), sums.tolist()):
+                result[_label(segment, by, key)] += total
+        # Массивы ссылаются на mmap: освобождаем их до закрытия сегмента
+        del columns, kopecks, keys
+
+    @staticmethod
+    def _add_totals_struct(segment: LedgerSegment, by: str, first: Optional[int],
+                           last: Optional[int], result: Dict[str, int]):
+        sums: Dict[int, int] = defaultdict(int)
+        key_field = 4 if by == 'object' else 1
+        with segment.records_view() as view:
+            for fields in RECORD.iter_unpack(view):
+                day = fields[1]
+                if (first is not None and day < first) or (last is not None and day > last):
+                    continue
+                sums[fields[key_field]] += fields[0]
+        for key, total in sums.items():
+            result[_label(segment, by, key)] += total
+
+    # --- Запечатывание ---
+
+    def _segment_path(self, category: str, month: str) -> str:
+        path = os.path.join(self.directory, f"{category}-{month}{SEGMENT_SUFFIX}")
+        sequence = 1
+        # Сегменты не меняются: поздние записи того же месяца идут в новый сегмент
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{category}-{month}.{sequence}{SEGMENT_SUFFIX}")
+            sequence += 1
+        return path
+
+    def seal(self, category: str, records: List[Dict], before_month: str) -> List[Dict]:
+        """Перенос записей месяцев раньше before_month (ГГГГ-ММ) в сегменты.
+
+        Возвращает записи, которые остаются в JSON. Записи, уже попавшие в
+        сегменты (например, если запись JSON прервалась после сегмента),
+        повторно не переносятся, а просто отбрасываются. Такая проверка
+        возможна только по id: seal_json присваивает его записям без id до
+        переноса.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        sealed_ids = self.sealed_ids(category)
+        by_month: Dict[str, List[Dict]] = defaultdict(list)
+        remaining = []
+        for record in records:
+            if record.get('id') and record['id'] in sealed_ids:
+                continue
+            if _month(record['date']) < before_month:
+                by_month[_month(record['date'])].append(record)
+            else:
+                remaining.append(record)
+        for month, month_records in sorted(by_month.items()):
+            path = self._segment_path(category, month)
+            write_segment(path, category, month_records)
+            logging.info("📦 Запечатано записей %s: %s -> %s", category, len(month_records), path)
+        return remaining
+
+    def verify(self) -> int:
+        paths = self.segment_paths()
+        for path in paths:
+            with LedgerSegment(path) as segment:
+                segment.verify()
+        return len(paths)
+
+
+def _write_json(path: str, records: List[Dict]):
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(records, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+def seal_json(ledger: Ledger, json_files: Dict[str, str], before_month: str = None) -> int:
+    """Перенос старых записей из JSON-файлов {категория: путь}; вызывать под блокировкой хранилища"""
+    before_month = before_month or datetime.now().strftime('%Y-%m')
+    moved = 0
+    for category, path in json_files.items():
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue
+        # Повторный перенос после сбоя отсеивается по id, поэтому записи
+        # старого формата без id получают его и сохраняются до записи сегментов
+        missing_ids = [record for record in records if not record.get('id')]
+        for record in missing_ids:
+            record['id'] = str(uuid.uuid4())
+        if missing_ids:
+            _write_json(path, records)
+            logging.info("🆔 Присвоены id записям %s без id: %s", category, len(missing_ids))
+
+        remaining = ledger.seal(category, records, before_month)
+        if len(remaining) == len(records):
+            continue
+        # Сегменты уже на диске: JSON переписывается вторым шагом
+        _write_json(path, remaining)
+        moved += len(records) - len(remaining)
+    return moved
+
+
+def main(argv):
+    from file_lock import InterProcessLock
+
+    ledger = Ledger()
+    json_files = {SALARY: 'salaries.json', MATERIALS: 'materials.json'}
+    command = argv[0] if argv else ''
+    try:
+        if command == 'seal':
+            with InterProcessLock('storage.lock'):
+                moved = seal_json(ledger, json_files, argv[1] if len(argv) > 1 else None)
+            print(f"✅ Перенесено записей: {moved}")
+        elif command == 'totals':
+            by = argv[1] if len(argv) > 1 else 'object'
+            for category in CATEGORIES:
+                print(f"{category}:")
+                for key, total in ledger.totals(category, by).items():
+                    print(f"  {key}: {total:,.2f} руб.")
+        elif command == 'verify':
+            print(f"✅ Проверено сегментов: {ledger.verify()}")
+        else:
+            print(__doc__)
+            return 2
+    except LedgerError as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,217 @@
+"""Нагрузочный тест сценария «зарплата по объекту» с N виртуальными пользователями.
+
+Настоящий Updater бота опрашивает локальный fake_telegram (base_url), а
+виртуальные пользователи параллельно проходят цепочку
+add_salary_start → enter_salary → add_salary_amount → confirm_salary и ждут
+ответ бота на каждый шаг. Для каждого N из --users замеряются устойчивая
+пропускная способность (обновлений в секунду), распределение задержки ответа
+и доля потерянных записей: подтвержденные зарплаты, которых нет в
+salaries.json, или расхождение суммы salary_total у объектов.
+
+    python loadtest.py --users 1,5,20,50 --duration 20
+    DISPATCH_WORKERS=8 python loadtest.py --users 1,5,20,50
+    python loadtest.py --users 1,5,20,50 --processes 4
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from fake_telegram import FAKE_TOKEN, FakeTelegramServer
+from replay import percentile
+
+ADD_SALARY = "💰 Добавить зарплату"
+CONFIRM = "✅ Подтвердить"
+OBJECTS_COUNT = 3
+
+
+class VirtualUser(threading.Thread):
+    """Пользователь, который повторяет сценарий добавления зарплаты до дедлайна"""
+
+    def __init__(self, server: FakeTelegramServer, user_id: int, objects: List[str],
+                 deadline: float, reply_timeout: float):
+        super().__init__(name=f"vu-{user_id}", daemon=True)
+        self.server = server
+        self.user_id = user_id
+        self.objects = objects
+        self.deadline = deadline
+        self.reply_timeout = reply_timeout
+        self.latencies: List[float] = []
+        self.sent = 0
+        self.timeouts = 0
+        self.confirmed: Dict[str, float] = {}
+        self.confirmed_count = 0
+
+    def step(self, text: str) -> bool:
+        expected = self.server.reply_count(self.user_id) + 1
+        started = time.perf_counter()
+        self.server.send_text(self.user_id, text)
+        self.sent += 1
+        if not self.server.wait_for_replies(self.user_id, expected, self.reply_timeout):
+            self.timeouts += 1
+            return False
+        self.latencies.append(self.server.replies(self.user_id)[expected - 1].sent_at - started)
+        return True
+
+    def run(self):
+        if not self.step('/start'):
+            return
+        iteration = 0
+        while time.monotonic() < self.deadline:
+            target = self.objects[(self.user_id + iteration) % len(self.objects)]
+            # Целые суммы, чтобы итог сравнивался без ошибок округления
+            amount = 100 + iteration % 50
+            iteration += 1
+            if not (self.step(ADD_SALARY) and self.step(target) and self.step(str(amount))):
+                self.step('/cancel')
+                continue
+            if self.step(CONFIRM):
+                self.confirmed[target] = self.confirmed.get(target, 0) + amount
+                self.confirmed_count += 1
+
+
+def seed_objects(count: int) -> List[str]:
+    """Начальные данные: count объектов без зарплат; возвращает тексты кнопок"""
+    objects = [{
+        'address': f"Адрес {i}",
+        'name': f"Объект {i}",
+        'salary_total': 0.0,
+        'materials_total': 0.0,
+        'created_at': '2024-01-01 00:00:00',
+    } for i in range(1, count + 1)]
+    for file_name, data in (('objects.json', objects), ('salaries.json', []), ('materials.json', [])):
+        with open(file_name, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    return [f"{obj['address']} - {obj['name']}" for obj in objects]
+
+
+def check_lost_updates(users: List[VirtualUser]) -> Dict:
+    """Сверка подтвержденных пользователями зарплат с тем, что осталось в файлах"""
+    with open('objects.json', 'r', encoding='utf-8') as f:
+        objects = json.load(f)
+    with open('salaries.json', 'r', encoding='utf-8') as f:
+        salaries = json.load(f)
+
+    confirmed = sum(user.confirmed_count for user in users)
+    expected_totals: Dict[str, float] = {}
+    for user in users:
+        for target, amount in user.confirmed.items():
+            expected_totals[target] = expected_totals.get(target, 0) + amount
+
+    totals_mismatch = sum(
+        1 for obj in objects
+        if abs(obj.get('salary_total', 0) - expected_totals.get(f"{obj['address']} - {obj['name']}", 0)) > 1e-6
+    )
+    lost = max(0, confirmed - len(salaries))
+    return {
+        'confirmed': confirmed,
+        'stored': len(salaries),
+        'lost': lost,
+        'lost_rate': lost / confirmed if confirmed else 0.0,
+        'totals_mismatch': totals_mismatch,
+    }
+
+
+def run_level(server: FakeTelegramServer, users_count: int, duration: float,
+              reply_timeout: float, first_user_id: int) -> Dict:
+    objects = seed_objects(OBJECTS_COUNT)
+    deadline = time.monotonic() + duration
+    users = [VirtualUser(server, first_user_id + i, objects, deadline, reply_timeout)
+             for i in range(users_count)]
+    started = time.perf_counter()
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    elapsed = time.perf_counter() - started
+
+    # Дать обработчикам закончить запись последних подтверждений
+    time.sleep(0.5)
+    latencies = [value for user in users for value in user.latencies]
+    result = {
+        'users': users_count,
+        'updates': sum(user.sent for user in users),
+        'seconds': elapsed,
+        'timeouts': sum(user.timeouts for user in users),
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'max': max(latencies) if latencies else 0.0,
+    }
+    result['throughput'] = result['updates'] / elapsed if elapsed else 0.0
+    result.update(check_lost_updates(users))
+    return result
+
+
+def run(levels: List[int], duration: float, reply_timeout: float, latency: float,
+        processes: int = 0) -> List[Dict]:
+    os.environ.setdefault('BOT_TOKEN', FAKE_TOKEN)
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+
+    server = FakeTelegramServer(latency=latency).start()
+    updater = cluster = None
+    try:
+        if processes > 0:
+            # Рабочие процессы запускаются в том же временном каталоге
+            from cluster import Cluster
+            cluster = Cluster(os.environ['BOT_TOKEN'], processes, base_url=server.base_url)
+            cluster.start(poll_timeout=1)
+        else:
+            import bot as bot_module
+
+            updater = bot_module.create_updater(os.environ['BOT_TOKEN'], base_url=server.base_url)
+            bot_module.init_delivery(updater.bot)
+            bot_module.register_handlers(updater.dispatcher)
+            updater.start_polling(poll_interval=0.0, timeout=1)
+
+        results = []
+        first_user_id = 1000
+        for users_count in levels:
+            results.append(run_level(server, users_count, duration, reply_timeout, first_user_id))
+            first_user_id += users_count
+            print_result(results[-1])
+        return results
+    finally:
+        if updater is not None:
+            updater.stop()
+        if cluster is not None:
+            cluster.stop()
+        server.stop()
+        os.chdir(previous_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def print_result(result: Dict):
+    print(f"N={result['users']:>4}: {result['throughput']:8.1f} обн/с, "
+          f"p50 {result['p50'] * 1000:7.1f} мс, p95 {result['p95'] * 1000:7.1f} мс, "
+          f"p99 {result['p99'] * 1000:7.1f} мс, max {result['max'] * 1000:7.1f} мс, "
+          f"таймаутов {result['timeouts']}, "
+          f"потеряно {result['lost']}/{result['confirmed']} ({result['lost_rate']:.1%}), "
+          f"расхождений сумм {result['totals_mismatch']}")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сценария добавления зарплаты")
+    parser.add_argument('--users', default='1,5,20', help="уровни нагрузки через запятую")
+    parser.add_argument('--duration', type=float, default=15.0, help="длительность уровня, с")
+    parser.add_argument('--reply-timeout', type=float, default=10.0, help="ожидание ответа бота, с")
+    parser.add_argument('--processes', type=int, default=0,
+                        help="число рабочих процессов cluster.py (0 - один процесс)")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="искусственная задержка ответов Bot API, с")
+    args = parser.parse_args(argv)
+
+    levels = [int(value) for value in args.users.split(',') if value.strip()]
+    run(levels, args.duration, args.reply_timeout, args.latency, args.processes)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
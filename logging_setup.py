@@ -0,0 +1,174 @@
+"""Неблокирующее логирование.
+
+Обработчики бота только кладут запись в очередь (QueueHandler), а вывод в
+stderr и файл выполняет отдельный поток (QueueListener). Сообщение
+собирается из шаблона и аргументов только для записей, прошедших фильтр
+уровня; форматирование по шаблону и запись в файл - уже в потоке вывода.
+
+Настройка через переменные окружения:
+    LOG_LEVEL  - уровень (INFO по умолчанию)
+    LOG_FORMAT - text или json (одна JSON-запись на строку)
+    LOG_FILE   - дополнительный файл для логов
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_FILE = os.getenv('LOG_FILE', '')
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Поля контекста, которые попадают в записи
+CONTEXT_FIELDS = ('user_id', 'chat_id', 'state', 'duration_ms')
+
+_context = contextvars.ContextVar('log_context', default={})
+_started = contextvars.ContextVar('log_started', default=None)
+_listener = None
+
+
+def start_context(**fields):
+    """Новый контекст логов текущего потока (начало обработки обновления)"""
+    _context.set(fields)
+    _started.set(time.perf_counter())
+
+
+def clear_context():
+    _context.set({})
+    _started.set(None)
+
+
+def elapsed_ms():
+    """Миллисекунды с начала контекста (None, если контекст не начат)"""
+    started = _started.get()
+    if started is None:
+        return None
+    return round((time.perf_counter() - started) * 1000, 3)
+
+
+@contextmanager
+def log_context(**fields):
+    """Временные поля контекста логов"""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Перенос полей контекста в запись (выполняется в потоке-источнике)"""
+
+    def filter(self, record):
+        for name, value in _context.get().items():
+            if not hasattr(record, name):
+                setattr(record, name, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-запись на строку"""
+
+    def format(self, record):
+        data = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for name in CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                data[name] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc'] = record.exc_text
+        if record.stack_info:
+            data['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Текстовый формат с полями контекста в конце строки"""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = [f"{name}={getattr(record, name)}" for name in CONTEXT_FIELDS
+                  if getattr(record, name, None) is not None]
+        if not fields:
+            return line
+        head, sep, tail = line.partition('\n')
+        return f"{head} [{' '.join(fields)}]{sep}{tail}"
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler с минимальной работой в потоке-источнике.
+
+    prepare() вызывается только для записей, прошедших фильтр уровня. Он
+    подставляет аргументы в сообщение и снимает текст трейсбека, пока
+    аргументы не изменились: запись выводится позже, а объекты в args могут
+    меняться потоком-источником. Форматирование по шаблону (время, уровень,
+    поля контекста) остается потоку вывода.
+    """
+
+    _exc_formatter = logging.Formatter()
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self._exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: str = LOG_LEVEL, json_format: bool = None, log_file: str = LOG_FILE):
+    """Перевод корневого логгера на очередь с фоновым потоком вывода"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    if json_format is None:
+        json_format = LOG_FORMAT == 'json'
+    formatter = JsonFormatter() if json_format else TextFormatter(TEXT_FORMAT)
+
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _LazyQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Вывод оставшихся в очереди записей и остановка потока"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
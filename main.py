@@ -1,11 +1,22 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 from transaction_manager import TransactionManager
-from google_sheets import GoogleSheetsSync
+from virtual_treeview import VirtualTreeview
+from sync_worker import SyncExecutor
+from sheets_outbox import SheetsOutbox
+from google_sheets import GoogleSheetsSync, transaction_to_row
+from statement_import import (DEFAULT_CATEGORY, FIELD_LABELS, FIELDS, REQUIRED_FIELDS,
+                              StatementImportError, guess_mapping, parse_statement, read_header)
+from bisect import bisect_right
 import json
 import os
 import webbrowser
 
+# Значение фильтра "без ограничения" в выпадающих списках
+ALL_VALUES = "Все"
+# Пауза после последнего нажатия клавиши до поиска, мс
+SEARCH_DELAY_MS = 150
+
 class FinanceTracker:
     def __init__(self, root):
         self.root = root
@@ -14,6 +25,20 @@ class FinanceTracker:
         
         self.transaction_manager = TransactionManager('data.json')
         self.google_sheets = GoogleSheetsSync('credentials.json')
+        self.sync_executor = SyncExecutor(self.root)
+        
+        # Текущий фильтр таблицы и курсор следующей страницы выборки
+        self.filter_params = {}
+        self.next_cursor = None
+        # Поиск: отложенный запуск и результат последнего запроса для сужения
+        self._search_job = None
+        self.search_query = ''
+        self.search_ids = None
+        
+        # Изменения уходят в Google Sheets через локальную очередь в фоне
+        self.sheets_outbox = SheetsOutbox('sheets_outbox.db')
+        if os.path.exists(self.google_sheets.credentials_file):
+            self.start_sheets_outbox()
         
         # Загружаем данные
         self.transaction_manager.load_data()
@@ -71,13 +96,41 @@ class FinanceTracker:
         ttk.Button(button_frame, text="Добавить", command=self.add_transaction).pack(side='left', padx=5)
         ttk.Button(button_frame, text="Очистить", command=self.clear_form).pack(side='left', padx=5)
         
+        # Панель фильтра: выборка идет по индексам TransactionManager
+        filter_frame = ttk.LabelFrame(parent, text="Фильтр", padding=10)
+        filter_frame.grid(row=1, column=0, columnspan=2, sticky='ew', padx=5, pady=5)
+        
+        ttk.Label(filter_frame, text="С:").pack(side='left')
+        self.filter_from_entry = ttk.Entry(filter_frame, width=12)
+        self.filter_from_entry.pack(side='left', padx=5)
+        ttk.Label(filter_frame, text="По:").pack(side='left')
+        self.filter_to_entry = ttk.Entry(filter_frame, width=12)
+        self.filter_to_entry.pack(side='left', padx=5)
+        ttk.Label(filter_frame, text="Категория:").pack(side='left')
+        self.filter_category_combo = ttk.Combobox(filter_frame, values=[ALL_VALUES], width=15)
+        self.filter_category_combo.set(ALL_VALUES)
+        self.filter_category_combo.pack(side='left', padx=5)
+        ttk.Label(filter_frame, text="Тип:").pack(side='left')
+        self.filter_type_combo = ttk.Combobox(filter_frame, values=[ALL_VALUES, "доход", "расход"],
+                                              width=10, state='readonly')
+        self.filter_type_combo.set(ALL_VALUES)
+        self.filter_type_combo.pack(side='left', padx=5)
+        ttk.Button(filter_frame, text="Применить", command=self.apply_filter).pack(side='left', padx=5)
+        ttk.Button(filter_frame, text="Сбросить", command=self.reset_filter).pack(side='left', padx=5)
+        
+        # Поиск по описанию и категории: таблица фильтруется по мере ввода
+        ttk.Label(filter_frame, text="Поиск:").pack(side='left', padx=(15, 0))
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add('write', self._on_search_changed)
+        ttk.Entry(filter_frame, textvariable=self.search_var, width=25).pack(side='left', padx=5)
+        
         # Таблица транзакций
         table_frame = ttk.LabelFrame(parent, text="Транзакции", padding=10)
-        table_frame.grid(row=1, column=0, columnspan=2, sticky='nsew', padx=5, pady=5)
+        table_frame.grid(row=2, column=0, columnspan=2, sticky='nsew', padx=5, pady=5)
         
         # Настройка таблицы
         columns = ("id", "date", "category", "amount", "type", "description")
-        self.tree = ttk.Treeview(table_frame, columns=columns, show='headings', height=15)
+        self.tree = VirtualTreeview(table_frame, columns, self._format_transaction_row, height=15)
         
         # Заголовки
         self.tree.heading("id", text="ID")
@@ -95,31 +148,41 @@ class FinanceTracker:
         self.tree.column("type", width=80)
         self.tree.column("description", width=200)
         
-        # Скроллбар
-        scrollbar = ttk.Scrollbar(table_frame, orient='vertical', command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        # Скроллбар управляет виртуальной прокруткой таблицы
+        scrollbar = self.tree.scrollbar
         
         self.tree.pack(side='left', fill='both', expand=True)
         scrollbar.pack(side='right', fill='y')
         
         # Кнопки управления
         control_frame = ttk.Frame(parent)
-        control_frame.grid(row=2, column=0, columnspan=2, pady=10)
+        control_frame.grid(row=3, column=0, columnspan=2, pady=10)
         
         ttk.Button(control_frame, text="Удалить выделенное", 
                   command=self.delete_selected).pack(side='left', padx=5)
         ttk.Button(control_frame, text="Обновить", 
                   command=self.refresh_transactions).pack(side='left', padx=5)
+        self.more_button = ttk.Button(control_frame, text="Показать еще",
+                                      command=self.load_next_page, state='disabled')
+        self.more_button.pack(side='left', padx=5)
+        self.shown_label = ttk.Label(control_frame, text="")
+        self.shown_label.pack(side='left', padx=5)
+        ttk.Button(control_frame, text="Импорт выписки",
+                  command=self.import_statement).pack(side='left', padx=5)
+        self.import_progress = ttk.Progressbar(control_frame, mode='determinate', maximum=100, length=150)
+        self.import_progress.pack(side='left', padx=5)
+        self.import_status = ttk.Label(control_frame, text="")
+        self.import_status.pack(side='left', padx=5)
         
         # Статистика
         stats_frame = ttk.LabelFrame(parent, text="Статистика", padding=10)
-        stats_frame.grid(row=3, column=0, columnspan=2, sticky='ew', padx=5, pady=5)
+        stats_frame.grid(row=4, column=0, columnspan=2, sticky='ew', padx=5, pady=5)
         
         self.stats_label = ttk.Label(stats_frame, text="")
         self.stats_label.pack()
         
         # Настройка весов строк и колонок
-        parent.grid_rowconfigure(1, weight=1)
+        parent.grid_rowconfigure(2, weight=1)
         parent.grid_columnconfigure(1, weight=1)
     
     def setup_sync_tab(self, parent):
@@ -164,12 +227,22 @@ class FinanceTracker:
         ttk.Button(button_frame, text="Загрузить в Google Sheets", 
                   command=self.upload_to_sheets).pack(pady=5)
         
-        ttk.Button(button_frame, text="Загрузить из Google Sheets", 
-                  command=self.download_from_sheets).pack(pady=5)
+        ttk.Button(button_frame, text="Синхронизировать с Google Sheets", 
+                  command=self.sync_with_sheets).pack(pady=5)
         
         ttk.Button(button_frame, text="Открыть таблицу в браузере", 
                   command=self.open_sheets).pack(pady=5)
         
+        # Прогресс фоновой синхронизации
+        progress_frame = ttk.Frame(sync_frame)
+        progress_frame.pack(fill='x', pady=5)
+        
+        self.sync_progress = ttk.Progressbar(progress_frame, mode='determinate', maximum=100)
+        self.sync_progress.pack(side='left', fill='x', expand=True, padx=5)
+        self.cancel_sync_button = ttk.Button(progress_frame, text="Отменить",
+                                             command=self.cancel_sync, state='disabled')
+        self.cancel_sync_button.pack(side='left', padx=5)
+        
         # Статус синхронизации
         self.sync_status = ttk.Label(sync_frame, text="Статус: Не подключено", foreground='red')
         self.sync_status.pack(pady=10)
@@ -178,6 +251,12 @@ class FinanceTracker:
         self.sync_details = ttk.Label(sync_frame, text="", justify='left', foreground='gray')
         self.sync_details.pack(pady=5)
     
+    def start_sheets_outbox(self):
+        """Запуск фонового переноса очереди в Google Sheets"""
+        self.sheets_outbox.start(
+            lambda sheet, operations: self.google_sheets.apply_operations(sheet, operations)
+        )
+    
     def select_credentials_file(self):
         """Выбор файла credentials.json"""
         file_path = filedialog.askopenfilename(
@@ -188,10 +267,66 @@ class FinanceTracker:
             self.google_sheets.set_credentials_file(file_path)
             self.creds_path_label.config(text=file_path)
             self.sync_status.config(text="Статус: Файл выбран, подключитесь", foreground='orange')
+            self.start_sheets_outbox()
+    
+    def start_sync_job(self, name, func, on_success):
+        """Запуск операции синхронизации в фоновом потоке"""
+        started = self.sync_executor.submit(
+            name, func,
+            on_success=lambda result: self._finish_sync_job(on_success, result),
+            on_error=self._on_sync_error,
+            on_progress=self._on_sync_progress,
+            on_cancel=self._on_sync_cancelled
+        )
+        if not started:
+            messagebox.showwarning("Предупреждение", "Синхронизация уже выполняется")
+            return False
+        
+        self.sync_status.config(text=f"Статус: {name}...", foreground='orange')
+        self.sync_progress.config(mode='indeterminate')
+        self.sync_progress.start(20)
+        self.cancel_sync_button.config(state='normal')
+        return True
+    
+    def cancel_sync(self):
+        """Отмена текущей синхронизации"""
+        self.sync_executor.cancel()
+        self.sync_status.config(text="Статус: Отмена...", foreground='orange')
+    
+    def _reset_sync_progress(self):
+        self.sync_progress.stop()
+        self.sync_progress.config(mode='determinate', value=0)
+        self.cancel_sync_button.config(state='disabled')
+    
+    def _finish_sync_job(self, on_success, result):
+        self._reset_sync_progress()
+        on_success(result)
+    
+    def _on_sync_progress(self, done, total, message):
+        if total:
+            self.sync_progress.stop()
+            self.sync_progress.config(mode='determinate', value=done * 100 / total)
+        if message:
+            self.sync_details.config(text=message)
+    
+    def _on_sync_error(self, error):
+        self._reset_sync_progress()
+        self.sync_status.config(text="Статус: Ошибка синхронизации", foreground='red')
+        self.sync_details.config(text=str(error))
+        messagebox.showerror("Ошибка", f"Ошибка синхронизации:\n{error}")
+    
+    def _on_sync_cancelled(self, result):
+        self._reset_sync_progress()
+        self.sync_status.config(text="Статус: Синхронизация отменена", foreground='orange')
     
     def test_connection(self):
         """Тестирование подключения к Google Sheets"""
-        success, message = self.google_sheets.authenticate()
+        self.start_sync_job("Проверка подключения",
+                            lambda job: self.google_sheets.authenticate(),
+                            self._on_connection_tested)
+    
+    def _on_connection_tested(self, result):
+        success, message = result
         if success:
             self.sync_status.config(text="Статус: Подключено", foreground='green')
             self.sync_details.config(text=message)
@@ -207,33 +342,57 @@ class FinanceTracker:
         if not transactions:
             messagebox.showwarning("Предупреждение", "Нет данных для загрузки")
             return
-            
-        success, message = self.google_sheets.upload_data(transactions)
+        
+        self.start_sync_job(
+            "Загрузка в Google Sheets",
+            lambda job: self.google_sheets.upload_data(
+                transactions, progress=job.report, should_cancel=job.is_cancelled
+            ),
+            self._on_upload_finished
+        )
+    
+    def _on_upload_finished(self, result):
+        success, message = result
         if success:
+            self.sync_status.config(text="Статус: Подключено", foreground='green')
             messagebox.showinfo("Успех", "Данные успешно загружены в Google Sheets!")
             self.sync_details.config(text=message)
         else:
+            self.sync_status.config(text="Статус: Ошибка синхронизации", foreground='red')
             messagebox.showerror("Ошибка", f"Не удалось загрузить данные в Google Sheets:\n{message}")
             self.sync_details.config(text=message)
     
-    def download_from_sheets(self):
-        """Загрузка данных из Google Sheets"""
-        result = messagebox.askyesno(
-            "Подтверждение", 
-            "Вы уверены? Текущие локальные данные будут заменены данными из Google Sheets."
+    def sync_with_sheets(self):
+        """Двусторонняя синхронизация с Google Sheets"""
+        transactions = self.transaction_manager.get_all_transactions()
+        synced_ids = {t['id'] for t in transactions}
+        self.start_sync_job(
+            "Синхронизация с Google Sheets",
+            lambda job: self.google_sheets.sync_two_way(
+                transactions, progress=job.report, should_cancel=job.is_cancelled
+            ),
+            lambda result: self._on_two_way_sync_finished(result, synced_ids)
         )
-        if not result:
+    
+    def _on_two_way_sync_finished(self, result, synced_ids):
+        if result is None:
+            self.sync_status.config(text="Статус: Ошибка синхронизации", foreground='red')
+            messagebox.showerror("Ошибка", "Не удалось синхронизировать данные с Google Sheets")
             return
-            
-        transactions = self.google_sheets.download_data()
-        if transactions:
-            # Очищаем текущие транзакции и заменяем новыми
-            self.transaction_manager.transactions = transactions
-            self.transaction_manager.save_data()
+        
+        # Применяем к текущим данным только изменения из таблицы:
+        # транзакции, добавленные во время синхронизации, сохраняются
+        if result['upserts'] or result['deletes']:
+            self.transaction_manager.apply_remote_changes(result['upserts'], result['deletes'], synced_ids)
             self.refresh_transactions()
-            messagebox.showinfo("Успех", f"Загружено {len(transactions)} записей из Google Sheets!")
-        else:
-            messagebox.showerror("Ошибка", "Не удалось загрузить данные из Google Sheets")
+        
+        self.sync_status.config(text="Статус: Подключено", foreground='green')
+        self.sync_details.config(text=(
+            f"Получено из таблицы: {len(result['upserts'])}\n"
+            f"Удалено локально: {len(result['deletes'])}\n"
+            f"Отправлено в таблицу: {result['pushed']}\n"
+            f"Конфликтов: {result['conflicts']}"
+        ))
     
     def open_sheets(self):
         """Открытие таблицы в браузере"""
@@ -255,7 +414,11 @@ class FinanceTracker:
             }
             
             if self.transaction_manager.add_transaction(transaction):
-                self.refresh_transactions()
+                # Добавляем только новую строку, а не перерисовываем всю таблицу
+                self._insert_visible_row(transaction)
+                self.sheets_outbox.enqueue(self.google_sheets.sheet_name, transaction['id'],
+                                           transaction_to_row(transaction))
+                self.update_statistics()
                 self.clear_form()
                 messagebox.showinfo("Успех", "Транзакция добавлена!")
             else:
@@ -266,38 +429,232 @@ class FinanceTracker:
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка при добавлении: {e}")
     
+    def import_statement(self):
+        """Импорт банковской выписки CSV/XLSX: чтение и проверка в фоне, сохранение одним вызовом"""
+        file_path = filedialog.askopenfilename(
+            title="Выберите выписку",
+            filetypes=[("Выписки", "*.csv *.xlsx"), ("CSV", "*.csv"), ("Excel", "*.xlsx")]
+        )
+        if not file_path:
+            return
+        try:
+            header = read_header(file_path)
+        except StatementImportError as e:
+            messagebox.showerror("Ошибка", str(e))
+            return
+        if not header:
+            messagebox.showwarning("Предупреждение", "Файл пуст")
+            return
+        
+        choice = self.ask_column_mapping(header)
+        if choice is None:
+            return
+        mapping, default_category = choice
+        
+        # Дубли проверяются по снимку индекса хешей: фоновый поток не трогает менеджер
+        known_hashes = self.transaction_manager.hash_counts()
+        started = self.sync_executor.submit(
+            "Импорт выписки",
+            lambda job: parse_statement(file_path, mapping, known_hashes, default_category,
+                                        progress=job.report, should_cancel=job.is_cancelled),
+            on_success=self._on_import_parsed,
+            on_error=self._on_import_error,
+            on_progress=self._on_import_progress,
+            on_cancel=lambda result: self._finish_import("Импорт отменен")
+        )
+        if not started:
+            messagebox.showwarning("Предупреждение", "Дождитесь окончания синхронизации")
+            return
+        self.import_progress.config(value=0)
+        self.import_status.config(text="Импорт...")
+    
+    def ask_column_mapping(self, header):
+        """Диалог сопоставления колонок выписки с полями; (mapping, категория) или None"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Колонки выписки")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        not_selected = "—"
+        columns = [not_selected] + [f"{index + 1}: {title}" for index, title in enumerate(header)]
+        guessed = guess_mapping(header)
+        combos = {}
+        for row, field in enumerate(FIELDS):
+            ttk.Label(dialog, text=f"{FIELD_LABELS[field]}:").grid(row=row, column=0, sticky='w', padx=10, pady=2)
+            combo = ttk.Combobox(dialog, values=columns, state='readonly', width=35)
+            combo.current(guessed[field] + 1 if field in guessed else 0)
+            combo.grid(row=row, column=1, sticky='ew', padx=10, pady=2)
+            combos[field] = combo
+        
+        ttk.Label(dialog, text="Категория по умолчанию:").grid(row=len(FIELDS), column=0, sticky='w', padx=10, pady=2)
+        category_entry = ttk.Entry(dialog)
+        category_entry.insert(0, DEFAULT_CATEGORY)
+        category_entry.grid(row=len(FIELDS), column=1, sticky='ew', padx=10, pady=2)
+        ttk.Label(dialog, text="Без колонки типа доход и расход определяются по знаку суммы",
+                  foreground='gray').grid(row=len(FIELDS) + 1, column=0, columnspan=2, padx=10, pady=5)
+        
+        choice = []
+        
+        def confirm():
+            mapping = {field: combo.current() - 1 for field, combo in combos.items() if combo.current() > 0}
+            missing = [FIELD_LABELS[field] for field in REQUIRED_FIELDS if field not in mapping]
+            if missing:
+                messagebox.showerror("Ошибка", f"Выберите колонки: {', '.join(missing)}", parent=dialog)
+                return
+            choice.append((mapping, category_entry.get().strip() or DEFAULT_CATEGORY))
+            dialog.destroy()
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.grid(row=len(FIELDS) + 2, column=0, columnspan=2, pady=10)
+        ttk.Button(button_frame, text="Импортировать", command=confirm).pack(side='left', padx=5)
+        ttk.Button(button_frame, text="Отмена", command=dialog.destroy).pack(side='left', padx=5)
+        
+        self.root.wait_window(dialog)
+        return choice[0] if choice else None
+    
+    def _on_import_progress(self, done, total, message):
+        if total:
+            self.import_progress.config(value=done * 100 / total)
+        if message:
+            self.import_status.config(text=message)
+    
+    def _on_import_parsed(self, result):
+        # Все новые транзакции сохраняются одним вызовом и одной записью в очередь Sheets
+        added = self.transaction_manager.add_transactions(result['transactions'])
+        self.sheets_outbox.enqueue_many(self.google_sheets.sheet_name,
+                                        [(t['id'], transaction_to_row(t)) for t in added])
+        self.refresh_transactions()
+        self._finish_import(f"Импортировано: {len(added)}")
+        messagebox.showinfo("Импорт", (
+            f"Строк в выписке: {result['rows']}\n"
+            f"Добавлено: {len(added)}\n"
+            f"Дубликатов пропущено: {result['duplicates']}\n"
+            f"Неверных строк: {result['invalid']}"
+        ))
+    
+    def _on_import_error(self, error):
+        self._finish_import("Ошибка импорта")
+        messagebox.showerror("Ошибка", f"Не удалось импортировать выписку:\n{error}")
+    
+    def _finish_import(self, status):
+        self.import_progress.config(value=0)
+        self.import_status.config(text=status)
+    
     def delete_selected(self):
-        selected = self.tree.selection()
+        selected = self.tree.selected_keys()
         if not selected:
             messagebox.showwarning("Предупреждение", "Выберите транзакцию для удаления")
             return
         
-        for item in selected:
-            item_id = self.tree.item(item)['values'][0]  # Получаем ID из первой колонки
-            self.transaction_manager.delete_transaction(item_id)
+        self.transaction_manager.delete_transactions(selected)
+        for transaction_id in selected:
+            self.sheets_outbox.enqueue_delete(self.google_sheets.sheet_name, transaction_id)
         
-        self.refresh_transactions()
+        # Удаляем из таблицы только затронутые строки
+        self.tree.remove_keys(selected)
+        self._update_page_controls()
+        self.update_statistics()
         messagebox.showinfo("Успех", "Транзакции удалены!")
     
     def refresh_transactions(self):
-        # Очищаем таблицу
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # Добавляем транзакции
-        for transaction in self.transaction_manager.get_all_transactions():
-            self.tree.insert('', 'end', values=(
-                transaction['id'],
-                transaction['date'],
-                transaction['category'],
-                f"{transaction['amount']:.2f}",
-                transaction['type'],
-                transaction['description']
-            ))
+        # Таблица виртуальная: в виджете создаются только видимые строки,
+        # а данные берутся из индексов постранично
+        # (после изменения данных поиск выполняется заново, без сужения)
+        self.search_ids = self.transaction_manager.search(self.search_query)
+        self.load_first_page()
+        self.filter_category_combo.config(
+            values=[ALL_VALUES] + self.transaction_manager.get_categories())
         
         # Обновляем статистику
         self.update_statistics()
     
+    def apply_filter(self):
+        """Выборка по датам, категории и типу из панели фильтра"""
+        category = self.filter_category_combo.get()
+        transaction_type = self.filter_type_combo.get()
+        self.filter_params = {
+            'date_from': self.filter_from_entry.get().strip() or None,
+            'date_to': self.filter_to_entry.get().strip() or None,
+            'category': None if category in ('', ALL_VALUES) else category,
+            'type': None if transaction_type in ('', ALL_VALUES) else transaction_type,
+        }
+        self.load_first_page()
+    
+    def reset_filter(self):
+        self.filter_from_entry.delete(0, tk.END)
+        self.filter_to_entry.delete(0, tk.END)
+        self.filter_category_combo.set(ALL_VALUES)
+        self.filter_type_combo.set(ALL_VALUES)
+        self.filter_params = {}
+        self.load_first_page()
+    
+    def _on_search_changed(self, *args):
+        # Поиск запускается, когда пользователь перестал печатать
+        if self._search_job is not None:
+            self.root.after_cancel(self._search_job)
+        self._search_job = self.root.after(SEARCH_DELAY_MS, self.run_search)
+    
+    def run_search(self):
+        self._search_job = None
+        query = self.search_var.get().strip().lower()
+        if query == self.search_query:
+            return
+        # Дописанный запрос только сужает результат: проверяем прошлые совпадения
+        within = None
+        if self.search_ids is not None and self.search_query and query.startswith(self.search_query):
+            within = self.search_ids
+        self.search_ids = self.transaction_manager.search(query, within=within)
+        self.search_query = query
+        self.load_first_page()
+    
+    def load_first_page(self):
+        page, self.next_cursor = self.transaction_manager.query(ids=self.search_ids,
+                                                                **self.filter_params)
+        self.tree.set_rows(page)
+        self.tree.scroll_to(0)
+        self._update_page_controls()
+    
+    def load_next_page(self):
+        if self.next_cursor is None:
+            return
+        page, self.next_cursor = self.transaction_manager.query(ids=self.search_ids,
+                                                                cursor=self.next_cursor,
+                                                                **self.filter_params)
+        self.tree.append_rows(page)
+        self._update_page_controls()
+    
+    def _update_page_controls(self):
+        self.more_button.config(state='normal' if self.next_cursor is not None else 'disabled')
+        suffix = "" if self.next_cursor is None else " (есть еще)"
+        self.shown_label.config(text=f"Показано: {len(self.tree)}{suffix}")
+    
+    def _insert_visible_row(self, transaction):
+        """Вставка новой транзакции в таблицу, если она попадает в фильтр и загруженные страницы"""
+        if not self.transaction_manager.matches(transaction, **self.filter_params):
+            return
+        if self.search_ids is not None:
+            if not self.transaction_manager.search(self.search_query, within=[transaction['id']]):
+                return
+            self.search_ids.add(transaction['id'])
+        key = (transaction['date'], transaction['id'])
+        # Строка после последней загруженной попадет на одну из следующих страниц
+        if self.next_cursor is not None and key > tuple(self.next_cursor):
+            return
+        index = bisect_right(self.tree.rows, key, key=lambda row: (row['date'], row['id']))
+        self.tree.insert_row(transaction, index)
+        self._update_page_controls()
+    
+    def _format_transaction_row(self, transaction):
+        """Значения колонок таблицы для транзакции"""
+        return (
+            transaction['id'],
+            transaction['date'],
+            transaction['category'],
+            f"{float(transaction['amount']):.2f}",
+            transaction['type'],
+            transaction.get('description', '')
+        )
+    
     def update_statistics(self):
         stats = self.transaction_manager.get_statistics()
         stats_text = f"""Общий доход: {stats['total_income']:.2f} ₽
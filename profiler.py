@@ -0,0 +1,77 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Одновременно может работать только один профилировщик
+_active_lock = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    """Профилирование уже выполняется"""
+
+
+class SamplingProfiler:
+    """Сэмплирующий профилировщик всего процесса.
+
+    Отдельный поток через каждые interval секунд снимает стеки всех потоков
+    (sys._current_frames) и считает одинаковые стеки. Результат выдается в
+    свернутом формате (collapsed stacks), который понимают flamegraph.pl и
+    speedscope. Пока профилирование не запущено, никаких затрат нет.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.duration = 0.0
+
+    def run(self, duration: float) -> 'SamplingProfiler':
+        """Сбор сэмплов в текущем потоке в течение duration секунд"""
+        if not _active_lock.acquire(blocking=False):
+            raise ProfilerBusy("Профилирование уже выполняется")
+        try:
+            own_thread = threading.get_ident()
+            names = {}
+            started = time.perf_counter()
+            deadline = started + duration
+            while time.perf_counter() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_thread:
+                        continue
+                    if thread_id not in names:
+                        names = {t.ident: t.name for t in threading.enumerate()}
+                    self.stacks[self._collapse(names.get(thread_id, str(thread_id)), frame)] += 1
+                self.samples += 1
+                time.sleep(self.interval)
+            self.duration = time.perf_counter() - started
+        finally:
+            _active_lock.release()
+        return self
+
+    def _collapse(self, thread_name: str, frame) -> str:
+        parts = []
+        while frame is not None and len(parts) < self.max_depth:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        parts.append(f"thread:{thread_name}")
+        parts.reverse()
+        return ';'.join(part.replace(';', ':') for part in parts)
+
+    def collapsed(self) -> str:
+        """Свернутые стеки: по строке «кадр;кадр;... количество» на стек"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, top: int = 10) -> str:
+        """Самые частые верхние кадры (где процесс проводит время)"""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        lines = [f"Сэмплов: {self.samples} за {self.duration:.1f} с"]
+        for frame, count in leaves.most_common(top):
+            lines.append(f"{count * 100 / total:5.1f}%  {frame}")
+        return '\n'.join(lines)
@@ -0,0 +1,59 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Ограничитель частоты запросов (token bucket).
+
+    Корзина пополняется со скоростью rate токенов в секунду и вмещает не
+    больше capacity токенов, поэтому допускаются короткие всплески.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_window(cls, max_requests: int, window_seconds: float) -> 'TokenBucket':
+        """Корзина на max_requests запросов за window_seconds секунд"""
+        return cls(max_requests / window_seconds, capacity=max_requests)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Взять токены без ожидания"""
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """Сколько секунд ждать, пока накопится нужное число токенов"""
+        with self._lock:
+            self._refill()
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def acquire(self, tokens: float = 1, timeout: float = None) -> bool:
+        """Взять токены, ожидая их накопления (не дольше timeout секунд)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                delay = (tokens - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                delay = min(delay, remaining)
+            time.sleep(delay)
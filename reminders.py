@@ -0,0 +1,296 @@
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from config import config
+from google_sheets import STATUS_THRESHOLDS, get_status_icon_and_text
+from rate_limit import TokenBucket
+from delivery import BULK
+
+logger = logging.getLogger(__name__)
+
+
+def load_filters_from_db(db_path: str = config.DB_PATH) -> List[Dict]:
+    """Загрузка фильтров из SQLite (пустой список, если базы или таблицы нет)"""
+    if not os.path.exists(db_path):
+        return []
+    try:
+        with closing(sqlite3.connect(db_path)) as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute("SELECT * FROM filters").fetchall()
+    except sqlite3.DatabaseError as e:
+        logger.warning("Не удалось прочитать фильтры из %s: %s", db_path, e)
+        return []
+    return [dict(row) for row in rows]
+
+
+class ReminderScheduler:
+    """Напоминания об истечении срока службы фильтров.
+
+    Для каждого фильтра в куче лежит время пересечения ближайшего порога
+    (30, 7 и 0 дней до истечения, а также EARLY_REMINDER_DAYS). Единственное
+    задание JobQueue переставляется на вершину кучи, поэтому бот просыпается
+    ровно к следующему порогу вместо ежедневного просмотра всех фильтров.
+    Уведомления одного пользователя объединяются в одно сообщение, отправка
+    ограничена по частоте и идет в отдельном потоке, а не в потоке JobQueue.
+
+    Последний отправленный порог каждого фильтра хранится в state_path.
+    При загрузке фильтров пороги, пропущенные, пока бот не работал,
+    отправляются сразу (для фильтра - только самый поздний из пропущенных).
+    """
+
+    def __init__(self, job_queue, bot, db_path: str = config.DB_PATH,
+                 send_hour: int = config.REMINDER_SEND_HOUR, rate_limiter: TokenBucket = None,
+                 delivery=None, state_path: str = config.REMINDER_STATE_PATH):
+        self.job_queue = job_queue
+        self.bot = bot
+        # Очередь исходящих сообщений бота: напоминания уходят как рассылка и не задерживают ответы
+        self.delivery = delivery
+        self.db_path = db_path
+        self.state_path = state_path
+        self.send_hour = send_hour
+        self.rate_limiter = rate_limiter or TokenBucket.per_window(
+            config.RATE_LIMIT_MAX_REQUESTS, config.RATE_LIMIT_WINDOW
+        )
+        # Пороги по убыванию дней: моменты срабатывания идут по возрастанию
+        self.thresholds = sorted(
+            {days for days, _, _ in STATUS_THRESHOLDS} | {config.EARLY_REMINDER_DAYS},
+            reverse=True
+        )
+
+        self._heap = []           # (время срабатывания, порядковый номер, id, версия, порог)
+        self._filters = {}        # id фильтра -> фильтр
+        self._versions = {}       # id фильтра -> версия записи в куче
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._job = None
+        self._next_wake = None
+        self._source_mtime = None
+        # Ожидание квоты при отправке не должно держать поток JobQueue
+        self._sender = ThreadPoolExecutor(max_workers=1, thread_name_prefix='reminder-sender')
+        self._init_state()
+
+    def _connect_state(self):
+        conn = sqlite3.connect(self.state_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_state(self):
+        with closing(self._connect_state()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS reminders_sent (
+                    filter_id TEXT PRIMARY KEY,
+                    expiry_date TEXT NOT NULL,
+                    threshold INTEGER NOT NULL,
+                    sent_at TEXT NOT NULL
+                )
+            """)
+
+    def _load_sent(self) -> Dict[str, Tuple[str, int]]:
+        """id фильтра -> (дата истечения, последний отправленный порог)"""
+        with closing(self._connect_state()) as conn:
+            rows = conn.execute("SELECT filter_id, expiry_date, threshold FROM reminders_sent").fetchall()
+        return {filter_id: (expiry_date, threshold) for filter_id, expiry_date, threshold in rows}
+
+    def _mark_sent(self, due: List[Tuple[Dict, int]]):
+        sent_at = datetime.now().isoformat()
+        with closing(self._connect_state()) as conn, conn:
+            conn.executemany("""
+                INSERT INTO reminders_sent (filter_id, expiry_date, threshold, sent_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (filter_id) DO UPDATE SET
+                    expiry_date = excluded.expiry_date, threshold = excluded.threshold,
+                    sent_at = excluded.sent_at
+            """, [(str(f['id']), str(f['expiry_date']), days, sent_at) for f, days in due])
+
+    def start(self):
+        """Построение индекса и запуск планировщика"""
+        self.reload()
+        # Страховочная сверка: индекс перестраивается, только если база изменилась
+        self.job_queue.run_repeating(
+            self._check_source, interval=config.REMINDER_CHECK_INTERVAL,
+            first=config.REMINDER_CHECK_INTERVAL, name='filter_reminders_check'
+        )
+
+    def stop(self):
+        self._sender.shutdown(wait=True)
+
+    def reload(self):
+        """Перестроение индекса по данным из базы и отправка пропущенных напоминаний"""
+        filters = load_filters_from_db(self.db_path)
+        sent = self._load_sent()
+        now = datetime.now()
+        overdue = []
+        with self._lock:
+            self._heap = []
+            self._filters = {}
+            for f in filters:
+                self._schedule(f, now)
+                days = self._last_passed_threshold(f, now)
+                last_sent = sent.get(str(f['id']))
+                # Пороги идут по убыванию дней: меньший порог - более поздний
+                if days is not None and not (last_sent and last_sent[0] == str(f['expiry_date'])
+                                             and last_sent[1] <= days):
+                    overdue.append((f, days))
+        self._source_mtime = self._db_mtime()
+        logger.info("⏰ Напоминания: в индексе %s фильтров, пропущенных порогов %s",
+                    len(self._heap), len(overdue))
+        if overdue:
+            self._dispatch(overdue)
+        self._rearm()
+
+    def upsert_filter(self, f: Dict):
+        """Добавление или изменение фильтра"""
+        with self._lock:
+            self._schedule(f, datetime.now())
+        self._rearm()
+
+    def remove_filter(self, filter_id):
+        """Удаление фильтра (его записи в куче станут неактуальными)"""
+        with self._lock:
+            self._filters.pop(filter_id, None)
+            self._versions[filter_id] = self._versions.get(filter_id, 0) + 1
+
+    @staticmethod
+    def _expiry_date(f: Dict) -> Optional[date]:
+        try:
+            return datetime.strptime(str(f['expiry_date']), '%Y-%m-%d').date()
+        except (KeyError, ValueError):
+            return None
+
+    def _fire_at(self, expiry_date: date, days: int) -> datetime:
+        return datetime.combine(expiry_date - timedelta(days=days), time(self.send_hour))
+
+    def _last_passed_threshold(self, f: Dict, now: datetime) -> Optional[int]:
+        """Самый поздний порог фильтра, время которого уже наступило"""
+        expiry_date = self._expiry_date(f)
+        if expiry_date is None:
+            return None
+        passed = [days for days in self.thresholds if self._fire_at(expiry_date, days) <= now]
+        return passed[-1] if passed else None
+
+    def _schedule(self, f: Dict, after: datetime):
+        """Помещение в кучу ближайшего порога фильтра позже момента after"""
+        filter_id = f['id']
+        version = self._versions.get(filter_id, 0) + 1
+        self._versions[filter_id] = version
+        self._filters[filter_id] = f
+
+        expiry_date = self._expiry_date(f)
+        if expiry_date is None:
+            logger.error("❌ Неверная дата истечения у фильтра %s: %s", filter_id, f.get('expiry_date'))
+            return
+
+        for days in self.thresholds:
+            fire_at = self._fire_at(expiry_date, days)
+            if fire_at > after:
+                heapq.heappush(self._heap, (fire_at, next(self._counter), filter_id, version, days))
+                return
+
+    def _is_current(self, entry) -> bool:
+        _, _, filter_id, version, _ = entry
+        return filter_id in self._filters and self._versions.get(filter_id) == version
+
+    def _rearm(self):
+        """Перенос задания JobQueue на время ближайшего порога"""
+        with self._lock:
+            while self._heap and not self._is_current(self._heap[0]):
+                heapq.heappop(self._heap)
+            next_wake = self._heap[0][0] if self._heap else None
+
+        if next_wake == self._next_wake:
+            return
+        if self._job is not None:
+            self._job.schedule_removal()
+            self._job = None
+        self._next_wake = next_wake
+        if next_wake is not None:
+            # Задержка в секундах не зависит от часового пояса JobQueue
+            delay = max(0.0, (next_wake - datetime.now()).total_seconds())
+            self._job = self.job_queue.run_once(self._on_wake, delay, name='filter_reminders')
+
+    def _on_wake(self, context):
+        self._job = None
+        self._next_wake = None
+        now = datetime.now()
+
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if not self._is_current(entry):
+                    continue
+                # Пробуждение могло опоздать на несколько порогов (бот стоял,
+                # JobQueue была занята): фильтр получает одну строку с самым
+                # поздним наступившим порогом, следующий ставится позже now
+                f = self._filters[entry[2]]
+                days = self._last_passed_threshold(f, now)
+                due.append((f, entry[4] if days is None else days))
+                self._schedule(f, now)
+
+        if due:
+            self._dispatch(due)
+        self._rearm()
+
+    def _dispatch(self, due: List[Tuple[Dict, int]]):
+        """Отметка порогов как отправленных и передача сообщений потоку отправки"""
+        try:
+            self._mark_sent(due)
+        except sqlite3.Error as e:
+            logger.error("❌ Не удалось сохранить отправленные напоминания: %s", e)
+        self._sender.submit(self._send_safely, [f for f, _ in due])
+
+    def _send_safely(self, filters: List[Dict]):
+        try:
+            self._send_batch(filters)
+        except Exception:
+            logger.exception("❌ Ошибка отправки напоминаний")
+
+    def _send_batch(self, filters: List[Dict]):
+        """Отправка уведомлений: одно сообщение на пользователя"""
+        today = datetime.now().date()
+        by_user = {}
+        for f in filters:
+            by_user.setdefault(f['user_id'], []).append(f)
+
+        sent = 0
+        for user_id, user_filters in by_user.items():
+            lines = ["🔔 Напоминание о замене фильтров:", ""]
+            for f in user_filters:
+                expiry_date = datetime.strptime(str(f['expiry_date']), '%Y-%m-%d').date()
+                days_left = (expiry_date - today).days
+                icon, status = get_status_icon_and_text(days_left)
+                lines.append(
+                    f"{icon} {f.get('filter_type', '')} ({f.get('location', '')}): {status}, "
+                    f"осталось {max(days_left, 0)} дн. (до {expiry_date.strftime('%d.%m.%Y')})"
+                )
+
+            if self.delivery is not None:
+                self.delivery.send(user_id, "\n".join(lines), BULK)
+                sent += 1
+                continue
+
+            self.rate_limiter.acquire()
+            try:
+                self.bot.send_message(chat_id=user_id, text="\n".join(lines))
+                sent += 1
+            except Exception as e:
+                logger.error("❌ Не удалось отправить напоминание пользователю %s: %s", user_id, e)
+
+        logger.info("🔔 Поставлено в отправку напоминаний: %s (фильтров: %s)", sent, len(filters))
+
+    def _db_mtime(self):
+        try:
+            return os.path.getmtime(self.db_path)
+        except OSError:
+            return None
+
+    def _check_source(self, context):
+        if self._db_mtime() != self._source_mtime:
+            self.reload()
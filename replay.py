@@ -0,0 +1,176 @@
+"""Воспроизведение записанного трафика через ConversationHandler бота.
+
+Обновления из JSONL (см. update_recorder.py) подаются в dispatcher.process_update
+с исходными интервалами, ускоренными в --speed раз (0 - без пауз). Ответы бота
+уходят на локальный fake_telegram, данные пишутся во временный каталог, поэтому
+рабочие файлы не затрагиваются. В конце печатается пропускная способность,
+задержки по состояниям диалога и статистика чтения/записи хранилища.
+
+    python replay.py recorded_updates.jsonl --speed 10 --data-dir ./snapshot
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from fake_telegram import FAKE_TOKEN, FakeTelegramServer
+
+STORAGE_FUNCTIONS = ('load_objects', 'save_objects', 'load_salaries', 'save_salaries',
+                     'load_materials', 'save_materials')
+
+
+def load_recording(path: str) -> List[Tuple[float, Dict]]:
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                records.append((float(record.get('t', 0)), record['update']))
+    return records
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+class StorageStats:
+    """Счетчики вызовов и времени функций JSON-хранилища бота"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls: Dict[str, List[float]] = {}
+        self.bytes_written = 0
+
+    def instrument(self, module):
+        for name in STORAGE_FUNCTIONS:
+            setattr(module, name, self._wrap(name, getattr(module, name), module))
+
+    def _wrap(self, name, func, module):
+        path = getattr(module, f"{name.split('_', 1)[1].upper()}_FILE")
+
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self.calls.setdefault(name, []).append(elapsed)
+                    if name.startswith('save_') and os.path.exists(path):
+                        self.bytes_written += os.path.getsize(path)
+        return wrapper
+
+
+def replay(records: List[Tuple[float, Dict]], speed: float = 1.0, data_dir: str = None,
+           latency: float = 0.0) -> Dict:
+    from telegram import Bot, Update
+    from telegram.ext import Dispatcher
+
+    os.environ.setdefault('BOT_TOKEN', FAKE_TOKEN)
+    workdir = tempfile.mkdtemp(prefix='replay-')
+    if data_dir:
+        for name in os.listdir(data_dir):
+            if name.endswith('.json'):
+                shutil.copy(os.path.join(data_dir, name), workdir)
+    previous_dir = os.getcwd()
+    os.chdir(workdir)
+
+    server = FakeTelegramServer(latency=latency).start()
+    try:
+        import bot as bot_module
+
+        bot_module.init_data()
+        storage = StorageStats()
+        storage.instrument(bot_module)
+
+        telegram_bot = Bot(os.environ['BOT_TOKEN'], base_url=server.base_url)
+        dispatcher = Dispatcher(telegram_bot, None, workers=0, use_context=True)
+        conv_handler = bot_module.build_conversation_handler()
+        dispatcher.add_handler(conv_handler)
+
+        latencies: Dict[str, List[float]] = {}
+        errors = 0
+        started = time.perf_counter()
+        first_offset = records[0][0] if records else 0.0
+        for offset, data in records:
+            if speed > 0:
+                delay = (offset - first_offset) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+            update = Update.de_json(data, telegram_bot)
+            user, chat = update.effective_user, update.effective_chat
+            key = (chat.id, user.id) if user and chat else None
+            state = conv_handler.conversations.get(key) if key else None
+
+            began = time.perf_counter()
+            try:
+                dispatcher.process_update(update)
+            except Exception:
+                errors += 1
+            latencies.setdefault(str(state), []).append(time.perf_counter() - began)
+        elapsed = time.perf_counter() - started
+    finally:
+        server.stop()
+        os.chdir(previous_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'updates': len(records),
+        'seconds': elapsed,
+        'throughput': len(records) / elapsed if elapsed else 0.0,
+        'errors': errors,
+        'replies': server.sent_count,
+        'latencies': latencies,
+        'storage': storage.calls,
+        'bytes_written': storage.bytes_written,
+    }
+
+
+def print_report(report: Dict):
+    print(f"Обновлений: {report['updates']} за {report['seconds']:.2f} с "
+          f"({report['throughput']:.1f} в секунду), ответов бота: {report['replies']}, "
+          f"ошибок: {report['errors']}")
+    print()
+    print(f"{'Состояние':>10} {'кол-во':>8} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'max, мс':>9}")
+    for state, values in sorted(report['latencies'].items()):
+        print(f"{state:>10} {len(values):>8} {percentile(values, 50) * 1000:>9.2f} "
+              f"{percentile(values, 95) * 1000:>9.2f} {percentile(values, 99) * 1000:>9.2f} "
+              f"{max(values) * 1000:>9.2f}")
+    print()
+    print(f"{'Хранилище':>16} {'вызовов':>8} {'всего, мс':>10} {'среднее, мс':>12}")
+    for name, values in sorted(report['storage'].items()):
+        print(f"{name:>16} {len(values):>8} {sum(values) * 1000:>10.1f} "
+              f"{sum(values) * 1000 / len(values):>12.3f}")
+    print(f"Записано в JSON: {report['bytes_written'] / 1024:.1f} КБ")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Воспроизведение записанных обновлений")
+    parser.add_argument('recording', help="JSONL-файл, записанный UpdateRecorder")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="ускорение относительно исходного темпа (0 - без пауз)")
+    parser.add_argument('--data-dir', help="каталог с исходными objects/salaries/materials.json")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="искусственная задержка ответов Bot API, с")
+    args = parser.parse_args(argv)
+
+    records = load_recording(args.recording)
+    if not records:
+        print("Запись пуста")
+        return 1
+    print_report(replay(records, args.speed, args.data_dir, args.latency))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
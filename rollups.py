@@ -0,0 +1,169 @@
+"""Агрегаты расходов: объект × период (месяц, неделя) × категория.
+
+Каждая подтвержденная зарплата или материал добавляется в агрегаты сразу
+(add), поэтому отчеты читают готовые суммы по корзинам, а не перечитывают
+salaries.json и materials.json. Суммы хранятся в копейках (целые), повторное
+добавление той же записи игнорируется. Агрегаты всегда можно пересчитать из
+истории (JSON и запечатанные сегменты ledger/):
+
+    python rollups.py rebuild
+"""
+import logging
+import sqlite3
+import sys
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+SALARY = 'salary'
+MATERIALS = 'materials'
+PERIOD_TYPES = ('month', 'week')
+
+
+def period_keys(date_text: str) -> Dict[str, str]:
+    """Корзины записи: {'month': '2024-05', 'week': '2024-W19'}"""
+    moment = datetime.strptime(str(date_text)[:10], '%Y-%m-%d')
+    year, week, _ = moment.isocalendar()
+    return {'month': f"{moment.year:04d}-{moment.month:02d}", 'week': f"{year:04d}-W{week:02d}"}
+
+
+def to_kopecks(amount) -> int:
+    return int(round(float(amount) * 100))
+
+
+class RollupStore:
+    """Агрегаты в SQLite: одна строка на (объект, тип периода, период, категория)"""
+
+    def __init__(self, db_path: str = 'rollups.db'):
+        self.db_path = db_path
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rollups (
+                    object TEXT NOT NULL,
+                    period_type TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (object, period_type, period, category)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS rollups_period ON rollups (period_type, period)")
+            # Учтенные записи: повторный add той же записи ничего не меняет
+            conn.execute("CREATE TABLE IF NOT EXISTS applied (record_id TEXT PRIMARY KEY)")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _apply(conn, record_id: str, object_key: str, category: str, amount, date_text: str) -> bool:
+        inserted = conn.execute("INSERT OR IGNORE INTO applied (record_id) VALUES (?)",
+                                (record_id,)).rowcount
+        if not inserted:
+            return False
+        kopecks = to_kopecks(amount)
+        for period_type, period in period_keys(date_text).items():
+            conn.execute("""
+                INSERT INTO rollups (object, period_type, period, category, total, count)
+                VALUES (?, ?, ?, ?, ?, 1)
+                ON CONFLICT (object, period_type, period, category)
+                DO UPDATE SET total = total + excluded.total, count = count + 1
+            """, (object_key, period_type, period, category, kopecks))
+        return True
+
+    def add(self, record_id: str, object_key: str, category: str, amount, date_text: str) -> bool:
+        """Учет одной записи; False, если она уже учтена"""
+        with closing(self._connect()) as conn, conn:
+            return self._apply(conn, f"{category}:{record_id}", object_key, category, amount, date_text)
+
+    def rebuild(self, salaries: Iterable[Dict], materials: Iterable[Dict]) -> int:
+        """Пересчет всех агрегатов из истории (в одной транзакции)"""
+        records: List[Tuple] = []
+        for category, items, amount_field in ((SALARY, salaries, 'amount'), (MATERIALS, materials, 'cost')):
+            for index, item in enumerate(items):
+                record_id = item.get('id') or f"#{index}"
+                records.append((f"{category}:{record_id}", item['address'], category,
+                                item.get(amount_field, 0), item['date']))
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM rollups")
+            conn.execute("DELETE FROM applied")
+            for record in records:
+                self._apply(conn, *record)
+        logging.info("📈 Агрегаты пересчитаны: записей %s", len(records))
+        return len(records)
+
+    def is_empty(self) -> bool:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT 1 FROM applied LIMIT 1").fetchone() is None
+
+    # --- Чтение ---
+
+    def recent_periods(self, period_type: str = 'month', limit: int = 6) -> List[str]:
+        """Последние периоды, в которых есть расходы (по возрастанию)"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT period FROM rollups WHERE period_type = ? ORDER BY period DESC LIMIT ?",
+                (period_type, limit)
+            ).fetchall()
+        return [period for period, in reversed(rows)]
+
+    def totals_by_period(self, period_type: str = 'month', limit: int = 6) -> Dict[str, Dict[str, float]]:
+        """{период: {категория: сумма}} по всем объектам за последние периоды"""
+        periods = self.recent_periods(period_type, limit)
+        if not periods:
+            return {}
+        placeholders = ','.join('?' * len(periods))
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT period, category, SUM(total) FROM rollups "
+                f"WHERE period_type = ? AND period IN ({placeholders}) GROUP BY period, category",
+                (period_type, *periods)
+            ).fetchall()
+        result = {period: {SALARY: 0.0, MATERIALS: 0.0} for period in periods}
+        for period, category, total in rows:
+            result[period][category] = total / 100
+        return result
+
+    def object_totals(self, period: str, period_type: str = 'month') -> Dict[str, Dict[str, float]]:
+        """{объект: {категория: сумма}} за один период"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT object, category, total FROM rollups WHERE period_type = ? AND period = ?",
+                (period_type, period)
+            ).fetchall()
+        result: Dict[str, Dict[str, float]] = {}
+        for object_key, category, total in rows:
+            result.setdefault(object_key, {SALARY: 0.0, MATERIALS: 0.0})[category] = total / 100
+        return result
+
+
+def main(argv):
+    if argv[:1] != ['rebuild']:
+        print(__doc__)
+        return 2
+    import json
+    from file_lock import InterProcessLock
+    from ledger import Ledger
+
+    ledger = Ledger()
+    history = {}
+    # Та же блокировка, что у бота: история не меняется во время пересчета
+    with InterProcessLock('storage.lock'):
+        for file_name in ('salaries.json', 'materials.json'):
+            try:
+                with open(file_name, 'r', encoding='utf-8') as f:
+                    history[file_name] = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                history[file_name] = []
+        count = RollupStore().rebuild(ledger.records(SALARY) + history['salaries.json'],
+                                      ledger.records(MATERIALS) + history['materials.json'])
+    print(f"✅ Пересчитано записей: {count}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
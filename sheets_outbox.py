@@ -0,0 +1,221 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Callable, Dict, List, Tuple
+
+from sheets_retry import is_permanent
+
+# Операция над строкой листа: (ключ строки, 'upsert' | 'delete', значения)
+SheetOperation = Tuple[str, str, List]
+
+
+class SheetsOutbox:
+    """Локальная очередь записи в Google Sheets (write-behind).
+
+    Изменения сохраняются в SQLite и сразу возвращают управление, а фоновый
+    поток переносит их в таблицу. На каждую строку листа в очереди хранится
+    только последняя операция, поэтому серия правок одной строки уходит одним
+    запросом. Очередь переживает перезапуск: неотправленные операции
+    дожидаются следующего запуска.
+
+    Фоновый поток просыпается при постановке операции в этом процессе и
+    раз в poll_interval секунд: в кластере операции ставят и другие рабочие
+    процессы, которые не могут разбудить поток напрямую.
+
+    Временные ошибки (сеть, квота, 5xx) повторяются с растущей паузой. Если
+    сервер отверг порцию как неверную (sheets_retry.is_permanent), операции
+    отправляются по одной, и отвергнутые переносятся в таблицу outbox_dead,
+    чтобы одна ошибочная операция не держала очередь.
+    """
+
+    def __init__(self, db_path: str = 'sheets_outbox.db', batch_size: int = 200,
+                 retry_delay: float = 30.0, max_retry_delay: float = 600.0,
+                 poll_interval: float = 5.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._applier = None
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_db(self):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    sheet TEXT NOT NULL,
+                    row_key TEXT NOT NULL,
+                    op TEXT NOT NULL,
+                    payload TEXT,
+                    seq INTEGER NOT NULL,
+                    PRIMARY KEY (sheet, row_key)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS outbox_seq ON outbox (seq)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS outbox_dead (
+                    sheet TEXT NOT NULL,
+                    row_key TEXT NOT NULL,
+                    op TEXT NOT NULL,
+                    payload TEXT,
+                    error TEXT,
+                    failed_at REAL NOT NULL
+                )
+            """)
+
+    def enqueue(self, sheet: str, row_key, values: List):
+        """Постановка записи строки (новая или измененная)"""
+        self._put(sheet, str(row_key), 'upsert', values)
+
+    def enqueue_many(self, sheet: str, rows: List[Tuple[str, List]]):
+        """Постановка записи многих строк [(ключ, значения)] одной транзакцией"""
+        self._put_many(sheet, [(str(row_key), 'upsert', values) for row_key, values in rows])
+
+    def enqueue_delete(self, sheet: str, row_key):
+        """Постановка удаления строки"""
+        self._put(sheet, str(row_key), 'delete', None)
+
+    def _put(self, sheet: str, row_key: str, op: str, values):
+        self._put_many(sheet, [(row_key, op, values)])
+
+    def _put_many(self, sheet: str, operations: List[SheetOperation]):
+        if not operations:
+            return
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute("BEGIN IMMEDIATE")
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM outbox").fetchone()[0]
+            # Более ранняя операция над той же строкой заменяется новой
+            conn.executemany("""
+                INSERT INTO outbox (sheet, row_key, op, payload, seq) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (sheet, row_key)
+                DO UPDATE SET op = excluded.op, payload = excluded.payload, seq = excluded.seq
+            """, [
+                (sheet, row_key, op,
+                 json.dumps(values, ensure_ascii=False) if values is not None else None,
+                 seq + offset)
+                for offset, (row_key, op, values) in enumerate(operations, start=1)
+            ])
+        self._wakeup.set()
+
+    def pending_count(self) -> int:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def dead_letters(self) -> List[Tuple[str, str, str, str]]:
+        """Операции, отвергнутые таблицей: [(лист, ключ строки, операция, ошибка)]"""
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT sheet, row_key, op, error FROM outbox_dead ORDER BY failed_at"
+            ).fetchall()
+
+    def start(self, applier: Callable[[str, List[SheetOperation]], None]):
+        """Запуск фонового переноса; applier(sheet, operations) пишет операции в лист"""
+        self._applier = applier
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='sheets-outbox', daemon=True)
+            self._thread.start()
+        self._wakeup.set()
+
+    def stop(self, timeout: float = None):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        delay = self.retry_delay
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            try:
+                if self.drain_once():
+                    delay = self.retry_delay
+                    continue
+            except Exception as e:
+                logging.error("❌ Очередь Google Sheets: ошибка отправки, повтор через %.0f с: %s",
+                              delay, e)
+                self._stopped.wait(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+                continue
+            self._wakeup.wait(self.poll_interval)
+
+    def drain_once(self) -> int:
+        """Отправка одной порции операций; возвращает число отправленных"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT sheet, row_key, op, payload, seq FROM outbox ORDER BY seq LIMIT ?",
+                (self.batch_size,)
+            ).fetchall()
+        if not rows:
+            return 0
+
+        by_sheet: Dict[str, List] = {}
+        for sheet, row_key, op, payload, seq in rows:
+            values = json.loads(payload) if payload is not None else None
+            by_sheet.setdefault(sheet, []).append((row_key, op, values, seq))
+
+        sent = 0
+        for sheet, items in by_sheet.items():
+            try:
+                self._apply(sheet, items)
+            except Exception as e:
+                if not is_permanent(e):
+                    raise
+                if len(items) == 1:
+                    self._dead_letter(sheet, items[0], e)
+                    continue
+                # Порция отвергнута целиком: ищем отвергнутые операции по одной
+                logging.warning("⚠️ Очередь Google Sheets: порция листа %s отвергнута (%s), "
+                                "отправка по одной", sheet, e)
+                for item in items:
+                    try:
+                        self._apply(sheet, [item])
+                    except Exception as item_error:
+                        if not is_permanent(item_error):
+                            raise
+                        self._dead_letter(sheet, item, item_error)
+            sent += len(items)
+
+        logging.info("📤 Очередь Google Sheets: обработано операций %s", sent)
+        return sent
+
+    def _apply(self, sheet: str, items: List):
+        self._applier(sheet, [(row_key, op, values) for row_key, op, values, _ in items])
+        # Подтверждаем только те операции, которые не успели замениться новыми
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "DELETE FROM outbox WHERE sheet = ? AND row_key = ? AND seq = ?",
+                [(sheet, row_key, seq) for row_key, _, _, seq in items]
+            )
+
+    def _dead_letter(self, sheet: str, item, error: Exception):
+        """Перенос отвергнутой операции из очереди в outbox_dead"""
+        row_key, op, values, seq = item
+        logging.error("❌ Очередь Google Sheets: операция %s строки %s листа %s отвергнута "
+                      "и снята с очереди: %s", op, row_key, sheet, error)
+        with self._lock, closing(self._connect()) as conn, conn:
+            deleted = conn.execute(
+                "DELETE FROM outbox WHERE sheet = ? AND row_key = ? AND seq = ?",
+                (sheet, row_key, seq)
+            ).rowcount
+            if deleted:
+                conn.execute(
+                    "INSERT INTO outbox_dead (sheet, row_key, op, payload, error, failed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (sheet, row_key, op,
+                     json.dumps(values, ensure_ascii=False) if values is not None else None,
+                     str(error), time.time())
+                )
@@ -0,0 +1,254 @@
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import metrics
+from rate_limit import TokenBucket
+
+# Квота Google Sheets API: 60 запросов в минуту на пользователя сервиса
+SHEETS_REQUESTS_PER_MINUTE = 60
+
+# Коды ответа, после которых запрос имеет смысл повторить
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+# Причины 403, означающие превышение квоты, а не отказ в доступе
+RATE_LIMIT_REASONS = ('rateLimitExceeded', 'userRateLimitExceeded', 'RATE_LIMIT_EXCEEDED')
+# Методы, повтор которых не меняет результат
+IDEMPOTENT_METHODS = {'get', 'head', 'options', 'put', 'delete'}
+# POST-запросы Sheets API, которые перезаписывают или читают заданные диапазоны
+IDEMPOTENT_POST_SUFFIXES = ('/values:batchGet', '/values:batchUpdate', '/values:batchClear', ':clear')
+
+# Общий для процесса ограничитель запросов к Sheets API
+sheets_limiter = TokenBucket.per_window(SHEETS_REQUESTS_PER_MINUTE, 60)
+
+# Счетчики повторов и ожиданий квоты
+_stats_lock = threading.Lock()
+retry_stats = {
+    'calls': 0,              # вызовов API (без учета повторов)
+    'retries': 0,            # повторных попыток
+    'throttled': 0,          # ожиданий токена квоты
+    'throttled_seconds': 0.0,
+    'backoff_seconds': 0.0,  # суммарная пауза между попытками
+    'failures': 0,           # вызовов, завершившихся ошибкой
+}
+
+
+def _count(name: str, value=1):
+    with _stats_lock:
+        retry_stats[name] += value
+
+
+def get_retry_stats() -> dict:
+    """Снимок счетчиков повторов"""
+    with _stats_lock:
+        return dict(retry_stats)
+
+
+def _collect_retry_stats():
+    """Счетчики повторов для эндпоинта /metrics"""
+    lines = []
+    for name, value in get_retry_stats().items():
+        metric = f"sheets_api_{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric} {value}")
+    return lines
+
+
+metrics.registry.add_collector(_collect_retry_stats)
+
+
+def error_status(error: Exception) -> Optional[int]:
+    """HTTP-код ошибки gspread (APIError) или googleapiclient (HttpError)"""
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status is None:
+        resp = getattr(error, 'resp', None)
+        status = getattr(resp, 'status', None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _error_headers(error: Exception):
+    response = getattr(error, 'response', None)
+    if response is not None and getattr(response, 'headers', None) is not None:
+        return response.headers
+    # httplib2.Response - словарь с заголовками в нижнем регистре
+    return getattr(error, 'resp', None) or {}
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Пауза из заголовка Retry-After (секунды или HTTP-дата)"""
+    headers = _error_headers(error)
+    value = headers.get('Retry-After') or headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (moment - datetime.now(timezone.utc)).total_seconds())
+
+
+def is_retryable(error: Exception) -> bool:
+    """Можно ли повторить запрос после этой ошибки"""
+    status = error_status(error)
+    if status is None:
+        # Сетевые ошибки requests/httplib2 наследуются от OSError
+        return isinstance(error, OSError)
+    if status in RETRYABLE_STATUSES:
+        return True
+    return status == 403 and any(reason in str(error) for reason in RATE_LIMIT_REASONS)
+
+
+def _connection_refused(error: Exception) -> bool:
+    """Соединение не установлено, то есть запрос точно не дошел до сервера"""
+    pending, seen = [error], set()
+    while pending:
+        current = pending.pop()
+        if not isinstance(current, BaseException) or id(current) in seen:
+            continue
+        seen.add(id(current))
+        # requests/urllib3 заворачивают исходную ошибку в reason, args и цепочку исключений
+        if isinstance(current, ConnectionRefusedError) or type(current).__name__ == 'NewConnectionError':
+            return True
+        pending.extend(arg for arg in getattr(current, 'args', ()) if isinstance(arg, BaseException))
+        pending.extend((getattr(current, 'reason', None), current.__cause__, current.__context__))
+    return False
+
+
+def is_rejected_before_processing(error: Exception) -> bool:
+    """Запрос отклонен до выполнения: квота (429, 403 rateLimit) или отказ в соединении"""
+    status = error_status(error)
+    if status is None:
+        return _connection_refused(error)
+    return status == 429 or (status == 403 and any(reason in str(error) for reason in RATE_LIMIT_REASONS))
+
+
+def is_permanent(error: Exception) -> bool:
+    """Сервер отверг сам запрос (неверный диапазон, данные): повтор не поможет.
+
+    401 и 403 сюда не входят: доступ к таблице касается всех запросов, а не
+    одного, и восстанавливается без изменения запроса.
+    """
+    status = error_status(error)
+    if status is None or not 400 <= status < 500 or status in (401, 403):
+        return False
+    return not is_retryable(error)
+
+
+def is_idempotent(method: str, endpoint: str = '') -> bool:
+    """Можно ли повторить запрос после ответа 5xx или обрыва соединения"""
+    if str(method).lower() in IDEMPOTENT_METHODS:
+        return True
+    path = str(endpoint).split('?', 1)[0]
+    return path.endswith(IDEMPOTENT_POST_SUFFIXES)
+
+
+class RetryPolicy:
+    """Повтор запросов к Google API с экспоненциальной паузой и квотой.
+
+    Перед каждой попыткой берется токен из общего ограничителя. Пауза между
+    попытками - случайная в пределах base_delay * 2^n (full jitter), но если
+    сервер прислал Retry-After, используется она.
+    """
+
+    def __init__(self, max_attempts: int = 6, base_delay: float = 1.0,
+                 max_delay: float = 64.0, limiter: TokenBucket = sheets_limiter,
+                 sleep=time.sleep):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiter = limiter
+        self.sleep = sleep
+
+    def call(self, func, *args, **kwargs):
+        return self.call_if(is_retryable, func, *args, **kwargs)
+
+    def call_if(self, should_retry, func, *args, **kwargs):
+        """Вызов с повтором только тех ошибок, для которых should_retry(ошибка) истинно"""
+        _count('calls')
+        for attempt in range(1, self.max_attempts + 1):
+            self._take_token()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not should_retry(e) or attempt == self.max_attempts:
+                    _count('failures')
+                    raise
+
+                delay = retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+                delay = min(delay, self.max_delay)
+                _count('retries')
+                _count('backoff_seconds', delay)
+                logging.warning("⏳ Google API: ошибка %s, попытка %s/%s, пауза %.1f с",
+                                error_status(e) or type(e).__name__, attempt, self.max_attempts, delay)
+                self.sleep(delay)
+
+    def _take_token(self):
+        if self.limiter is None or self.limiter.try_acquire():
+            return
+        started = time.monotonic()
+        self.limiter.acquire()
+        _count('throttled')
+        _count('throttled_seconds', time.monotonic() - started)
+
+
+default_policy = RetryPolicy()
+
+
+def _timed(request):
+    """Обертка Client.request со счетчиками длительности и ошибок запросов"""
+    def send(method, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return request(method, *args, **kwargs)
+        except Exception:
+            metrics.SHEETS_API_ERRORS.inc(method=method)
+            raise
+        finally:
+            metrics.SHEETS_API_SECONDS.observe(time.perf_counter() - started, method=method)
+    return send
+
+
+def install_retry(client, policy: RetryPolicy = None):
+    """Перевод всех запросов клиента gspread на политику повторов.
+
+    Все методы gspread (чтение, запись, batch_update) обращаются к API через
+    Client.request, поэтому квота применяется ко всем вызовам. Повтор после
+    5xx или обрыва соединения допустим только для идемпотентных запросов:
+    POST вроде создания таблицы, values:append или добавления правила
+    форматирования мог выполниться, и повтор продублировал бы результат.
+    Такие запросы повторяются, только если сервер их не принял (429, квота,
+    отказ в соединении).
+    """
+    policy = policy or default_policy
+    if getattr(client, '_retry_policy', None) is not None:
+        client._retry_policy = policy
+        return client
+
+    original_request = client.request
+    send = _timed(original_request) if metrics.ENABLED else original_request
+
+    def request(method, endpoint='', *args, **kwargs):
+        should_retry = is_retryable if is_idempotent(method, endpoint) else is_rejected_before_processing
+        return client._retry_policy.call_if(should_retry, send, method, endpoint, *args, **kwargs)
+
+    client._retry_policy = policy
+    client.request = request
+    return client
+
+
+def execute_with_retry(http_request, policy: RetryPolicy = None):
+    """Выполнение запроса googleapiclient (например, Drive API) с повторами"""
+    return (policy or default_policy).call(http_request.execute)
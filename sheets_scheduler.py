@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from google_sheets import GoogleSheetsManager
+
+
+class PendingSync:
+    """Отложенная синхронизация таблицы одного пользователя"""
+
+    def __init__(self, filters: List[Dict], user_info: Dict, now: float):
+        self.filters = filters
+        self.user_info = user_info
+        self.first_change = now
+        self.last_change = now
+        self.changes = 1
+
+
+class SheetSyncScheduler:
+    """Планировщик синхронизации фильтров: своя таблица на каждого пользователя.
+
+    Изменения пользователя откладываются на debounce секунд, и серия изменений
+    за это время сливается в одну выгрузку последнего состояния (но не позже
+    max_delay от первого изменения). Выгрузки в разные таблицы выполняются в
+    ограниченном пуле потоков, одна таблица никогда не синхронизируется
+    параллельно. Суммарную частоту запросов в пределах квоты Sheets держит
+    общий ограничитель, через который идет каждый запрос клиента (sheets_retry).
+
+    Таблица пользователя не публикуется по ссылке: доступ на запись получают
+    только email пользователя (user_info['email']) и владелец сервиса
+    (owner_email, по умолчанию переменная SHEETS_OWNER_EMAIL).
+
+    Планировщик - библиотечный модуль: вызывающий код передает в schedule()
+    фильтры пользователя после каждого их изменения.
+    """
+
+    def __init__(self, credentials_file: str = 'credentials.json',
+                 registry_file: str = 'user_sheets.json',
+                 debounce: float = 5.0, max_delay: float = 60.0,
+                 max_workers: int = 4, retry_delay: float = 60.0,
+                 owner_email: str = None):
+        self.credentials_file = credentials_file
+        self.registry_file = registry_file
+        self.owner_email = owner_email or os.getenv('SHEETS_OWNER_EMAIL')
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+
+        self._pending = {}        # user_id -> PendingSync
+        self._due = {}            # user_id -> время запуска (time.monotonic)
+        self._running = set()     # пользователи, чья таблица сейчас выгружается
+        self._managers = {}       # user_id -> GoogleSheetsManager с открытой таблицей
+        self._registry = self._load_registry()
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='sheets-sync')
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, name='sheets-scheduler', daemon=True)
+        self._thread.start()
+
+    def schedule(self, user_id, filters: List[Dict], user_info: Dict = None):
+        """Постановка синхронизации таблицы пользователя с последним состоянием фильтров"""
+        now = time.monotonic()
+        with self._condition:
+            pending = self._pending.get(user_id)
+            if pending is None:
+                pending = PendingSync(filters, user_info, now)
+                self._pending[user_id] = pending
+            else:
+                pending.filters = filters
+                pending.user_info = user_info or pending.user_info
+                pending.last_change = now
+                pending.changes += 1
+            self._due[user_id] = min(now + self.debounce, pending.first_change + self.max_delay)
+            self._condition.notify()
+
+    def schedule_all(self, filters: List[Dict], users_info: Dict = None):
+        """Раскладка общего списка фильтров по таблицам пользователей"""
+        by_user = {}
+        for f in filters:
+            by_user.setdefault(f['user_id'], []).append(f)
+        for user_id, user_filters in by_user.items():
+            self.schedule(user_id, user_filters, (users_info or {}).get(user_id))
+
+    def flush(self):
+        """Немедленный запуск всех отложенных синхронизаций"""
+        now = time.monotonic()
+        with self._condition:
+            for user_id in self._due:
+                self._due[user_id] = now
+            self._condition.notify()
+
+    def stop(self, wait: bool = True):
+        """Остановка планировщика (отложенные синхронизации запускаются сразу)"""
+        self.flush()
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+        self._executor.shutdown(wait=wait)
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                ready = self._take_ready()
+                if not ready:
+                    if self._stopped and not self._pending:
+                        return
+                    self._condition.wait(self._next_timeout())
+                    continue
+            for user_id, pending in ready:
+                self._executor.submit(self._run_sync, user_id, pending)
+
+    def _take_ready(self):
+        """Отложенные синхронизации, время которых пришло (под блокировкой)"""
+        now = time.monotonic()
+        ready = []
+        for user_id, due in list(self._due.items()):
+            if (due <= now or self._stopped) and user_id not in self._running:
+                ready.append((user_id, self._pending.pop(user_id)))
+                del self._due[user_id]
+                self._running.add(user_id)
+        return ready
+
+    def _next_timeout(self):
+        candidates = [due for user_id, due in self._due.items() if user_id not in self._running]
+        if not candidates:
+            return None
+        return max(0.0, min(candidates) - time.monotonic())
+
+    def _run_sync(self, user_id, pending: PendingSync):
+        try:
+            manager = self._get_manager(user_id, pending.user_info)
+            count = manager.sync_filters(pending.filters, pending.user_info)
+            logging.info("✅ Таблица пользователя %s: %s фильтров (объединено изменений: %s)",
+                         user_id, count or 0, pending.changes)
+        except Exception as e:
+            logging.error("❌ Ошибка синхронизации таблицы пользователя %s: %s", user_id, e)
+            self._managers.pop(user_id, None)
+            self._requeue_failed(user_id, pending)
+        finally:
+            with self._condition:
+                self._running.discard(user_id)
+                self._condition.notify()
+
+    def _requeue_failed(self, user_id, pending: PendingSync):
+        """Повтор неудачной синхронизации, если новых изменений еще не было"""
+        with self._condition:
+            if self._stopped or user_id in self._pending:
+                return
+            now = time.monotonic()
+            pending.first_change = now
+            self._pending[user_id] = pending
+            self._due[user_id] = now + self.retry_delay
+
+    def _get_manager(self, user_id, user_info: Dict = None) -> GoogleSheetsManager:
+        manager = self._managers.get(user_id)
+        if manager is not None:
+            return manager
+
+        manager = GoogleSheetsManager(self.credentials_file)
+        spreadsheet_id = self._registry.get(str(user_id))
+        if spreadsheet_id:
+            manager.open_spreadsheet(spreadsheet_id)
+        else:
+            owner = (user_info or {}).get('username') or user_id
+            manager.create_spreadsheet(f"Фильтр-Трекер {owner}",
+                                       share_with=self._share_emails(user_info))
+            self._register(user_id, manager.get_spreadsheet_id())
+        manager.setup_worksheet()
+        self._managers[user_id] = manager
+        return manager
+
+    def _share_emails(self, user_info: Dict = None) -> List[str]:
+        """Адреса с доступом к таблице пользователя: сам пользователь и владелец"""
+        emails = [(user_info or {}).get('email'), self.owner_email]
+        return list(dict.fromkeys(email for email in emails if email))
+
+    def _load_registry(self) -> Dict[str, str]:
+        try:
+            with open(self.registry_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _register(self, user_id, spreadsheet_id: str):
+        """Запоминание таблицы пользователя"""
+        with self._condition:
+            self._registry[str(user_id)] = spreadsheet_id
+            tmp_file = self.registry_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._registry, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.registry_file)
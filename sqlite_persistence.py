@@ -0,0 +1,90 @@
+import json
+import sqlite3
+import threading
+from collections import defaultdict
+from contextlib import closing
+from typing import Dict
+
+from telegram.ext import BasePersistence
+
+
+class SqlitePersistence(BasePersistence):
+    """Хранение состояний диалогов и user_data/chat_data в общей базе SQLite.
+
+    Рабочие процессы кластера (cluster.py) пишут в одну базу, поэтому
+    перезапущенный процесс продолжает диалоги своих чатов с того же места.
+    Каждое изменение записывается сразу, flush() ничего не делает.
+    """
+
+    def __init__(self, db_path: str = 'conversations.db'):
+        super().__init__(store_user_data=True, store_chat_data=True, store_bot_data=False)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    name TEXT NOT NULL,
+                    conv_key TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    PRIMARY KEY (name, conv_key)
+                )
+            """)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS user_data (id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS chat_data (id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+
+    def _load_table(self, table: str) -> defaultdict:
+        with self._lock, closing(self._conn.cursor()) as cursor:
+            rows = cursor.execute(f"SELECT id, data FROM {table}").fetchall()
+        return defaultdict(dict, {row_id: json.loads(data) for row_id, data in rows})
+
+    def _save_row(self, table: str, row_id: int, data: Dict):
+        payload = json.dumps(data, ensure_ascii=False, default=str)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO {table} (id, data) VALUES (?, ?) "
+                f"ON CONFLICT (id) DO UPDATE SET data = excluded.data",
+                (row_id, payload)
+            )
+
+    def get_user_data(self):
+        return self._load_table('user_data')
+
+    def get_chat_data(self):
+        return self._load_table('chat_data')
+
+    def get_bot_data(self):
+        return {}
+
+    def get_conversations(self, name: str) -> Dict:
+        with self._lock, closing(self._conn.cursor()) as cursor:
+            rows = cursor.execute("SELECT conv_key, state FROM conversations WHERE name = ?",
+                                  (name,)).fetchall()
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    def update_conversation(self, name: str, key, new_state):
+        conv_key = json.dumps(list(key))
+        with self._lock, self._conn:
+            if new_state is None:
+                self._conn.execute("DELETE FROM conversations WHERE name = ? AND conv_key = ?",
+                                   (name, conv_key))
+            else:
+                self._conn.execute(
+                    "INSERT INTO conversations (name, conv_key, state) VALUES (?, ?, ?) "
+                    "ON CONFLICT (name, conv_key) DO UPDATE SET state = excluded.state",
+                    (name, conv_key, json.dumps(new_state))
+                )
+
+    def update_user_data(self, user_id: int, data: Dict):
+        self._save_row('user_data', user_id, data)
+
+    def update_chat_data(self, chat_id: int, data: Dict):
+        self._save_row('chat_data', chat_id, data)
+
+    def update_bot_data(self, data: Dict):
+        pass
+
+    def flush(self):
+        pass
@@ -0,0 +1,239 @@
+import codecs
+import csv
+import io
+import os
+import re
+from datetime import date, datetime
+
+from transaction_manager import content_hash, validate_transaction
+
+# Поля транзакции, которые можно взять из колонок выписки
+FIELDS = ('date', 'amount', 'category', 'type', 'description')
+FIELD_LABELS = {
+    'date': "Дата",
+    'amount': "Сумма",
+    'category': "Категория",
+    'type': "Тип",
+    'description': "Описание",
+}
+REQUIRED_FIELDS = ('date', 'amount')
+DEFAULT_CATEGORY = "Другое"
+BATCH_SIZE = 1000
+# Объем начала CSV для определения кодировки и разделителя
+SNIFF_BYTES = 64 * 1024
+
+# Подсказки для автоматического сопоставления колонок по заголовку
+HEADER_HINTS = {
+    'date': ('дата', 'date'),
+    'amount': ('сумма', 'amount', 'sum'),
+    'category': ('категория', 'category', 'mcc'),
+    'type': ('тип', 'type', 'направление'),
+    'description': ('описание', 'назначение', 'комментарий', 'description', 'details', 'memo'),
+}
+INCOME_VALUES = {'доход', 'приход', 'зачисление', 'пополнение', 'income', 'credit', '+'}
+EXPENSE_VALUES = {'расход', 'списание', 'покупка', 'оплата', 'expense', 'debit', '-'}
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d/%m/%Y', '%d.%m.%y', '%Y-%m-%d %H:%M:%S',
+                '%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M')
+
+
+class StatementImportError(Exception):
+    """Файл выписки не удалось прочитать"""
+
+
+def _open_csv(path):
+    """Текстовый поток CSV и двоичный файл под ним (для оценки прогресса)"""
+    raw = open(path, 'rb')
+    sample = raw.read(SNIFF_BYTES)
+    complete = len(sample) < SNIFF_BYTES
+    raw.seek(0)
+    # Банковские выписки часто в cp1251. Образец мог оборваться посреди
+    # многобайтного символа: инкрементальный декодер не считает это ошибкой
+    try:
+        text_sample = codecs.getincrementaldecoder('utf-8-sig')().decode(sample, final=complete)
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        encoding = 'cp1251'
+        text_sample = sample.decode(encoding, errors='replace')
+    if not complete and '\n' in text_sample:
+        # Sniffer получает только целые строки
+        text_sample = text_sample[:text_sample.rindex('\n') + 1]
+    text = io.TextIOWrapper(raw, encoding=encoding, newline='')
+    try:
+        dialect = csv.Sniffer().sniff(text_sample, delimiters=';,\t')
+    except csv.Error:
+        dialect = csv.excel
+    return text, raw, dialect
+
+
+def iter_rows(path):
+    """Построчное чтение CSV/XLSX: (значения строки, доля прочитанного файла)"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.xlsx':
+        try:
+            import openpyxl
+        except ImportError:
+            raise StatementImportError("Для импорта XLSX установите пакет openpyxl")
+        try:
+            workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        except Exception as e:
+            raise StatementImportError(f"Не удалось открыть файл: {e}")
+        try:
+            sheet = workbook.active
+            total = sheet.max_row or 0
+            for number, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+                yield list(row), min(1.0, number / total) if total else 0.0
+        finally:
+            workbook.close()
+    elif extension in ('.csv', '.txt'):
+        try:
+            text, raw, dialect = _open_csv(path)
+        except OSError as e:
+            raise StatementImportError(f"Не удалось открыть файл: {e}")
+        size = os.path.getsize(path) or 1
+        with text:
+            for row in csv.reader(text, dialect):
+                yield row, min(1.0, raw.tell() / size)
+    else:
+        raise StatementImportError("Поддерживаются файлы CSV и XLSX")
+
+
+def read_header(path):
+    """Заголовки колонок (первая строка файла)"""
+    rows = iter_rows(path)
+    try:
+        for row, _ in rows:
+            return [str(value).strip() if value is not None else '' for value in row]
+    finally:
+        rows.close()
+    return []
+
+
+def guess_mapping(header):
+    """Сопоставление полей транзакции с колонками по заголовкам: {поле: индекс}"""
+    mapping = {}
+    for field in FIELDS:
+        for index, title in enumerate(header):
+            title = title.lower()
+            if index not in mapping.values() and any(hint in title for hint in HEADER_HINTS[field]):
+                mapping[field] = index
+                break
+    return mapping
+
+
+def parse_date(value):
+    """Дата ячейки в формате ГГГГ-ММ-ДД (None, если не разобрать)"""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, date):
+        return value.isoformat()
+    text = str(value or '').strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+
+def parse_amount(value):
+    """Сумма ячейки: '1 234,56', '-500.00', '(500)'; None, если не число"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = re.sub(r'[\s ₽$€]|руб\.?|RUB', '', str(value or ''), flags=re.IGNORECASE)
+    negative = text.startswith('(') and text.endswith(')')
+    text = text.strip('()')
+    # Десятичный разделитель - последний из '.' и ','
+    if ',' in text and '.' in text:
+        thousands = '.' if text.rfind(',') > text.rfind('.') else ','
+        text = text.replace(thousands, '')
+    text = text.replace(',', '.')
+    try:
+        amount = float(text)
+    except ValueError:
+        return None
+    return -amount if negative else amount
+
+
+def convert_row(row, mapping, default_category=DEFAULT_CATEGORY):
+    """Транзакция из строки выписки; без колонки типа он определяется знаком суммы"""
+    def cell(field):
+        index = mapping.get(field)
+        if index is None or index >= len(row):
+            return None
+        return row[index]
+
+    amount = parse_amount(cell('amount'))
+    transaction_date = parse_date(cell('date'))
+    if amount is None or transaction_date is None:
+        return None
+
+    transaction_type = str(cell('type') or '').strip().lower()
+    if transaction_type in INCOME_VALUES:
+        transaction_type = 'доход'
+    elif transaction_type in EXPENSE_VALUES:
+        transaction_type = 'расход'
+    else:
+        transaction_type = 'расход' if amount < 0 else 'доход'
+
+    return {
+        'date': transaction_date,
+        'category': str(cell('category') or '').strip() or default_category,
+        'amount': round(abs(amount), 2),
+        'type': transaction_type,
+        'description': str(cell('description') or '').strip(),
+    }
+
+
+def parse_statement(path, mapping, known_hashes, default_category=DEFAULT_CATEGORY,
+                    batch_size=BATCH_SIZE, progress=None, should_cancel=None):
+    """Чтение выписки порциями: проверка и отбор новых транзакций.
+
+    known_hashes - {хеш содержимого: число транзакций} (TransactionManager.hash_counts).
+    Одинаковые операции внутри выписки считаются по порядку: k-я такая строка -
+    дубль, если таких транзакций уже не меньше k. Повторный импорт той же
+    выписки ничего не добавляет, а две одинаковые покупки за день в новой
+    выписке добавляются обе. Безопасно выполнять в фоновом потоке.
+    """
+    missing = [FIELD_LABELS[field] for field in REQUIRED_FIELDS if field not in mapping]
+    if missing:
+        raise StatementImportError(f"Не выбраны колонки: {', '.join(missing)}")
+
+    result = {'transactions': [], 'rows': 0, 'duplicates': 0, 'invalid': 0}
+    seen = {}
+    batch = []
+
+    def flush_batch():
+        for row in batch:
+            transaction = convert_row(row, mapping, default_category)
+            if transaction is None or not validate_transaction(transaction):
+                result['invalid'] += 1
+                continue
+            transaction_hash = content_hash(transaction)
+            seen[transaction_hash] = seen.get(transaction_hash, 0) + 1
+            if seen[transaction_hash] <= known_hashes.get(transaction_hash, 0):
+                result['duplicates'] += 1
+                continue
+            result['transactions'].append(transaction)
+        batch.clear()
+
+    rows = iter_rows(path)
+    try:
+        next(rows, None)  # заголовок
+        fraction = 0.0
+        for row, fraction in rows:
+            if not any(value not in (None, '') for value in row):
+                continue
+            batch.append(row)
+            result['rows'] += 1
+            if len(batch) >= batch_size:
+                flush_batch()
+                if progress:
+                    progress(int(fraction * 100), 100, f"Обработано строк: {result['rows']}")
+                if should_cancel and should_cancel():
+                    return result
+        flush_batch()
+    finally:
+        rows.close()
+    if progress:
+        progress(100, 100, f"Обработано строк: {result['rows']}")
+    return result
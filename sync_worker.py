@@ -0,0 +1,107 @@
+import logging
+import queue
+import threading
+
+
+class SyncJob:
+    """Контекст фоновой задачи: отчет о прогрессе и флаг отмены"""
+
+    def __init__(self, name, events, on_success=None, on_error=None,
+                 on_progress=None, on_cancel=None):
+        self.name = name
+        self.on_success = on_success
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.on_cancel = on_cancel
+        self._events = events
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        """Запрос отмены (задача проверяет флаг между порциями работы)"""
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def report(self, done, total=None, message=''):
+        """Отчет о прогрессе; безопасно вызывать из фонового потока"""
+        self._events.put(('progress', self, (done, total, message)))
+
+
+class SyncExecutor:
+    """Выполнение операций синхронизации вне потока Tk.
+
+    Одновременно выполняется не более одной задачи. Результаты и прогресс
+    передаются через потокобезопасную очередь, которую главный поток
+    опрашивает через root.after, поэтому все колбэки вызываются в потоке Tk.
+    """
+
+    def __init__(self, root, poll_interval=100):
+        self.root = root
+        self.poll_interval = poll_interval
+        self._events = queue.Queue()
+        self._current = None
+        self._polling = False
+
+    def is_busy(self):
+        return self._current is not None
+
+    def submit(self, name, func, on_success=None, on_error=None,
+               on_progress=None, on_cancel=None):
+        """Запуск задачи func(job) в фоне; False, если уже что-то выполняется"""
+        if self._current is not None:
+            return False
+
+        job = SyncJob(name, self._events, on_success, on_error, on_progress, on_cancel)
+        self._current = job
+        thread = threading.Thread(target=self._run, args=(job, func),
+                                  name=f"sync-{name}", daemon=True)
+        thread.start()
+        self._schedule_poll()
+        return True
+
+    def cancel(self):
+        """Отмена текущей задачи"""
+        if self._current is not None:
+            self._current.cancel()
+
+    def _run(self, job, func):
+        try:
+            result = func(job)
+        except Exception as e:
+            logging.exception("Ошибка фоновой задачи %s", job.name)
+            self._events.put(('error', job, e))
+        else:
+            kind = 'cancelled' if job.is_cancelled() else 'done'
+            self._events.put((kind, job, result))
+
+    def _schedule_poll(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        self._polling = False
+        while True:
+            try:
+                kind, job, payload = self._events.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == 'progress':
+                if job.on_progress:
+                    job.on_progress(*payload)
+                continue
+
+            if job is self._current:
+                self._current = None
+            callback = {
+                'done': job.on_success,
+                'error': job.on_error,
+                'cancelled': job.on_cancel,
+            }[kind]
+            if callback:
+                callback(payload)
+
+        if self._current is not None:
+            self._schedule_poll()
@@ -0,0 +1,147 @@
+"""Согласованность снимков и блокировка создания/очистки резервных копий"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backup import BackupStore
+from file_lock import InterProcessLock
+
+
+def _write(path, value):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(value, f)
+    os.replace(tmp, path)
+
+
+class SnapshotConsistencyTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.objects = os.path.join(self.tmp.name, 'objects.json')
+        self.salaries = os.path.join(self.tmp.name, 'salaries.json')
+        self.storage_lock = InterProcessLock(os.path.join(self.tmp.name, 'storage.lock'))
+        _write(self.objects, {'generation': 0})
+        _write(self.salaries, {'generation': 0})
+
+    def test_json_files_come_from_one_write(self):
+        # Запись, как save_salary_to_json: два файла заменяются по очереди
+        stop = threading.Event()
+
+        def writer():
+            generation = 0
+            while not stop.is_set():
+                generation += 1
+                with self.storage_lock:
+                    _write(self.objects, {'generation': generation})
+                    _write(self.salaries, {'generation': generation})
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        store = BackupStore(os.path.join(self.tmp.name, 'backups'), keep=100)
+        try:
+            manifests = [store.create([self.objects, self.salaries], storage_lock=self.storage_lock)
+                         for _ in range(30)]
+        finally:
+            stop.set()
+            thread.join()
+
+        for manifest_id in filter(None, manifests):
+            files = store.verify(manifest_id)
+            self.assertEqual(json.loads(files['objects.json']), json.loads(files['salaries.json']))
+
+    def test_segment_list_is_taken_under_storage_lock(self):
+        held = []
+
+        def segments():
+            held.append(self.storage_lock._depth)
+            return []
+
+        store = BackupStore(os.path.join(self.tmp.name, 'backups'))
+        store.create([self.objects], segment_files=segments, storage_lock=self.storage_lock)
+        self.assertEqual(held, [1])
+
+
+class RestoreSegmentsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # Сегменты хранятся в снимке под путем относительно текущего каталога
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.tmp.name)
+        os.makedirs('ledger')
+        _write('salaries.json', [{'id': 'b'}])
+        with open(os.path.join('ledger', 'salary-1.seg'), 'wb') as f:
+            f.write(b'a')
+
+    def test_segments_newer_than_snapshot_are_moved_aside(self):
+        store = BackupStore('backups')
+        manifest_id = store.create(['salaries.json'], segment_files=lambda: [
+            os.path.join('ledger', name) for name in os.listdir('ledger')])
+        # После снимка запись b перенесена из JSON в новый сегмент
+        with open(os.path.join('ledger', 'salary-2.seg'), 'wb') as f:
+            f.write(b'b')
+        _write('salaries.json', [])
+
+        store.restore(manifest_id)
+        self.assertEqual(os.listdir('ledger'), ['salary-1.seg'])
+        self.assertEqual(os.listdir(f'ledger.after-{manifest_id}'), ['salary-2.seg'])
+        with open('salaries.json', encoding='utf-8') as f:
+            self.assertEqual(json.load(f), [{'id': 'b'}])
+
+    def test_restore_without_newer_segments_keeps_ledger(self):
+        store = BackupStore('backups')
+        store.create(['salaries.json'], segment_files=[os.path.join('ledger', 'salary-1.seg')])
+        store.restore()
+        self.assertEqual(os.listdir('ledger'), ['salary-1.seg'])
+        self.assertEqual(sorted(os.listdir('.')), ['backups', 'ledger', 'salaries.json'])
+
+
+class CreatePruneLockTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.backup_dir = os.path.join(self.tmp.name, 'backups')
+        self.path = os.path.join(self.tmp.name, 'objects.json')
+        _write(self.path, {'generation': 1})
+
+    def test_prune_waits_for_create(self):
+        inside = threading.Event()
+        release = threading.Event()
+
+        class SlowLock:
+            def __enter__(self):
+                inside.set()
+                release.wait(5)
+
+            def __exit__(self, *exc):
+                return False
+
+        # Отдельные объекты, как бот и команда prune в разных процессах
+        bot_store = BackupStore(self.backup_dir, keep=0)
+        cli_store = BackupStore(self.backup_dir, keep=0)
+        created = []
+        creator = threading.Thread(
+            target=lambda: created.append(bot_store.create([self.path], storage_lock=SlowLock())))
+        creator.start()
+        self.assertTrue(inside.wait(5))
+
+        pruned = threading.Event()
+        pruner = threading.Thread(target=lambda: (cli_store.prune(), pruned.set()))
+        pruner.start()
+        self.assertFalse(pruned.wait(0.3))
+
+        release.set()
+        creator.join(5)
+        pruner.join(5)
+        self.assertTrue(pruned.is_set())
+        self.assertIsNotNone(created[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
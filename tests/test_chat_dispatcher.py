@@ -0,0 +1,120 @@
+"""Переполнение очереди чата в ChatSerialDispatcher"""
+import os
+import sys
+import threading
+import unittest
+from queue import Queue
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    from chat_dispatcher import BUSY_TEXT, ChatSerialDispatcher
+except ImportError:  # python-telegram-bot не установлен
+    ChatSerialDispatcher = None
+
+
+class FakeBot:
+    defaults = None
+
+    def __init__(self):
+        self.messages = []
+        self.answers = []
+        self.sent = threading.Event()
+
+    def send_message(self, chat_id, text):
+        self.messages.append((chat_id, text))
+        self.sent.set()
+
+    def answer_callback_query(self, callback_query_id, text=None, **kwargs):
+        self.answers.append((callback_query_id, text))
+        self.sent.set()
+
+
+class FakeDelivery:
+    def __init__(self):
+        self.messages = []
+
+    def send(self, chat_id, text):
+        self.messages.append((chat_id, text))
+
+
+def message(bot, update_id, chat_id=5):
+    return Update.de_json({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 0, 'text': 'Отчет',
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Иван'},
+    }}, bot)
+
+
+def button(bot, update_id, chat_id=5):
+    return Update.de_json({'update_id': update_id, 'callback_query': {
+        'id': f'q{update_id}', 'chat_instance': 'c', 'data': 'menu',
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Иван'},
+        'message': {'message_id': 1, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}},
+    }}, bot)
+
+
+@unittest.skipIf(ChatSerialDispatcher is None, "python-telegram-bot не установлен")
+class ChatOverflowTest(unittest.TestCase):
+    def setUp(self):
+        self.bot = FakeBot()
+        self.dispatcher = ChatSerialDispatcher(self.bot, Queue(), use_context=True,
+                                               pool_size=1, max_pending_per_chat=2)
+        self.addCleanup(self.dispatcher._pool.shutdown)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.handled = []
+
+        def handle(update, context):
+            self.release.wait(5)
+            self.handled.append(update.update_id)
+
+        self.dispatcher.add_handler(TypeHandler(Update, handle))
+
+    def wait_idle(self):
+        while self.dispatcher.pending_count():
+            threading.Event().wait(0.01)
+
+    def drain(self):
+        self.release.set()
+        self.wait_idle()
+        self.dispatcher._notify_pool.shutdown(wait=True)
+
+    def test_overflow_sends_one_busy_notice(self):
+        for update_id in range(1, 6):
+            self.dispatcher.process_update(message(self.bot, update_id))
+        self.drain()
+        self.assertEqual(self.handled, [1, 2])
+        self.assertEqual(self.bot.messages, [(5, BUSY_TEXT)])
+
+    def test_notice_goes_through_delivery_queue(self):
+        self.dispatcher.delivery = FakeDelivery()
+        for update_id in range(1, 4):
+            self.dispatcher.process_update(message(self.bot, update_id))
+        self.drain()
+        self.assertEqual(self.dispatcher.delivery.messages, [(5, BUSY_TEXT)])
+        self.assertEqual(self.bot.messages, [])
+
+    def test_dropped_button_press_is_answered(self):
+        self.dispatcher.process_update(message(self.bot, 1))
+        self.dispatcher.process_update(message(self.bot, 2))
+        self.dispatcher.process_update(button(self.bot, 3))
+        self.drain()
+        self.assertEqual(self.bot.answers, [('q3', BUSY_TEXT)])
+
+    def test_notice_repeats_after_queue_drains(self):
+        for update_id in range(1, 4):
+            self.dispatcher.process_update(message(self.bot, update_id))
+        self.release.set()
+        self.wait_idle()
+        self.release.clear()
+        for update_id in range(4, 7):
+            self.dispatcher.process_update(message(self.bot, update_id))
+        self.drain()
+        self.assertEqual(self.bot.messages, [(5, BUSY_TEXT), (5, BUSY_TEXT)])
+
+
+if __name__ == '__main__':
+    unittest.main()
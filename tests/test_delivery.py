@@ -0,0 +1,101 @@
+"""Очередь исходящих сообщений: приоритеты, квота рассылок и RetryAfter"""
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from telegram.error import RetryAfter
+    from delivery import BULK, INTERACTIVE, DeliveryQueue, split_message
+except ImportError:  # python-telegram-bot не установлен
+    DeliveryQueue = None
+
+
+class FakeBot:
+    def __init__(self, failures=None):
+        self.sent = []
+        self.failures = failures or {}
+        self.lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self.lock:
+            error = self.failures.get(chat_id)
+            if error:
+                self.failures[chat_id] = error[1:]
+                raise error[0]
+            self.sent.append((chat_id, text, time.monotonic()))
+        return text
+
+
+@unittest.skipIf(DeliveryQueue is None, "python-telegram-bot не установлен")
+class DeliveryQueueTest(unittest.TestCase):
+    def make_queue(self, bot, stop_timeout=5, **kwargs):
+        options = {'global_rate': 1000.0, 'chat_rate': 1000.0, 'chat_burst': 1000.0}
+        options.update(kwargs)
+        queue = DeliveryQueue(bot, **options)
+        self.addCleanup(queue.stop, stop_timeout)
+        return queue
+
+    def test_replies_go_before_queued_broadcast(self):
+        bot = FakeBot()
+        queue = self.make_queue(bot, workers=1)
+        queue.broadcast([1, 2], 'рассылка')
+        queue.send(3, 'рассылка', BULK)
+        reply = queue.send(9, 'ответ', INTERACTIVE)
+        queue.start()
+
+        reply[0].wait(5)
+        queue.stop(5)
+        self.assertEqual([chat_id for chat_id, _, _ in bot.sent], [9, 1, 2, 3])
+
+    def test_messages_of_one_chat_keep_order(self):
+        bot = FakeBot()
+        queue = self.make_queue(bot, workers=3)
+        queue.start()
+        deliveries = [queue.send(5, f'сообщение {index}')[0] for index in range(10)]
+        for delivery in deliveries:
+            delivery.wait(5)
+        self.assertEqual([text for _, text, _ in bot.sent], [f'сообщение {index}' for index in range(10)])
+
+    def test_reply_does_not_wait_for_broadcast_quota(self):
+        bot = FakeBot()
+        # Квота рассылок - одно сообщение в 10 секунд
+        queue = self.make_queue(bot, stop_timeout=0.1, workers=2, bulk_share=0.1 / 1000)
+        queue.start()
+        queue.broadcast(range(1, 11), 'рассылка')
+        time.sleep(0.2)
+
+        started = time.monotonic()
+        queue.send(99, 'ответ', INTERACTIVE)[0].wait(2)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual([chat_id for chat_id, _, _ in bot.sent], [1, 99])
+
+    def test_retry_after_pauses_all_chats_and_repeats(self):
+        bot = FakeBot({1: [RetryAfter(0.5)]})
+        queue = self.make_queue(bot, workers=2)
+        queue.start()
+        started = time.monotonic()
+        first = queue.send(1, 'первое')[0]
+        time.sleep(0.1)
+        second = queue.send(2, 'второе')[0]
+
+        self.assertEqual(first.wait(5), 'первое')
+        self.assertEqual(second.wait(5), 'второе')
+        self.assertEqual(first.attempts, 2)
+        # Пауза RetryAfter относится ко всему боту: второй чат тоже ждал
+        for _, _, sent_at in bot.sent:
+            self.assertGreaterEqual(sent_at - started, 0.45)
+        self.assertEqual(queue.pending_count(), 0)
+
+    def test_long_text_is_split_by_lines(self):
+        text = '\n'.join('строка %03d' % index for index in range(1000))
+        parts = split_message(text, limit=100)
+        self.assertTrue(all(len(part) <= 100 for part in parts))
+        self.assertEqual('\n'.join(parts), text)
+
+
+if __name__ == '__main__':
+    unittest.main()
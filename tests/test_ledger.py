@@ -0,0 +1,63 @@
+"""Запечатывание истории в сегменты и восстановление после сбоя"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ledger
+from ledger import Ledger, seal_json
+from rollups import SALARY
+
+
+class SealJsonTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'salaries.json')
+        self.ledger = Ledger(os.path.join(self.tmp.name, 'ledger'))
+        records = [
+            # Запись старого формата без id
+            {'address': 'Ленина 1', 'name': 'Иван', 'amount': 100.0, 'date': '2024-01-05 10:00:00'},
+            {'id': 'b', 'address': 'Ленина 1', 'name': 'Петр', 'amount': 50.0, 'date': '2024-01-06 10:00:00'},
+            {'id': 'c', 'address': 'Мира 2', 'name': 'Иван', 'amount': 7.0, 'date': '2099-01-01 00:00:00'},
+        ]
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(records, f, ensure_ascii=False)
+
+    def remaining(self):
+        with open(self.path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_moves_old_records(self):
+        self.assertEqual(seal_json(self.ledger, {SALARY: self.path}, '2025-01'), 2)
+        self.assertEqual([r['id'] for r in self.remaining()], ['c'])
+        self.assertEqual(self.ledger.totals(SALARY), {'Ленина 1': 150.0})
+
+    def test_crash_before_json_rewrite_does_not_seal_twice(self):
+        write_json = ledger._write_json
+        calls = []
+
+        def crash_on_rewrite(path, records):
+            calls.append(path)
+            if len(calls) == 2:
+                raise OSError("сбой при записи JSON")
+            write_json(path, records)
+
+        with mock.patch.object(ledger, '_write_json', crash_on_rewrite):
+            with self.assertRaises(OSError):
+                seal_json(self.ledger, {SALARY: self.path}, '2025-01')
+        # Сегмент записан, JSON остался прежним (но уже с id у всех записей)
+        self.assertTrue(all(r.get('id') for r in self.remaining()))
+
+        seal_json(self.ledger, {SALARY: self.path}, '2025-01')
+        self.assertEqual(len(self.ledger.records(SALARY)), 2)
+        self.assertEqual(self.ledger.totals(SALARY), {'Ленина 1': 150.0})
+        self.assertEqual([r['id'] for r in self.remaining()], ['c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""Подготовка записей логов перед постановкой в очередь"""
+import logging
+import os
+import queue
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logging_setup import JsonFormatter, TextFormatter, _LazyQueueHandler
+
+
+class CountingArg:
+    def __init__(self):
+        self.calls = 0
+
+    def __str__(self):
+        self.calls += 1
+        return 'arg'
+
+
+class LazyQueueHandlerTest(unittest.TestCase):
+    def setUp(self):
+        self.queue = queue.SimpleQueue()
+        self.logger = logging.getLogger('test_logging_setup')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        handler = _LazyQueueHandler(self.queue)
+        self.logger.addHandler(handler)
+        self.addCleanup(self.logger.removeHandler, handler)
+
+    def test_args_are_captured_before_they_change(self):
+        items = ['a']
+        self.logger.info("Позиции: %s", items)
+        items.append('b')
+        record = self.queue.get_nowait()
+        self.assertEqual(record.getMessage(), "Позиции: ['a']")
+        self.assertIn("Позиции: ['a']", TextFormatter('%(message)s').format(record))
+
+    def test_filtered_levels_are_not_formatted(self):
+        arg = CountingArg()
+        self.logger.debug("Отладка %s", arg)
+        self.assertTrue(self.queue.empty())
+        self.assertEqual(arg.calls, 0)
+
+    def test_traceback_is_kept_as_text(self):
+        try:
+            raise ValueError("сбой")
+        except ValueError:
+            self.logger.exception("Ошибка %s", 1)
+        record = self.queue.get_nowait()
+        self.assertIsNone(record.exc_info)
+        self.assertIn('ValueError: сбой', TextFormatter('%(message)s').format(record))
+        self.assertIn('ValueError: сбой', JsonFormatter().format(record))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+"""Напоминания об истечении срока фильтров"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from contextlib import closing
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from reminders import ReminderScheduler
+except ImportError:  # python-telegram-bot не установлен
+    ReminderScheduler = None
+
+
+class FakeJobQueue:
+    def __init__(self):
+        self.jobs = []
+
+    def run_once(self, callback, when, name=None):
+        job = FakeJob(callback, when)
+        self.jobs.append(job)
+        return job
+
+    def run_repeating(self, callback, interval, first=None, name=None):
+        return FakeJob(callback, first)
+
+
+class FakeJob:
+    def __init__(self, callback, when):
+        self.callback = callback
+        self.when = when
+
+    def schedule_removal(self):
+        pass
+
+
+class FakeBot:
+    def __init__(self):
+        self.messages = []
+        self.threads = []
+        self.sent = threading.Event()
+
+    def send_message(self, chat_id, text):
+        self.messages.append((chat_id, text))
+        self.threads.append(threading.current_thread().name)
+        self.sent.set()
+
+
+@unittest.skipIf(ReminderScheduler is None, "python-telegram-bot не установлен")
+class ReminderSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, 'filters.db')
+        self.state_path = os.path.join(self.tmp.name, 'state.db')
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute("CREATE TABLE filters (id INTEGER PRIMARY KEY, user_id INTEGER, "
+                         "filter_type TEXT, location TEXT, expiry_date TEXT)")
+
+    def set_expiry(self, days_from_now):
+        expiry = (date.today() + timedelta(days=days_from_now)).isoformat()
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO filters VALUES (1, 77, 'Картридж', 'Кухня', ?)", (expiry,))
+
+    def start(self):
+        bot = FakeBot()
+        scheduler = ReminderScheduler(FakeJobQueue(), bot, db_path=self.db_path, send_hour=0,
+                                      state_path=self.state_path)
+        scheduler.start()
+        scheduler.stop()
+        return bot
+
+    def test_sends_missed_threshold_on_start(self):
+        # Порог 7 дней прошел, пока бот не работал
+        self.set_expiry(5)
+        bot = self.start()
+        self.assertEqual(len(bot.messages), 1)
+        self.assertEqual(bot.messages[0][0], 77)
+        self.assertIn('осталось 5 дн.', bot.messages[0][1])
+
+    def test_missed_threshold_is_sent_once(self):
+        self.set_expiry(5)
+        self.start()
+        self.assertEqual(self.start().messages, [])
+
+    def test_later_threshold_is_sent_after_earlier_one(self):
+        self.set_expiry(5)
+        self.start()
+        # Фильтр не заменили: срок прошел, порог 0 дней тоже пропущен
+        self.set_expiry(-1)
+        bot = self.start()
+        self.assertEqual(len(bot.messages), 1)
+        self.assertIn('ПРОСРОЧЕН', bot.messages[0][1])
+
+    def test_nothing_sent_before_first_threshold(self):
+        self.set_expiry(60)
+        self.assertEqual(self.start().messages, [])
+
+    def test_late_wake_sends_one_line_per_filter(self):
+        self.set_expiry(60)
+        bot = FakeBot()
+        scheduler = ReminderScheduler(FakeJobQueue(), bot, db_path=self.db_path, send_hour=0,
+                                      state_path=self.state_path)
+        scheduler.start()
+        self.addCleanup(scheduler.stop)
+
+        # Пробуждение к порогу 30 дней опоздало: прошли и пороги 30 и 7 дней
+        late = datetime.combine(date.today() + timedelta(days=58), datetime.min.time())
+
+        class LateDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return late
+
+        with mock.patch('reminders.datetime', LateDatetime):
+            scheduler._on_wake(None)
+            self.assertTrue(bot.sent.wait(5))
+            scheduler._sender.shutdown(wait=True)
+
+        self.assertEqual(len(bot.messages), 1)
+        self.assertEqual(bot.messages[0][1].count('осталось'), 1)
+        self.assertIn('осталось 2 дн.', bot.messages[0][1])
+        with closing(sqlite3.connect(self.state_path)) as conn:
+            self.assertEqual(conn.execute("SELECT threshold FROM reminders_sent").fetchall(), [(7,)])
+
+    def test_sends_outside_job_queue_thread(self):
+        self.set_expiry(5)
+        bot = self.start()
+        self.assertEqual(bot.threads, [t for t in bot.threads if t.startswith('reminder-sender')])
+        self.assertTrue(bot.threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Агрегаты расходов по объектам и периодам"""
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+from contextlib import closing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rollups import MATERIALS, SALARY, RollupStore, period_keys
+
+
+class RollupStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, 'rollups.db')
+        self.store = RollupStore(self.db_path)
+
+    def stored_totals(self, period_type='month'):
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            return conn.execute(
+                "SELECT object, period, category, total, count FROM rollups "
+                "WHERE period_type = ? ORDER BY object, period, category", (period_type,)
+            ).fetchall()
+
+    def test_period_keys(self):
+        self.assertEqual(period_keys('2024-05-08 12:30:00'), {'month': '2024-05', 'week': '2024-W19'})
+        # ISO-неделя 1 2025 года начинается в декабре 2024
+        self.assertEqual(period_keys('2024-12-30'), {'month': '2024-12', 'week': '2025-W01'})
+
+    def test_add_stores_integer_kopecks(self):
+        for index in range(10):
+            self.store.add(f's{index}', 'Ленина 1', SALARY, 0.1, '2024-05-08')
+        self.store.add('m1', 'Ленина 1', MATERIALS, '1234.56', '2024-05-09')
+        self.assertEqual(self.stored_totals(), [
+            ('Ленина 1', '2024-05', MATERIALS, 123456, 1),
+            ('Ленина 1', '2024-05', SALARY, 100, 10),
+        ])
+        self.assertEqual(self.store.object_totals('2024-05'),
+                         {'Ленина 1': {SALARY: 1.0, MATERIALS: 1234.56}})
+
+    def test_add_ignores_repeated_record(self):
+        self.assertTrue(self.store.add('s1', 'Ленина 1', SALARY, 100, '2024-05-08'))
+        self.assertFalse(self.store.add('s1', 'Ленина 1', SALARY, 100, '2024-05-08'))
+        # Зарплата и материал с одинаковым id - разные записи
+        self.assertTrue(self.store.add('s1', 'Ленина 1', MATERIALS, 50, '2024-05-08'))
+        self.assertEqual(self.store.object_totals('2024-05'),
+                         {'Ленина 1': {SALARY: 100.0, MATERIALS: 50.0}})
+
+    def test_totals_by_period_and_object(self):
+        self.store.add('s1', 'Ленина 1', SALARY, 100, '2024-04-30')
+        self.store.add('s2', 'Мира 2', SALARY, 250.5, '2024-05-01')
+        self.store.add('m1', 'Мира 2', MATERIALS, 30, '2024-05-02')
+        self.store.add('s3', 'Ленина 1', SALARY, 10, '2024-06-03')
+
+        self.assertEqual(self.store.totals_by_period('month', limit=2), {
+            '2024-05': {SALARY: 250.5, MATERIALS: 30.0},
+            '2024-06': {SALARY: 10.0, MATERIALS: 0.0},
+        })
+        self.assertEqual(self.store.object_totals('2024-05'),
+                         {'Мира 2': {SALARY: 250.5, MATERIALS: 30.0}})
+        # 2024-04-30 и 2024-05-01 - одна ISO-неделя
+        self.assertEqual(self.store.object_totals('2024-W18', 'week'), {
+            'Ленина 1': {SALARY: 100.0, MATERIALS: 0.0},
+            'Мира 2': {SALARY: 250.5, MATERIALS: 30.0},
+        })
+
+    def test_rebuild_replaces_totals(self):
+        self.store.add('old', 'Ленина 1', SALARY, 999, '2024-05-08')
+        salaries = [{'id': 's1', 'address': 'Ленина 1', 'amount': 100.25, 'date': '2024-05-08'},
+                    {'address': 'Ленина 1', 'amount': 0.75, 'date': '2024-05-09'}]
+        materials = [{'id': 'm1', 'address': 'Мира 2', 'cost': 40, 'date': '2024-05-10'}]
+
+        self.assertEqual(self.store.rebuild(salaries, materials), 3)
+        self.assertEqual(self.stored_totals(), [
+            ('Ленина 1', '2024-05', SALARY, 10100, 2),
+            ('Мира 2', '2024-05', MATERIALS, 4000, 1),
+        ])
+        # Повторный пересчет дает те же суммы, а учтенная запись не добавляется снова
+        self.store.rebuild(salaries, materials)
+        self.assertFalse(self.store.add('s1', 'Ленина 1', SALARY, 100.25, '2024-05-08'))
+        self.assertEqual(self.stored_totals()[0][3], 10100)
+
+    def test_is_empty(self):
+        self.assertTrue(self.store.is_empty())
+        self.store.add('s1', 'Ленина 1', SALARY, 1, '2024-05-08')
+        self.assertFalse(self.store.is_empty())
+
+
+if __name__ == '__main__':
+    unittest.main()
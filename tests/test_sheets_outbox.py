@@ -0,0 +1,98 @@
+"""Очередь записи в Google Sheets"""
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sheets_outbox import SheetsOutbox
+
+
+class SheetsOutboxTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_path = os.path.join(self.tmp.name, 'outbox.db')
+        self.applied = []
+        self.drained = threading.Event()
+
+    def apply(self, sheet, operations):
+        self.applied.extend((sheet,) + operation for operation in operations)
+        self.drained.set()
+
+    def test_keeps_only_last_operation_per_row(self):
+        outbox = SheetsOutbox(self.db_path)
+        outbox.enqueue('Объекты', 1, ['a'])
+        outbox.enqueue('Объекты', 1, ['b'])
+        outbox.enqueue_delete('Объекты', 2)
+        outbox._applier = self.apply
+
+        self.assertEqual(outbox.drain_once(), 2)
+        self.assertEqual(self.applied, [('Объекты', '1', 'upsert', ['b']),
+                                        ('Объекты', '2', 'delete', None)])
+        self.assertEqual(outbox.pending_count(), 0)
+
+    def test_drains_operations_enqueued_by_another_process(self):
+        drainer = SheetsOutbox(self.db_path, poll_interval=0.1)
+        drainer.start(self.apply)
+        self.addCleanup(drainer.stop, 5)
+        self.assertFalse(self.drained.wait(0.2))
+
+        # Другой рабочий процесс пишет в ту же базу и не может разбудить поток
+        SheetsOutbox(self.db_path).enqueue('Объекты', 7, ['x'])
+        self.assertTrue(self.drained.wait(5))
+        self.assertEqual(self.applied, [('Объекты', '7', 'upsert', ['x'])])
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.response = type('Response', (), {'status_code': status, 'headers': {}})()
+
+
+class PoisonOperationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.outbox = SheetsOutbox(os.path.join(self.tmp.name, 'outbox.db'))
+        self.applied = []
+        self.status = 400
+
+    def apply(self, sheet, operations):
+        # Таблица отвергает порцию, если в ней есть строка 'bad'
+        if any(row_key == 'bad' for row_key, _, _ in operations):
+            raise FakeAPIError(self.status)
+        self.applied.extend(row_key for row_key, _, _ in operations)
+
+    def test_rejected_operation_does_not_block_queue(self):
+        self.outbox.enqueue('Объекты', 'a', ['1'])
+        self.outbox.enqueue('Объекты', 'bad', ['2'])
+        self.outbox.enqueue('Объекты', 'c', ['3'])
+        self.outbox._applier = self.apply
+
+        self.outbox.drain_once()
+        self.assertEqual(self.applied, ['a', 'c'])
+        self.assertEqual(self.outbox.pending_count(), 0)
+        dead = self.outbox.dead_letters()
+        self.assertEqual([(sheet, row_key, op) for sheet, row_key, op, _ in dead],
+                         [('Объекты', 'bad', 'upsert')])
+
+        self.outbox.enqueue('Объекты', 'd', ['4'])
+        self.outbox.drain_once()
+        self.assertEqual(self.applied, ['a', 'c', 'd'])
+
+    def test_temporary_error_keeps_operations_queued(self):
+        self.status = 503
+        self.outbox.enqueue('Объекты', 'bad', ['2'])
+        self.outbox._applier = self.apply
+
+        with self.assertRaises(FakeAPIError):
+            self.outbox.drain_once()
+        self.assertEqual(self.outbox.pending_count(), 1)
+        self.assertEqual(self.outbox.dead_letters(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
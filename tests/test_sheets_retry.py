@@ -0,0 +1,113 @@
+"""Повторы запросов к Sheets API на локальном сервере с подмешанными ошибками"""
+import os
+import socket
+import sys
+import unittest
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_sheets import FakeSheetsServer, SheetsTransport
+from sheets_retry import RetryPolicy, install_retry
+
+SHEETS_URL = 'https://sheets.googleapis.com/v4/spreadsheets'
+
+
+class APIError(Exception):
+    """Ошибка ответа в том виде, в каком ее бросает gspread"""
+
+    def __init__(self, response):
+        super().__init__(response.text)
+        self.response = response
+
+
+class Client:
+    """Минимальный клиент с Client.request как у gspread"""
+
+    def __init__(self, base_url):
+        self.session = SheetsTransport(base_url)
+
+    def request(self, method, endpoint, params=None, data=None, json=None, files=None, headers=None):
+        response = getattr(self.session, method)(endpoint, params=params, data=data, json=json,
+                                                 files=files, headers=headers)
+        if response.ok:
+            return response
+        raise APIError(response)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class InstallRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeSheetsServer().start()
+        self.addCleanup(self.server.stop)
+        self.spreadsheet = self.server.create_spreadsheet('Трекер', 'Лист1', rows=10, cols=3)
+        self.delays = []
+        self.policy = RetryPolicy(max_attempts=4, base_delay=0.01, limiter=None,
+                                  sleep=self.delays.append)
+        self.client = install_retry(Client(self.server.base_url), self.policy)
+        self.url = f"{SHEETS_URL}/{self.spreadsheet.id}"
+
+    def values_url(self, range_name):
+        # gspread кодирует диапазон в пути целиком
+        return f"{self.url}/values/{quote(range_name, safe='')}"
+
+    def append(self):
+        return self.client.request('post', self.values_url("'Лист1'!A1") + ':append',
+                                   params={'valueInputOption': 'RAW'}, json={'values': [['x']]})
+
+    def rows(self):
+        return self.spreadsheet.sheets[0].read((1, 1, None, None))
+
+    def test_get_is_retried_after_server_error(self):
+        self.server.inject_error(503, times=2)
+        response = self.client.request('get', self.url)
+        self.assertEqual(response.json()['spreadsheetId'], self.spreadsheet.id)
+        self.assertEqual(self.server.count_requests('GET'), 3)
+        self.assertEqual(len(self.delays), 2)
+
+    def test_put_is_retried_after_dropped_connection(self):
+        self.server.inject_error(0)
+        self.client.request('put', self.values_url("'Лист1'!A1"),
+                            params={'valueInputOption': 'RAW'}, json={'values': [['x']]})
+        self.assertEqual(self.rows(), [['x']])
+
+    def test_append_is_not_retried_after_server_error(self):
+        self.server.inject_error(500, method='POST')
+        with self.assertRaises(APIError):
+            self.append()
+        self.assertEqual(self.server.count_requests('POST'), 1)
+        self.assertEqual(self.delays, [])
+
+    def test_append_is_not_retried_after_dropped_connection(self):
+        self.server.inject_error(0, method='POST')
+        with self.assertRaises(OSError):
+            self.append()
+        self.assertEqual(self.server.count_requests('POST'), 1)
+
+    def test_append_is_retried_after_rate_limit(self):
+        self.server.inject_error(429, method='POST', retry_after='0')
+        self.append()
+        self.assertEqual(self.rows(), [['x']])
+        self.assertEqual(self.delays, [0.0])
+
+    def test_values_batch_update_is_retried(self):
+        self.server.inject_error(502, method='POST')
+        self.client.request('post', f"{self.url}/values:batchUpdate", json={
+            'valueInputOption': 'RAW', 'data': [{'range': "'Лист1'!A2", 'values': [['y']]}]
+        })
+        self.assertEqual(self.rows(), [[], ['y']])
+
+    def test_post_is_retried_when_connection_refused(self):
+        client = install_retry(Client(f"http://127.0.0.1:{free_port()}"), self.policy)
+        with self.assertRaises(OSError):
+            client.request('post', f"{SHEETS_URL}/fake-1/values/A1:append", json={'values': [['x']]})
+        self.assertEqual(len(self.delays), self.policy.max_attempts - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
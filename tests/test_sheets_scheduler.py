@@ -0,0 +1,55 @@
+"""Таблицы пользователей планировщика синхронизации фильтров"""
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import google_sheets
+from fake_sheets import FakeSheetsServer, SheetsTransport
+from sheets_scheduler import SheetSyncScheduler
+
+try:
+    import gspread
+except ImportError:
+    gspread = None
+
+
+@unittest.skipIf(gspread is None, "gspread не установлен")
+class UserSpreadsheetTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeSheetsServer().start()
+        self.addCleanup(self.server.stop)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+        clients = mock.Mock()
+        clients.gspread_client = gspread.Client(None, session=SheetsTransport(self.server.base_url))
+        patcher = mock.patch.object(google_sheets, 'get_google_clients', return_value=clients)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.scheduler = SheetSyncScheduler(registry_file=os.path.join(self.tmp.name, 'sheets.json'),
+                                            owner_email='owner@example.com')
+        self.addCleanup(self.scheduler.stop)
+
+    def permissions(self, user_id):
+        spreadsheet_id = self.scheduler._registry[str(user_id)]
+        return self.server.spreadsheets[spreadsheet_id].permissions
+
+    def test_shared_only_with_user_and_owner(self):
+        self.scheduler._get_manager(42, {'username': 'ivan', 'email': 'ivan@example.com'})
+        permissions = self.permissions(42)
+        self.assertEqual(sorted(p['emailAddress'] for p in permissions),
+                         ['ivan@example.com', 'owner@example.com'])
+        self.assertTrue(all(p['type'] == 'user' for p in permissions))
+
+    def test_not_published_without_email(self):
+        self.scheduler._get_manager(43, {'username': 'petr'})
+        self.assertEqual([p['type'] for p in self.permissions(43)], ['user'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+"""Порционное чтение листа транзакций на локальном сервере fake_sheets"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_sheets import FakeSheetsServer, SheetsTransport
+from google_sheets import TRANSACTION_HEADERS, GoogleSheetsSync, transaction_to_row
+
+try:
+    import gspread
+except ImportError:
+    gspread = None
+
+
+def make_transactions(count):
+    return [{'id': f't{i}', 'date': '2024-01-01', 'category': 'Еда', 'amount': float(i),
+             'type': 'Расход', 'description': f'Покупка {i}'} for i in range(count)]
+
+
+@unittest.skipIf(gspread is None, "gspread не установлен")
+class ReadRemoteTransactionsTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeSheetsServer().start()
+        self.addCleanup(self.server.stop)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+        self.transactions = make_transactions(1050)
+        spreadsheet = self.server.create_spreadsheet('Трекер', 'Транзакции',
+                                                     rows=len(self.transactions) + 1, cols=6)
+        spreadsheet.sheets[0].write((1, 1, None, None), [TRANSACTION_HEADERS] + [
+            transaction_to_row(t) for t in self.transactions
+        ])
+
+        client = gspread.Client(None, session=SheetsTransport(self.server.base_url))
+        self.checkpoint_file = os.path.join(self.tmp.name, 'checkpoint.json')
+        self.sync = GoogleSheetsSync(spreadsheet_id=spreadsheet.id, sheet_name='Транзакции',
+                                     chunk_size=100, checkpoint_file=self.checkpoint_file,
+                                     state_file=os.path.join(self.tmp.name, 'state.json'),
+                                     client=client)
+
+    def test_reads_all_rows(self):
+        result = self.sync.read_remote_transactions()
+        self.assertEqual([t['id'] for t in result], [t['id'] for t in self.transactions])
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+        self.assertFalse(os.path.exists(self.checkpoint_file + '.rows'))
+
+    def test_blank_row_at_chunk_end_does_not_stop_reading(self):
+        # Строка 101 - последняя в первой порции (строки 2-101) - очищена
+        sheet = self.server.spreadsheets[self.sync.spreadsheet_id].sheets[0]
+        sheet.write((101, 1, None, None), [[''] * len(TRANSACTION_HEADERS)])
+        expected = [t['id'] for t in self.transactions if t['id'] != 't99']
+
+        result = self.sync.read_remote_transactions()
+        self.assertEqual([t['id'] for t in result], expected)
+
+    def test_reads_rows_appended_after_worksheet_was_opened(self):
+        self.sync._connect()
+        sheet = self.server.spreadsheets[self.sync.spreadsheet_id].sheets[0]
+        extra = make_transactions(1060)[1050:]
+        sheet.row_count += len(extra)
+        sheet.write((len(self.transactions) + 2, 1, None, None),
+                    [transaction_to_row(t) for t in extra])
+
+        result = self.sync.read_remote_transactions()
+        self.assertEqual(len(result), len(self.transactions) + len(extra))
+
+    def test_resumes_after_error_without_rereading(self):
+        checkpoint_sizes = []
+
+        def progress(done, total, message):
+            checkpoint_sizes.append(os.path.getsize(self.checkpoint_file))
+            if done == 500:
+                self.server.inject_error(400, path='/values/')
+
+        self.assertIsNone(self.sync.read_remote_transactions(progress))
+        # В контрольной точке только позиция, а не накопленные строки
+        self.assertLess(max(checkpoint_sizes), 512)
+        with open(self.checkpoint_file, encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['next_row'], 502)
+
+        reads_before = self.server.count_requests('GET', '/values/')
+        result = self.sync.read_remote_transactions()
+        self.assertEqual([t['id'] for t in result], [t['id'] for t in self.transactions])
+        # Возобновление с 502-й строки: 6 порций до конца листа
+        self.assertEqual(self.server.count_requests('GET', '/values/') - reads_before, 6)
+
+    def test_drops_rows_written_after_last_checkpoint(self):
+        def progress(done, total, message):
+            if done == 300:
+                self.server.inject_error(400, path='/values/')
+
+        self.assertIsNone(self.sync.read_remote_transactions(progress))
+        # Порция, дописанная в файл строк до сбоя, но не отмеченная в контрольной точке
+        with open(self.checkpoint_file + '.rows', 'a', encoding='utf-8') as f:
+            f.write(json.dumps(transaction_to_row(self.transactions[300]), ensure_ascii=False) + '\n')
+
+        result = self.sync.read_remote_transactions()
+        self.assertEqual([t['id'] for t in result], [t['id'] for t in self.transactions])
+
+    def test_discards_checkpoint_of_other_version(self):
+        def progress(done, total, message):
+            if done == 300:
+                self.server.inject_error(400, path='/values/')
+
+        self.assertIsNone(self.sync.read_remote_transactions(progress, version='1'))
+        # Пока загрузка стояла, из начала листа удалили строку
+        sheet = self.server.spreadsheets[self.sync.spreadsheet_id].sheets[0]
+        sheet.delete_rows(1, 2)
+
+        result = self.sync.read_remote_transactions(version='2')
+        self.assertEqual([t['id'] for t in result], [t['id'] for t in self.transactions[1:]])
+
+
+@unittest.skipIf(gspread is None, "gspread не установлен")
+class SerializedWritesTest(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeSheetsServer().start()
+        self.addCleanup(self.server.stop)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        spreadsheet = self.server.create_spreadsheet('Трекер', 'Транзакции', rows=1, cols=6)
+        client = gspread.Client(None, session=SheetsTransport(self.server.base_url))
+        self.sync = GoogleSheetsSync(spreadsheet_id=spreadsheet.id, sheet_name='Транзакции',
+                                     chunk_size=100,
+                                     checkpoint_file=os.path.join(self.tmp.name, 'checkpoint.json'),
+                                     state_file=os.path.join(self.tmp.name, 'state.json'),
+                                     client=client)
+        self.sheet = spreadsheet.sheets[0]
+
+    def test_outbox_batch_waits_for_upload(self):
+        transactions = make_transactions(1000)
+        upload_started = threading.Event()
+
+        def progress(done, total, message):
+            upload_started.set()
+            time.sleep(0.01)
+
+        uploader = threading.Thread(target=self.sync.upload_data, args=(transactions, progress))
+        uploader.start()
+        upload_started.wait(5)
+        # Пакет очереди записи приходит посреди выгрузки
+        changed = dict(transactions[5], amount=999.0)
+        self.sync.apply_operations('Транзакции', [
+            ('t3', 'delete', None),
+            ('t5', 'upsert', transaction_to_row(changed)),
+        ])
+        uploader.join()
+
+        rows = self.sheet.read((2, 1, None, None))
+        ids = [row[0] for row in rows]
+        self.assertNotIn('t3', ids)
+        self.assertEqual(len(ids), 999)
+        self.assertEqual(rows[ids.index('t5')][3], 999.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+"""Определение кодировки и разделителя CSV-выписки"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import statement_import
+from statement_import import SNIFF_BYTES, _open_csv
+
+
+def statement_text(pad):
+    """Выписка, у которой на границе образца оказывается байт посреди буквы"""
+    header = f"Дата;Сумма;Описание{'_' * pad}\r\n"
+    line = "01.02.2024;-150,00;Покупка в магазине «Пятёрочка»\r\n"
+    return header + line * (SNIFF_BYTES // len(line.encode('utf-8')) + 10)
+
+
+class OpenCsvTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'statement.csv')
+
+    def open(self, data):
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        text, raw, dialect = _open_csv(self.path)
+        text.close()
+        return text.encoding, dialect.delimiter
+
+    def test_utf8_split_at_sample_boundary(self):
+        pad = 0
+        while (statement_text(pad).encode('utf-8')[SNIFF_BYTES] & 0xC0) != 0x80:
+            pad += 1
+        self.assertEqual(self.open(statement_text(pad).encode('utf-8')), ('utf-8-sig', ';'))
+
+    def test_cp1251(self):
+        self.assertEqual(self.open(statement_text(0).encode('cp1251')), ('cp1251', ';'))
+
+    def test_short_file(self):
+        data = "date,amount,description\n2024-02-01,100,Кофе\n".encode('utf-8')
+        self.assertEqual(self.open(data), ('utf-8-sig', ','))
+
+    def test_rows_are_read_with_detected_dialect(self):
+        with open(self.path, 'wb') as f:
+            f.write(statement_text(0).encode('cp1251'))
+        rows = [row for row, _ in statement_import.iter_rows(self.path)]
+        self.assertEqual(rows[0][:2], ['Дата', 'Сумма'])
+        self.assertEqual(rows[1], ['01.02.2024', '-150,00', 'Покупка в магазине «Пятёрочка»'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""Слияние изменений из таблицы и поиск по описанию"""
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import transaction_manager
+from transaction_manager import TransactionManager
+
+
+def transaction(transaction_id, amount=100.0, description='Покупка'):
+    return {'id': transaction_id, 'date': '2024-01-01', 'category': 'Еда', 'amount': amount,
+            'type': 'расход', 'description': description}
+
+
+class ApplyRemoteChangesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.manager = TransactionManager(os.path.join(self.tmp.name, 'data.json'))
+        self.manager.load_data()
+        for transaction_id in ('a', 'b', 'c'):
+            self.manager.add_transaction(transaction(transaction_id))
+
+    def test_applies_upserts_and_deletes(self):
+        self.manager.apply_remote_changes([transaction('b', 250.0), transaction('d')], ['c'],
+                                          synced_ids={'a', 'b', 'c'})
+        by_id = {t['id']: t for t in self.manager.get_all_transactions()}
+        self.assertEqual(sorted(by_id), ['a', 'b', 'd'])
+        self.assertEqual(by_id['b']['amount'], 250.0)
+
+    def test_skips_upsert_of_transaction_deleted_during_sync(self):
+        synced_ids = {t['id'] for t in self.manager.get_all_transactions()}
+        self.manager.delete_transaction('b')
+
+        self.manager.apply_remote_changes([transaction('b', 250.0)], [], synced_ids)
+        ids = [t['id'] for t in self.manager.get_all_transactions()]
+        self.assertEqual(sorted(ids), ['a', 'c'])
+        self.assertEqual(self.manager.search('покупка'), {'a', 'c'})
+
+    def test_keeps_transactions_added_during_sync(self):
+        synced_ids = {t['id'] for t in self.manager.get_all_transactions()}
+        self.manager.add_transaction(transaction('e'))
+
+        self.manager.apply_remote_changes([transaction('d')], ['a'], synced_ids)
+        ids = [t['id'] for t in self.manager.get_all_transactions()]
+        self.assertEqual(sorted(ids), ['b', 'c', 'd', 'e'])
+
+
+class SearchTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.manager = TransactionManager(os.path.join(self.tmp.name, 'data.json'))
+        self.manager.load_data()
+        descriptions = {'a': 'Абонентская плата', 'b': 'Аптека', 'c': 'Абрикосы рынок',
+                        'd': 'Такси до аэропорта'}
+        for transaction_id, description in descriptions.items():
+            self.manager.add_transaction(transaction(transaction_id, description=description))
+
+    def test_keystrokes_narrow_previous_result(self):
+        first = self.manager.search('а')
+        self.assertEqual(first, {'a', 'b', 'c', 'd'})
+        second = self.manager.search('аб', within=first)
+        self.assertEqual(second, {'a', 'c'})
+        self.assertEqual(self.manager.search('абр', within=second), {'c'})
+        self.assertEqual(self.manager.search('аб пл', within=second), {'a'})
+        self.assertEqual(first, {'a', 'b', 'c', 'd'})
+
+    def test_row_scan_matches_index_lookup(self):
+        expected = self.manager.search('абон еда')
+        with mock.patch.object(transaction_manager, 'NARROW_SCAN_COST', 0):
+            self.assertEqual(self.manager.search('абон еда', within=['a', 'b', 'c']), expected)
+
+    def test_result_is_not_the_index_set(self):
+        self.manager.search('а').clear()
+        self.assertEqual(self.manager.search('а'), {'a', 'b', 'c', 'd'})
+
+    def test_prefix_index_follows_changes(self):
+        self.manager.delete_transaction('b')
+        self.manager.add_transaction(transaction('e', description='Аренда'))
+        self.assertEqual(self.manager.search('ап'), set())
+        self.assertEqual(self.manager.search('ар'), {'e'})
+        self.manager.delete_transaction('e')
+        self.assertNotIn('ар', self.manager._prefix_index)
+
+
+if __name__ == '__main__':
+    unittest.main()
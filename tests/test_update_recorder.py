@@ -0,0 +1,60 @@
+"""Обезличивание записанных обновлений"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from update_recorder import UpdateAnonymizer
+
+BUTTON = "📋 Добавить объект"
+
+
+class UpdateAnonymizerTest(unittest.TestCase):
+    def setUp(self):
+        self.anonymizer = UpdateAnonymizer('соль', keep={BUTTON})
+
+    def test_keeps_known_buttons_and_commands(self):
+        self.assertEqual(self.anonymizer.text(BUTTON), BUTTON)
+        self.assertEqual(self.anonymizer.text('/start'), '/start')
+
+    def test_pseudonymizes_text_starting_with_symbol(self):
+        text = "🏠 ул. Ленина 15, кв 3"
+        result = self.anonymizer.text(text)
+        self.assertTrue(result.startswith("🏠 "))
+        for secret in ('Ленина', '15'):
+            self.assertNotIn(secret, result)
+
+    def test_masks_digit_runs(self):
+        result = self.anonymizer.text("+7 999 123-45-67")
+        self.assertNotIn('999', result)
+        self.assertRegex(result, r'^\+\d \d{3} \d{3}-\d{2}-\d{2}$')
+        amount = self.anonymizer.text("1500")
+        self.assertNotEqual(amount, "1500")
+        self.assertRegex(amount, r'^[1-9]\d{3}$')
+
+    def test_command_arguments_are_pseudonymized(self):
+        result = self.anonymizer.text('/cancel Иван')
+        self.assertTrue(result.startswith('/cancel '))
+        self.assertNotIn('Иван', result)
+
+    def test_deterministic(self):
+        self.assertEqual(self.anonymizer.text("Иван 42"), self.anonymizer.text("Иван 42"))
+
+    def test_update_drops_names_and_contacts(self):
+        update = {'update_id': 1, 'message': {
+            'message_id': 2, 'text': "Иван 42",
+            'from': {'id': 5, 'is_bot': False, 'first_name': 'Иван', 'username': 'ivan'},
+            'chat': {'id': 5, 'type': 'private', 'first_name': 'Иван'},
+            'contact': {'phone_number': '+79991234567'},
+        }}
+        message = self.anonymizer.update(update)['message']
+        self.assertNotIn('contact', message)
+        self.assertNotIn('username', message['from'])
+        self.assertNotEqual(message['from']['id'], 5)
+        self.assertEqual(message['from']['id'], message['chat']['id'])
+        self.assertNotIn('Иван', str(message))
+
+
+if __name__ == '__main__':
+    unittest.main()
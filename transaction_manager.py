@@ -1,11 +1,91 @@
+import hashlib
 import json
 import os
+import re
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
 from datetime import datetime
 
+# Размер страницы выборки по умолчанию
+PAGE_SIZE = 500
+# Префиксы слов до этой длины индексируются готовыми множествами id: первые
+# символы запроса совпадают с тысячами слов, и объединять их на каждое
+# нажатие клавиши дорого
+PREFIX_INDEX_LENGTH = 2
+# Во сколько раз проверка слов одной транзакции дороже шага объединения
+# множеств: прошлый результат поиска сужается проверкой каждой транзакции,
+# только если он во столько раз меньше суммы множеств слов с префиксом
+NARROW_SCAN_COST = 40
+
+_TOKEN_RE = re.compile(r'\w+')
+
+def tokenize(text):
+    """Слова текста в нижнем регистре (для поиска по описанию и категории)"""
+    return _TOKEN_RE.findall(str(text or '').lower())
+
+def validate_transaction(transaction):
+    """Валидация данных транзакции"""
+    required_fields = ['date', 'category', 'amount', 'type']
+    for field in required_fields:
+        if field not in transaction or not transaction[field]:
+            return False
+    
+    try:
+        float(transaction['amount'])
+    except ValueError:
+        return False
+    
+    if transaction['type'] not in ['доход', 'расход']:
+        return False
+        
+    return True
+
+def content_hash(transaction):
+    """Хеш содержимого транзакции без id: одинаковые операции дают один хеш"""
+    try:
+        amount = round(float(transaction.get('amount') or 0), 2)
+    except (TypeError, ValueError):
+        amount = str(transaction.get('amount'))
+    payload = json.dumps([
+        str(transaction.get('date', '')),
+        amount,
+        transaction.get('type', ''),
+        transaction.get('category', ''),
+        transaction.get('description', '') or '',
+    ], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def transaction_tokens(transaction):
+    """Различные слова описания и категории транзакции"""
+    return tuple(set(tokenize(f"{transaction.get('description') or ''} {transaction.get('category') or ''}")))
+
+def token_prefixes(tokens):
+    """Различные префиксы слов длиной до PREFIX_INDEX_LENGTH"""
+    return {token[:length] for token in tokens
+            for length in range(1, min(len(token), PREFIX_INDEX_LENGTH) + 1)}
+
 class TransactionManager:
+    """Транзакции с индексами для выборок без полного перебора.
+
+    Индексы: отсортированный список ключей (дата, id) для диапазонов дат
+    (поиск bisect), хеш-индексы категория -> ids и тип -> ids и словарь слов
+    описания и категории с отсортированным списком слов и множествами коротких
+    префиксов для поиска по префиксу. Выборка query() возвращает страницу и курсор - ключ последней
+    строки, с которого начинается следующая страница.
+    """
+    
     def __init__(self, data_file='data.json'):
         self.data_file = data_file
         self.transactions = []
+        self._by_id = {}
+        self._date_index = []       # отсортированные ключи (дата, id)
+        self._category_index = {}   # категория -> множество id
+        self._type_index = {}       # тип -> множество id
+        self._token_index = {}      # слово -> множество id
+        self._tokens = []           # отсортированные слова для поиска по префиксу
+        self._id_tokens = {}        # id -> слова транзакции
+        self._prefix_index = {}     # префикс до PREFIX_INDEX_LENGTH символов -> множество id
+        self._hash_counts = Counter()  # хеш содержимого -> число таких транзакций
         
     def load_data(self):
         """Загрузка данных из файла"""
@@ -18,6 +98,7 @@ class TransactionManager:
         except Exception as e:
             print(f"Ошибка загрузки данных: {e}")
             self.transactions = []
+        self._rebuild_indexes()
     
     def save_data(self):
         """Сохранение данных в файл"""
@@ -41,21 +122,189 @@ class TransactionManager:
                 transaction['id'] = self._generate_id()
             
             self.transactions.append(transaction)
+            self._index(transaction)
             self.save_data()
             return True
         except Exception as e:
             print(f"Ошибка добавления транзакции: {e}")
             return False
     
+    def add_transactions(self, transactions):
+        """Добавление пачки транзакций (импорт) с одним сохранением файла.
+        
+        Неверные транзакции пропускаются; возвращает добавленные.
+        """
+        added = []
+        for transaction in transactions:
+            if not self._validate_transaction(transaction):
+                continue
+            if not transaction.get('id'):
+                transaction['id'] = self._generate_id()
+            added.append(transaction)
+        if not added:
+            return added
+        
+        self.transactions.extend(added)
+        # Большую пачку дешевле проиндексировать заново, чем вставлять по одной
+        if len(added) > len(self.transactions) // 10:
+            self._rebuild_indexes()
+        else:
+            for transaction in added:
+                self._index(transaction)
+        self.save_data()
+        return added
+    
     def delete_transaction(self, transaction_id):
         """Удаление транзакции по ID"""
         self.transactions = [t for t in self.transactions if t.get('id') != transaction_id]
+        self._unindex(transaction_id)
+        self.save_data()
+    
+    def delete_transactions(self, transaction_ids):
+        """Удаление нескольких транзакций с одним сохранением файла"""
+        ids = set(transaction_ids)
+        self.transactions = [t for t in self.transactions if t.get('id') not in ids]
+        for transaction_id in ids:
+            self._unindex(transaction_id)
+        self.save_data()
+    
+    def apply_remote_changes(self, upserts, deletes, synced_ids=None):
+        """Применение изменений из Google Sheets с одним сохранением файла.
+        
+        synced_ids - id транзакций, переданных в синхронизацию. Если такой
+        транзакции уже нет, ее удалили локально, пока шла синхронизация:
+        изменение из таблицы для нее пропускается, а не возвращает ее.
+        """
+        deleted = set(deletes)
+        by_id = {t['id']: t for t in upserts}
+        if synced_ids is not None:
+            for transaction_id in set(synced_ids) - set(self._by_id):
+                by_id.pop(transaction_id, None)
+        merged = []
+        for t in self.transactions:
+            if t.get('id') in deleted:
+                continue
+            merged.append(by_id.pop(t.get('id'), t))
+        merged.extend(by_id.values())
+        self.transactions = merged
+        self._rebuild_indexes()
         self.save_data()
     
     def get_all_transactions(self):
         """Получение всех транзакций"""
         return self.transactions.copy()
     
+    def hash_counts(self):
+        """Копия индекса хешей содержимого (для проверки дублей в фоновом потоке)"""
+        return dict(self._hash_counts)
+    
+    def get_categories(self):
+        """Категории, встречающиеся в транзакциях"""
+        return sorted(category for category, ids in self._category_index.items() if ids)
+    
+    def search(self, text, within=None):
+        """id транзакций, где каждое слово запроса - начало слова описания или категории.
+        
+        within - результат предыдущего запроса, если новый запрос его продолжает
+        (дописаны символы): тогда проверяются только эти транзакции. Для
+        пустого запроса возвращает None (без ограничения).
+        """
+        words = tokenize(text)
+        if not words:
+            return None
+        
+        result = within
+        if result is not None and not isinstance(result, (set, frozenset)):
+            result = set(result)
+        # Сначала самые длинные слова: у них меньше совпадений
+        words = sorted(set(words), key=len, reverse=True)
+        for position, word in enumerate(words):
+            if len(word) <= PREFIX_INDEX_LENGTH:
+                # Готовое множество: пересечение перебирает меньшее из двух
+                ids = self._prefix_index.get(word, set())
+                result = set(ids) if result is None else result & ids
+            else:
+                start = bisect_left(self._tokens, word)
+                end = bisect_left(self._tokens, word + chr(0x10FFFF))
+                id_sets = [self._token_index[token] for token in self._tokens[start:end]]
+                if result is not None and len(result) * NARROW_SCAN_COST < sum(map(len, id_sets)):
+                    return self._narrow(result, words[position:])
+                ids = set().union(*id_sets)
+                result = ids if result is None else result & ids
+            if not result:
+                break
+        return result
+    
+    def _narrow(self, ids, words):
+        """ids, у которых каждое слово запроса - префикс какого-то слова транзакции"""
+        result = set()
+        for transaction_id in ids:
+            tokens = self._id_tokens.get(transaction_id)
+            if tokens is not None and all(any(token.startswith(word) for token in tokens)
+                                          for word in words):
+                result.add(transaction_id)
+        return result
+    
+    def query(self, date_from=None, date_to=None, category=None, type=None, ids=None,
+              cursor=None, limit=PAGE_SIZE):
+        """Страница транзакций по фильтру, по возрастанию даты.
+        
+        date_from/date_to - границы включительно (ГГГГ-ММ-ДД), ids - ограничение
+        результатом search(), cursor - курсор предыдущей страницы. Возвращает
+        (транзакции, курсор следующей страницы или None, если страниц больше нет).
+        """
+        # Кандидаты по хеш-индексам и поиску: пересечение, начиная с меньшего множества
+        sets = [ids] if ids is not None else []
+        if category:
+            sets.append(self._category_index.get(category, set()))
+        if type:
+            sets.append(self._type_index.get(type, set()))
+        candidates = None
+        for id_set in sorted(sets, key=len):
+            candidates = id_set if candidates is None else candidates & id_set
+        
+        # Диапазон ключей (дата, id): строки с датой date_to и любым id входят
+        start = bisect_left(self._date_index, (date_from,)) if date_from else 0
+        if cursor is not None:
+            start = max(start, bisect_right(self._date_index, tuple(cursor)))
+        end = bisect_right(self._date_index, (date_to, chr(0x10FFFF))) if date_to else len(self._date_index)
+        
+        # Ожидаемая длина просмотра диапазона до limit + 1 совпадений
+        scan = end - start
+        if candidates is not None and candidates:
+            scan = min(scan, (limit + 1) * len(self._date_index) // len(candidates))
+        
+        if candidates is not None and len(candidates) < scan:
+            # Фильтр по категории или типу уже диапазона: сортируем только его
+            if start >= end:
+                return [], None
+            low, high = self._date_index[start], self._date_index[end - 1]
+            keys = sorted(key for key in ((self._by_id[i].get('date', ''), i)
+                                          for i in candidates if i in self._by_id)
+                          if low <= key <= high)[:limit + 1]
+        elif candidates is None:
+            keys = self._date_index[start:min(end, start + limit + 1)]
+        else:
+            keys = []
+            for position in range(start, end):
+                key = self._date_index[position]
+                if key[1] in candidates:
+                    keys.append(key)
+                    if len(keys) > limit:
+                        break
+        
+        page = [self._by_id[key[1]] for key in keys[:limit]]
+        next_cursor = keys[limit - 1] if len(keys) > limit else None
+        return page, next_cursor
+    
+    def matches(self, transaction, date_from=None, date_to=None, category=None, type=None):
+        """Проверка одной транзакции на соответствие фильтру query()"""
+        date = transaction.get('date', '')
+        return ((not date_from or date >= date_from)
+                and (not date_to or date <= date_to)
+                and (not category or transaction.get('category') == category)
+                and (not type or transaction.get('type') == type))
+    
     def get_statistics(self):
         """Получение статистики"""
         total_income = sum(t['amount'] for t in self.transactions if t['type'] == 'доход')
@@ -70,20 +319,79 @@ class TransactionManager:
     
     def _validate_transaction(self, transaction):
         """Валидация данных транзакции"""
-        required_fields = ['date', 'category', 'amount', 'type']
-        for field in required_fields:
-            if field not in transaction or not transaction[field]:
-                return False
-        
-        try:
-            float(transaction['amount'])
-        except ValueError:
-            return False
-        
-        if transaction['type'] not in ['доход', 'расход']:
-            return False
-            
-        return True
+        return validate_transaction(transaction)
+    
+    def _index(self, transaction):
+        transaction_id = transaction.get('id')
+        self._by_id[transaction_id] = transaction
+        insort(self._date_index, (transaction.get('date', ''), transaction_id))
+        self._category_index.setdefault(transaction.get('category'), set()).add(transaction_id)
+        self._type_index.setdefault(transaction.get('type'), set()).add(transaction_id)
+        self._index_tokens(transaction)
+        self._hash_counts[content_hash(transaction)] += 1
+    
+    def _index_tokens(self, transaction):
+        transaction_id = transaction.get('id')
+        tokens = transaction_tokens(transaction)
+        self._id_tokens[transaction_id] = tokens
+        for token in tokens:
+            ids = self._token_index.get(token)
+            if ids is None:
+                ids = self._token_index[token] = set()
+                insort(self._tokens, token)
+            ids.add(transaction_id)
+        for prefix in token_prefixes(tokens):
+            self._prefix_index.setdefault(prefix, set()).add(transaction_id)
+    
+    def _unindex(self, transaction_id):
+        transaction = self._by_id.pop(transaction_id, None)
+        if transaction is None:
+            return
+        key = (transaction.get('date', ''), transaction_id)
+        position = bisect_left(self._date_index, key)
+        if position < len(self._date_index) and self._date_index[position] == key:
+            del self._date_index[position]
+        self._category_index.get(transaction.get('category'), set()).discard(transaction_id)
+        self._type_index.get(transaction.get('type'), set()).discard(transaction_id)
+        transaction_hash = content_hash(transaction)
+        self._hash_counts[transaction_hash] -= 1
+        if self._hash_counts[transaction_hash] <= 0:
+            del self._hash_counts[transaction_hash]
+        tokens = self._id_tokens.pop(transaction_id, ())
+        for token in tokens:
+            ids = self._token_index[token]
+            ids.discard(transaction_id)
+            if not ids:
+                del self._token_index[token]
+                del self._tokens[bisect_left(self._tokens, token)]
+        for prefix in token_prefixes(tokens):
+            ids = self._prefix_index[prefix]
+            ids.discard(transaction_id)
+            if not ids:
+                del self._prefix_index[prefix]
+    
+    def _rebuild_indexes(self):
+        self._by_id = {}
+        self._category_index = {}
+        self._type_index = {}
+        self._token_index = {}
+        self._id_tokens = {}
+        self._prefix_index = {}
+        self._hash_counts = Counter()
+        for transaction in self.transactions:
+            transaction_id = transaction.get('id')
+            self._by_id[transaction_id] = transaction
+            self._category_index.setdefault(transaction.get('category'), set()).add(transaction_id)
+            self._type_index.setdefault(transaction.get('type'), set()).add(transaction_id)
+            tokens = transaction_tokens(transaction)
+            self._id_tokens[transaction_id] = tokens
+            for token in tokens:
+                self._token_index.setdefault(token, set()).add(transaction_id)
+            for prefix in token_prefixes(tokens):
+                self._prefix_index.setdefault(prefix, set()).add(transaction_id)
+            self._hash_counts[content_hash(transaction)] += 1
+        self._date_index = sorted((t.get('date', ''), t.get('id')) for t in self.transactions)
+        self._tokens = sorted(self._token_index)
     
     def _generate_id(self):
         """Генерация уникального ID"""
@@ -0,0 +1,138 @@
+"""Запись входящих обновлений Telegram в JSONL для последующего воспроизведения.
+
+Включается переменной окружения RECORD_UPDATES (путь к файлу). Каждая строка -
+{"t": секунды от начала записи, "update": обновление}. Персональные данные
+обезличиваются: идентификаторы пользователей и чатов заменяются стабильными
+псевдонимами (HMAC с солью RECORD_SALT), имена удаляются, а слова свободного
+текста заменяются псевдословами той же длины, цифры - псевдоцифрами (число
+остается числом той же длины). Как есть сохраняются только известные подписи
+кнопок (keep) и имена команд, чтобы воспроизведение проходило по тем же
+веткам диалога.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import os
+import queue
+import re
+import string
+import threading
+import time
+
+RECORD_FILE = os.getenv('RECORD_UPDATES', '')
+RECORD_SALT = os.getenv('RECORD_SALT', '')
+
+# Поля пользователя и чата, которые остаются в записи (остальные удаляются)
+_USER_FIELDS = ('id', 'is_bot', 'language_code')
+_CHAT_FIELDS = ('id', 'type')
+# Слова (буквы) и серии цифр: все остальное (пробелы, знаки, эмодзи) не меняется
+_TOKEN = re.compile(r'\d+|[^\W\d_]+')
+_COMMAND = re.compile(r'^/[A-Za-z0-9_]+(@\w+)?')
+_LETTERS = string.ascii_lowercase
+
+
+class UpdateAnonymizer:
+    """Детерминированное обезличивание: одинаковые данные - одинаковые псевдонимы"""
+
+    def __init__(self, salt: str = RECORD_SALT, keep=()):
+        self.salt = (salt or os.urandom(16).hex()).encode('utf-8')
+        self.keep = frozenset(keep)
+
+    def _digest(self, value) -> bytes:
+        return hmac.new(self.salt, str(value).encode('utf-8'), hashlib.sha256).digest()
+
+    def pseudo_id(self, value: int) -> int:
+        pseudo = int.from_bytes(self._digest(value)[:6], 'big') or 1
+        return -pseudo if value < 0 else pseudo
+
+    def pseudo_word(self, word: str) -> str:
+        digest = self._digest(word)
+        return ''.join(_LETTERS[digest[i % len(digest)] % len(_LETTERS)] for i in range(len(word)))
+
+    def pseudo_digits(self, digits: str) -> str:
+        digest = self._digest(digits)
+        result = ''.join(str(digest[i % len(digest)] % 10) for i in range(len(digits)))
+        # Без ведущего нуля, если его не было: число остается той же длины
+        if digits[0] != '0' and result[0] == '0':
+            result = str(digest[0] % 9 + 1) + result[1:]
+        return result
+
+    def _token(self, match) -> str:
+        token = match.group()
+        return self.pseudo_digits(token) if token.isdigit() else self.pseudo_word(token)
+
+    def text(self, text: str) -> str:
+        if not text or text in self.keep:
+            return text
+        command = _COMMAND.match(text)
+        prefix = command.group() if command else ''
+        return prefix + _TOKEN.sub(self._token, text[len(prefix):])
+
+    def _person(self, data: dict, fields) -> dict:
+        result = {name: data[name] for name in fields if name in data}
+        result['id'] = self.pseudo_id(data['id'])
+        if 'is_bot' in fields:
+            result['first_name'] = 'User'
+        return result
+
+    def update(self, data: dict) -> dict:
+        """Обезличенная копия обновления (словарь Bot API)"""
+        result = {}
+        for key, value in data.items():
+            if isinstance(value, dict):
+                result[key] = self.update(value)
+            elif isinstance(value, list):
+                result[key] = [self.update(item) if isinstance(item, dict) else item for item in value]
+            else:
+                result[key] = value
+
+        for key in ('from', 'user'):
+            if isinstance(data.get(key), dict) and 'id' in data[key]:
+                result[key] = self._person(data[key], _USER_FIELDS)
+        if isinstance(data.get('chat'), dict) and 'id' in data['chat']:
+            result['chat'] = self._person(data['chat'], _CHAT_FIELDS)
+        for key in ('text', 'caption', 'data'):
+            if isinstance(data.get(key), str):
+                result[key] = self.text(data[key])
+        for key in ('contact', 'location', 'photo', 'document'):
+            result.pop(key, None)
+        return result
+
+
+class UpdateRecorder:
+    """Запись обновлений в фоновом потоке, чтобы не задерживать обработчики"""
+
+    def __init__(self, path: str = RECORD_FILE or 'recorded_updates.jsonl',
+                 anonymizer: UpdateAnonymizer = None, keep=()):
+        self.path = path
+        self.anonymizer = anonymizer or UpdateAnonymizer(keep=keep)
+        self._started = time.monotonic()
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._writer, name='update-recorder', daemon=True)
+        self._thread.start()
+
+    def record(self, update, context=None):
+        """Обработчик TypeHandler(Update, ...): ставит обновление в очередь записи"""
+        self._queue.put((time.monotonic() - self._started, update.to_dict()))
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _writer(self):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                offset, data = item
+                try:
+                    line = json.dumps({'t': round(offset, 3), 'update': self.anonymizer.update(data)},
+                                      ensure_ascii=False, default=str)
+                except Exception as e:
+                    logging.error("❌ Не удалось записать обновление: %s", e)
+                    continue
+                f.write(line + '\n')
+                if self._queue.empty():
+                    f.flush()
@@ -0,0 +1,264 @@
+from tkinter import ttk
+import tkinter.font as tkfont
+
+
+class VirtualTreeview:
+    """Виртуальная таблица: в Treeview живут только строки, видимые на экране.
+
+    Данные хранятся в обычном списке, а в виджете создается пул элементов
+    размером с видимую область. При прокрутке элементы пула переиспользуются,
+    а при изменении данных обновляются только те строки, которые изменились.
+    """
+
+    def __init__(self, parent, columns, row_formatter, key='id', height=15):
+        self.columns = columns
+        self.row_formatter = row_formatter
+        self.key = key
+
+        self.rows = []
+        self._positions = {}      # ключ строки -> позиция в self.rows
+        self.offset = 0           # индекс первой видимой строки
+        self.visible_count = height
+
+        self._items = []          # пул элементов Treeview
+        self._slot_values = []    # значения, отображаемые в каждом элементе пула
+        self._slot_keys = []      # ключи строк, отображаемых в элементах пула
+        self._attached = []       # прикреплен ли элемент пула к дереву
+        self._selected = set()    # ключи выделенных строк (в том числе невидимых)
+
+        self.tree = ttk.Treeview(parent, columns=columns, show='headings', height=height)
+        self.scrollbar = ttk.Scrollbar(parent, orient='vertical', command=self._on_scrollbar)
+
+        self._row_height = self._detect_row_height()
+        self._ensure_pool(height)
+
+        self.tree.bind('<MouseWheel>', self._on_mousewheel)
+        self.tree.bind('<Button-4>', lambda e: self._scroll_event(-3))
+        self.tree.bind('<Button-5>', lambda e: self._scroll_event(3))
+        self.tree.bind('<Up>', self._on_key_up)
+        self.tree.bind('<Down>', self._on_key_down)
+        self.tree.bind('<Prior>', lambda e: self._scroll_event(-self.visible_count))
+        self.tree.bind('<Next>', lambda e: self._scroll_event(self.visible_count))
+        self.tree.bind('<Configure>', self._on_configure)
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+
+        self._update_scrollbar()
+
+    # Делегирование методов виджета
+    def heading(self, *args, **kwargs):
+        return self.tree.heading(*args, **kwargs)
+
+    def column(self, *args, **kwargs):
+        return self.tree.column(*args, **kwargs)
+
+    def pack(self, *args, **kwargs):
+        return self.tree.pack(*args, **kwargs)
+
+    def grid(self, *args, **kwargs):
+        return self.tree.grid(*args, **kwargs)
+
+    # Работа с данными
+    def set_rows(self, rows):
+        """Полная замена данных таблицы"""
+        self.rows = list(rows)
+        self._rebuild_positions()
+        self._selected &= set(self._positions)
+        self._clamp_offset()
+        self._render()
+
+    def insert_row(self, row, index=None):
+        """Добавление одной строки (по умолчанию в конец)"""
+        if index is None or index >= len(self.rows):
+            index = len(self.rows)
+            self.rows.append(row)
+            self._positions[row[self.key]] = index
+        else:
+            self.rows.insert(index, row)
+            self._rebuild_positions(index)
+
+        if index < self.offset + self.visible_count:
+            self._render()
+        else:
+            self._update_scrollbar()
+
+    def append_rows(self, rows):
+        """Добавление строк в конец (следующая страница выборки)"""
+        start = len(self.rows)
+        self.rows.extend(rows)
+        self._rebuild_positions(start)
+        if start < self.offset + self.visible_count:
+            self._render()
+        else:
+            self._update_scrollbar()
+
+    def update_row(self, row):
+        """Обновление строки с тем же ключом"""
+        position = self._positions.get(row[self.key])
+        if position is None:
+            return
+        self.rows[position] = row
+        if self.offset <= position < self.offset + self.visible_count:
+            self._render()
+
+    def remove_keys(self, keys):
+        """Удаление строк по ключам"""
+        keys = set(keys)
+        positions = [self._positions[k] for k in keys if k in self._positions]
+        if not positions:
+            return
+
+        first = min(positions)
+        self.rows = [r for r in self.rows if r[self.key] not in keys]
+        self._selected -= keys
+        for k in keys:
+            self._positions.pop(k, None)
+        self._rebuild_positions(first)
+        self._clamp_offset()
+
+        if first < self.offset + self.visible_count:
+            self._render()
+        else:
+            self._update_scrollbar()
+
+    def selected_keys(self):
+        """Ключи выделенных строк в порядке их следования"""
+        return sorted(self._selected, key=self._positions.__getitem__)
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Прокрутка
+    def scroll(self, delta):
+        self.scroll_to(self.offset + delta)
+
+    def scroll_to(self, offset):
+        old_offset = self.offset
+        self.offset = offset
+        self._clamp_offset()
+        if self.offset != old_offset:
+            self._render()
+
+    def _scroll_event(self, delta):
+        self.scroll(delta)
+        return 'break'
+
+    def _on_mousewheel(self, event):
+        if event.delta == 0:
+            return 'break'
+        steps = -event.delta // 120 if abs(event.delta) >= 120 else (-1 if event.delta > 0 else 1)
+        return self._scroll_event(steps * 3)
+
+    def _on_scrollbar(self, *args):
+        if not args:
+            return
+        if args[0] == 'moveto':
+            self.scroll_to(int(float(args[1]) * len(self.rows)))
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            if args[2] == 'pages':
+                amount *= self.visible_count
+            self.scroll(amount)
+
+    def _on_key_up(self, event):
+        focus = self.tree.focus()
+        if focus and self._items and focus == self._items[0] and self.offset > 0:
+            self.scroll(-1)
+            self._move_keyboard_selection(self._items[0])
+            return 'break'
+
+    def _on_key_down(self, event):
+        focus = self.tree.focus()
+        last_slot = min(self.visible_count, len(self.rows) - self.offset) - 1
+        if (focus and last_slot >= 0 and focus == self._items[last_slot]
+                and self.offset + self.visible_count < len(self.rows)):
+            self.scroll(1)
+            self._move_keyboard_selection(self._items[last_slot])
+            return 'break'
+
+    def _move_keyboard_selection(self, item):
+        # Навигация стрелками выделяет одну строку, как в обычном Treeview
+        key = self._slot_keys[self._items.index(item)]
+        self._selected = {key} if key is not None else set()
+        self.tree.focus(item)
+        self.tree.selection_set(item)
+
+    def _on_configure(self, event):
+        count = max(1, event.height // self._row_height - 1)
+        if count != self.visible_count:
+            self._ensure_pool(count)
+            self.visible_count = count
+            self._clamp_offset()
+            self._render()
+
+    def _on_select(self, event=None):
+        # Синхронизируем выделение видимых элементов с множеством ключей
+        selection = set(self.tree.selection())
+        for item, key, attached in zip(self._items, self._slot_keys, self._attached):
+            if not attached or key is None:
+                continue
+            if item in selection:
+                self._selected.add(key)
+            else:
+                self._selected.discard(key)
+
+    # Внутренние методы
+    def _detect_row_height(self):
+        height = ttk.Style().lookup('Treeview', 'rowheight')
+        try:
+            return max(1, int(height))
+        except (TypeError, ValueError):
+            return tkfont.nametofont('TkDefaultFont').metrics('linespace') + 2
+
+    def _ensure_pool(self, count):
+        while len(self._items) < count:
+            item = self.tree.insert('', 'end', values=())
+            self.tree.detach(item)
+            self._items.append(item)
+            self._slot_values.append(None)
+            self._slot_keys.append(None)
+            self._attached.append(False)
+
+    def _rebuild_positions(self, start=0):
+        if start == 0:
+            self._positions = {}
+        for i in range(start, len(self.rows)):
+            self._positions[self.rows[i][self.key]] = i
+
+    def _clamp_offset(self):
+        max_offset = max(0, len(self.rows) - self.visible_count)
+        self.offset = max(0, min(self.offset, max_offset))
+
+    def _render(self):
+        """Обновление элементов пула, значения которых изменились"""
+        selection = []
+        for slot, item in enumerate(self._items):
+            position = self.offset + slot
+            if slot < self.visible_count and position < len(self.rows):
+                row = self.rows[position]
+                key = row[self.key]
+                values = tuple(self.row_formatter(row))
+                if values != self._slot_values[slot]:
+                    self.tree.item(item, values=values)
+                    self._slot_values[slot] = values
+                self._slot_keys[slot] = key
+                if not self._attached[slot]:
+                    self.tree.move(item, '', slot)
+                    self._attached[slot] = True
+                if key in self._selected:
+                    selection.append(item)
+            elif self._attached[slot]:
+                self.tree.detach(item)
+                self._attached[slot] = False
+                self._slot_keys[slot] = None
+
+        self.tree.selection_set(selection)
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        total = len(self.rows)
+        if total <= self.visible_count:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            first = self.offset / total
+            last = min(1.0, (self.offset + self.visible_count) / total)
+            self.scrollbar.set(first, last)